@@ -0,0 +1,152 @@
+import abc
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, used for cache keys."""
+    return " ".join(question.split()).casefold()
+
+
+def answer_cache_key(scope: str,
+                     question: str,
+                     document_filter: Optional[str],
+                     prompt_template: str,
+                     response_format: str,
+                     retrieval: Optional[dict] = None) -> str:
+    # `retrieval`: how the context was gathered (mode, top_k, token budget...), which changes the answer
+    payload = json.dumps(
+        [scope, normalize_question(question), document_filter, prompt_template, response_format, retrieval],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache(abc.ABC):
+    """
+    Interface of the answer caches used by `RAGBackEnd.query_rag`.
+
+    Entries are tagged with a scope (the user's index name) so that everything cached
+    for a collection can be dropped at once when its content changes.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, scope: str, answer: str):
+        ...
+
+    @abc.abstractmethod
+    def invalidate(self, scope: str):
+        ...
+
+    @abc.abstractmethod
+    def clear(self):
+        ...
+
+
+class InMemoryAnswerCache(AnswerCache):
+    """LRU cache with a per-entry time to live, shared safely between threads."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            _, answer, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return answer
+
+    def set(self, key: str, scope: str, answer: str):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (scope, answer, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scope: str):
+        with self._lock:
+            for key in [k for k, (s, _, _) in self._entries.items() if s == scope]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteAnswerCache(AnswerCache):
+    """On-disk LRU/TTL cache, so answers survive restarts and can be shared by worker processes."""
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 100_000, ttl_seconds: Optional[float] = 24 * 3600):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, scope TEXT NOT NULL, answer TEXT NOT NULL,"
+            " expires_at REAL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers(scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT answer, expires_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            answer, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            return answer
+
+    def set(self, key: str, scope: str, answer: str):
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, scope, answer, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, scope, answer, expires_at, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def invalidate(self, scope: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE scope = ?", (scope,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
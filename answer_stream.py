@@ -0,0 +1,143 @@
+import re
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional
+
+
+CITATION_MARKER = re.compile(r'\[doc\d+\]')
+# A "[doc12" that may still be completed into a marker by the next chunk
+PARTIAL_CITATION_MARKER = re.compile(r'\[(?:d(?:o(?:c\d*)?)?)?$')
+
+
+class CitationStripper:
+    """
+    Incremental version of `rag.clean_answer` for streamed completions.
+
+    Text is released as soon as it can no longer change: a possible partial `[docN]`
+    marker at the end of the buffer is held back, and so is trailing whitespace, since it
+    may still merge with more whitespace or end up in front of punctuation.
+    Concatenating everything returned by `feed` and `flush` gives `clean_answer(full_text)`.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def feed(self, delta: str) -> str:
+        pending = CITATION_MARKER.sub('', self._pending + delta)
+        cut = len(pending)
+        partial = PARTIAL_CITATION_MARKER.search(pending)
+        if partial:
+            cut = partial.start()
+        while cut > 0 and pending[cut - 1].isspace():
+            cut -= 1
+        ready, self._pending = pending[:cut], pending[cut:]
+        return self._tidy(ready)
+
+    def flush(self) -> str:
+        ready, self._pending = CITATION_MARKER.sub('', self._pending), ""
+        return self._tidy(ready).rstrip()
+
+    def _tidy(self, text: str) -> str:
+        text = re.sub(r'\s{2,}', ' ', text)
+        text = re.sub(r'\s+([,.;:!?])', r'\1', text)
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+def _chunk_delta(chunk):
+    if not getattr(chunk, "choices", None):
+        return None
+    return chunk.choices[0].delta
+
+
+class _AnswerStreamBase:
+    def __init__(self, on_complete: Optional[Callable[[str, List[dict]], None]] = None):
+        self.on_complete = on_complete
+        self.answer: Optional[str] = None
+        self.citations: List[dict] = []
+        self._stripper = CitationStripper()
+        self._parts: List[str] = []
+
+    def _process(self, chunk) -> str:
+        delta = _chunk_delta(chunk)
+        if delta is None:
+            return ""
+        # "On Your Data" sends its retrieval context (citations, intent) on the delta
+        context = getattr(delta, "context", None)
+        if context:
+            self.citations.extend(context.get("citations") or [])
+        text = self._stripper.feed(getattr(delta, "content", None) or "")
+        self._parts.append(text)
+        return text
+
+    def _finish(self) -> str:
+        text = self._stripper.flush()
+        self._parts.append(text)
+        self.answer = "".join(self._parts)
+        if self.on_complete is not None:
+            self.on_complete(self.answer, self.citations)
+        return text
+
+
+class AnswerStream(_AnswerStreamBase):
+    """
+    Iterates over the cleaned text deltas of a streamed completion.
+
+    Once the iteration is over, `answer` holds the full cleaned answer and `citations`
+    the retrieval context sent by the service.
+    """
+
+    def __init__(self, chunks: Optional[Iterable], on_complete: Optional[Callable[[str, List[dict]], None]] = None):
+        super().__init__(on_complete)
+        self._chunks = chunks
+
+    @classmethod
+    def from_text(cls, answer: str) -> "AnswerStream":
+        stream = cls(None)
+        stream._parts = [answer]
+        return stream
+
+    def __iter__(self) -> Iterator[str]:
+        if self._chunks is None:
+            # Pre-computed answer (cache hit)
+            self.answer = "".join(self._parts)
+            if self.answer:
+                yield self.answer
+            return
+        for chunk in self._chunks:
+            text = self._process(chunk)
+            if text:
+                yield text
+        text = self._finish()
+        if text:
+            yield text
+
+
+class AsyncAnswerStream(_AnswerStreamBase):
+    """Async counterpart of `AnswerStream`, fed by an `AsyncAzureOpenAI` stream."""
+
+    def __init__(self, chunks, on_complete: Optional[Callable[[str, List[dict]], None]] = None):
+        super().__init__(on_complete)
+        self._chunks = chunks
+
+    @classmethod
+    def from_text(cls, answer: str) -> "AsyncAnswerStream":
+        stream = cls(None)
+        stream._parts = [answer]
+        return stream
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self._chunks is None:
+            # Pre-computed answer (cache hit)
+            self.answer = "".join(self._parts)
+            if self.answer:
+                yield self.answer
+            return
+        async for chunk in self._chunks:
+            text = self._process(chunk)
+            if text:
+                yield text
+        text = self._finish()
+        if text:
+            yield text
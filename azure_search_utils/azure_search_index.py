@@ -12,16 +12,22 @@ from azure.search.documents.indexes.models import (
     SearchIndex
 )
 
+from azure_search_utils.vector_profiles import VectorProfile, get_vector_profile
+
 # Create a search index  
 def build_azure_search_index(index_name, 
                               openai_resource_url, 
                               cognitive_api_key,
-                              deployment_name):
+                              deployment_name,
+                              vector_profile: VectorProfile = None,
+                              owner_field: str = None):
    
+        vector_profile = vector_profile or get_vector_profile()
 
         fields = [
             SearchField(name="parent_id", type=SearchFieldDataType.String),
-            SearchField(name="title", type=SearchFieldDataType.String),
+            # Queries restricted to selected files filter on it (eq / search.in)
+            SearchField(name="title", type=SearchFieldDataType.String, filterable=True),
             SearchField(
                 name="locations",
                 type=SearchFieldDataType.Collection(SearchFieldDataType.String),
@@ -46,10 +52,16 @@ def build_azure_search_index(index_name,
             SearchField(
                 name="text_vector",
                 type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                vector_search_dimensions=1536,
-                vector_search_profile_name="myHnswProfile"
+                vector_search_dimensions=vector_profile.dimensions,
+                vector_search_profile_name="myHnswProfile",
+                # Left unset for the full profile so existing index definitions are unchanged
+                stored=None if vector_profile.store_original_vectors else False,
+                hidden=None if vector_profile.store_original_vectors else True
             )
         ]
+        if owner_field:
+            # Shared (multi-tenant) index: every query filters on the owner of the chunks
+            fields.append(SearchField(name=owner_field, type=SearchFieldDataType.String, filterable=True))
 
         vector_search = VectorSearch(
             algorithms=[
@@ -59,9 +71,11 @@ def build_azure_search_index(index_name,
                 VectorSearchProfile(
                     name="myHnswProfile",
                     algorithm_configuration_name="myHnsw",
-                    vectorizer_name="myOpenAI"
+                    vectorizer_name="myOpenAI",
+                    compression_name=vector_profile.compression_name
                 )
             ],
+            compressions=vector_profile.build_compressions() or None,
             vectorizers=[
                 AzureOpenAIVectorizer(
                     vectorizer_name="myOpenAI",
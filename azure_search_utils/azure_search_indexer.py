@@ -5,11 +5,29 @@ from azure.search.documents.indexes.models import (
     IndexingParametersConfiguration
 )
 
+def choose_batch_size(document_count: int, average_document_bytes: float) -> int:
+    """
+    Indexer batch size for a shard: small documents are cheap to crack and embed, so they
+    are batched more aggressively; large PDFs stay in small batches to keep each one well
+    under the indexer's execution time limits.
+    """
+    if document_count <= 0:
+        return 1
+    if average_document_bytes < 1024 * 1024:
+        batch_size = 10
+    elif average_document_bytes < 8 * 1024 * 1024:
+        batch_size = 5
+    else:
+        batch_size = 2
+    return max(1, min(batch_size, document_count))
+
+
 def build_indexer(
     indexer_name: str,
     skillset_name: str,
     index_name: str,
     data_source_name: str,
+    batch_size: int = 1,
 ):
     indexer = SearchIndexer(
         name=indexer_name,
@@ -24,7 +42,7 @@ def build_indexer(
             )
         ],
         parameters=IndexingParameters(
-            batch_size=1,
+            batch_size=batch_size,
             max_failed_items=None,
             max_failed_items_per_batch=None,
             configuration=IndexingParametersConfiguration(
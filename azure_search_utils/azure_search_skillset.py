@@ -1,4 +1,5 @@
 
+from typing import Optional
 
 from azure.search.documents.indexes.models import (
     SplitSkill,
@@ -19,7 +20,8 @@ def build_skillset(
     openai_resource_url: str,
     cognitive_api_key: str,
     deployment_name: str = "text-embedding-ada-002",
-    embedding_dimensions: int = 1536
+    embedding_dimensions: Optional[int] = None,
+    owner_field: str = None
 ):
     # Define skills
     split_skill = SplitSkill(
@@ -45,6 +47,16 @@ def build_skillset(
         outputs=[OutputFieldMappingEntry(name="embedding", target_name="text_vector")]
     )
 
+    mappings = [
+        InputFieldMappingEntry(name="chunk", source="/document/pages/*"),
+        InputFieldMappingEntry(name="text_vector", source="/document/pages/*/text_vector"),
+        InputFieldMappingEntry(name="locations", source="/document/pages/*/locations"),
+        InputFieldMappingEntry(name="title", source="/document/metadata_storage_name"),
+    ]
+    if owner_field:
+        # Custom blob metadata is exposed on the document under its own name
+        mappings.append(InputFieldMappingEntry(name=owner_field, source=f"/document/{owner_field}"))
+
     # Define projection
     index_projections = SearchIndexerIndexProjection(
         selectors=[
@@ -52,12 +64,7 @@ def build_skillset(
                 target_index_name=index_name,
                 parent_key_field_name="parent_id",
                 source_context="/document/pages/*",
-                mappings=[
-                    InputFieldMappingEntry(name="chunk", source="/document/pages/*"),
-                    InputFieldMappingEntry(name="text_vector", source="/document/pages/*/text_vector"),
-                    InputFieldMappingEntry(name="locations", source="/document/pages/*/locations"),
-                    InputFieldMappingEntry(name="title", source="/document/metadata_storage_name"),
-                ]
+                mappings=mappings
             )
         ],
         parameters=SearchIndexerIndexProjectionsParameters(
@@ -6,10 +6,11 @@ from azure.search.documents.indexes.models import (
 def data_source_connection(
     data_source_name: str,
     container_name: str,
-    storage_connection_string: str
+    storage_connection_string: str,
+    query: str = None
 ):
-    
-    container = SearchIndexerDataContainer(name=container_name)
+    # `query` restricts the data source to a virtual folder (blob name prefix) of the container
+    container = SearchIndexerDataContainer(name=container_name, query=query)
     data_source_connection = SearchIndexerDataSourceConnection(
         name=data_source_name,
         type="azureblob",
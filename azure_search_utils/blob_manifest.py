@@ -0,0 +1,126 @@
+
+# Content fingerprints of the blobs in a user's container, cached locally per user
+
+import hashlib
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Dict, Optional
+
+from loguru import logger
+
+from azure_search_utils.local_state import JsonStateFile, user_state_dir
+
+if TYPE_CHECKING:
+    from azure.storage.blob import ContainerClient
+
+
+CONTENT_HASH_METADATA_KEY = "content_sha256"
+HASH_READ_SIZE = 1024 * 1024
+
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+DUPLICATE = "duplicate"
+
+
+def file_sha256(file: BinaryIO) -> str:
+    """SHA-256 of a binary file object; the read position is restored afterwards."""
+    position = file.tell()
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(HASH_READ_SIZE), b""):
+        digest.update(block)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+class BlobManifest:
+    """
+    Maps blob names to the SHA-256 of their content.
+
+    The manifest lives in a local JSON file per user. When that file is missing it is
+    rebuilt in bulk from the `content_sha256` metadata of the blobs in the container
+    (one listing call), so classifying a batch of uploads needs no per-file round trips.
+    """
+
+    def __init__(self, user_name: str, prefix: str = ""):
+        self.user_name = user_name
+        # Only blobs under this virtual folder belong to the user (shared containers)
+        self.prefix = prefix
+        self.state_file = JsonStateFile(user_state_dir(user_name) / "blob_manifest.json")
+        self.lock = threading.RLock()
+        # One lock per blob name, held from `classify` to `record` by each upload of that name
+        self._blob_locks: Dict[str, threading.Lock] = {}
+        self._blobs: Optional[Dict[str, str]] = None
+        self._names_by_hash: Dict[str, str] = {}
+
+    def load(self, container: "ContainerClient") -> Dict[str, str]:
+        with self.lock:
+            if self._blobs is None:
+                if self.state_file.exists():
+                    self._set_blobs(self.state_file.load().get("blobs", {}))
+                else:
+                    self.refresh(container)
+            return self._blobs
+
+    def refresh(self, container: "ContainerClient"):
+        """Rebuild the manifest from the blob metadata stored in the container."""
+        blobs = {}
+        for blob in container.list_blobs(name_starts_with=self.prefix or None, include=["metadata"]):
+            content_hash = (blob.metadata or {}).get(CONTENT_HASH_METADATA_KEY)
+            if content_hash:
+                blobs[blob.name] = content_hash
+        with self.lock:
+            self._set_blobs(blobs)
+            self.save()
+        logger.info(f"Rebuilt blob manifest for '{self.user_name}' ({len(blobs)} fingerprinted blobs).")
+
+    def classify(self, container: "ContainerClient", blob_name: str, content_hash: str) -> str:
+        blobs = self.load(container)
+        with self.lock:
+            known_hash = blobs.get(blob_name)
+            if known_hash == content_hash:
+                return UNCHANGED
+            if known_hash is not None:
+                return CHANGED
+            if content_hash in self._names_by_hash:
+                return DUPLICATE
+            return NEW
+
+    def blob_lock(self, blob_name: str) -> threading.Lock:
+        """
+        Lock serializing the uploads of one blob name, so two uploads of the same file never
+        both classify it against the old fingerprint. A plain Lock, so an async upload can
+        acquire it in a worker thread and release it from the event loop.
+        """
+        with self.lock:
+            return self._blob_locks.setdefault(blob_name, threading.Lock())
+
+    def name_for_hash(self, content_hash: str) -> Optional[str]:
+        with self.lock:
+            return self._names_by_hash.get(content_hash)
+
+    def record(self, blob_name: str, content_hash: str):
+        with self.lock:
+            if self._blobs is None:
+                self._set_blobs(self.state_file.load().get("blobs", {}))
+            previous = self._blobs.get(blob_name)
+            if previous and self._names_by_hash.get(previous) == blob_name:
+                del self._names_by_hash[previous]
+            self._blobs[blob_name] = content_hash
+            self._names_by_hash.setdefault(content_hash, blob_name)
+            self.save()
+
+    def save(self):
+        with self.lock:
+            self.state_file.save({"version": 1, "blobs": self._blobs or {}})
+
+    def clear(self):
+        """Forget every fingerprint, e.g. after the container was (re)created or deleted."""
+        with self.lock:
+            self._set_blobs({})
+            self.state_file.delete()
+
+    def _set_blobs(self, blobs: Dict[str, str]):
+        self._blobs = dict(blobs)
+        self._names_by_hash = {}
+        for name, content_hash in sorted(self._blobs.items()):
+            self._names_by_hash.setdefault(content_hash, name)
@@ -0,0 +1,290 @@
+# Block uploads of large blobs: fixed-size blocks staged in parallel, then committed in one call
+
+import asyncio
+import hashlib
+import inspect
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, BinaryIO, List, Optional, Set, Union
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
+from loguru import logger
+
+
+MiB = 1024 * 1024
+# Size of the staged blocks; payloads up to one block are sent in a single put
+UPLOAD_BLOCK_SIZE = int(float(os.environ.get("RAG_UPLOAD_BLOCK_SIZE_MB", "8")) * MiB)
+# Blocks staged at once per blob
+UPLOAD_CONCURRENCY = int(os.environ.get("RAG_UPLOAD_CONCURRENCY", "4"))
+
+Uploadable = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+@dataclass
+class UploadSettings:
+    block_size: int = UPLOAD_BLOCK_SIZE
+    # Also bounds the memory of stream uploads to about (max_concurrency + 1) blocks
+    max_concurrency: int = UPLOAD_CONCURRENCY
+    # Read local files through a read-only memory map instead of copying them block by block
+    use_mmap: bool = True
+
+
+@dataclass
+class StagedUpload:
+    """Fingerprint of an upload and the ids of its blocks, in order."""
+    content_hash: str
+    size: int
+    block_ids: List[str] = field(default_factory=list)
+    # Blocks found already staged by an interrupted upload of the same content
+    resumed_blocks: int = 0
+    # Set instead of `block_ids` when the whole payload fits in a single put
+    data: Optional[bytes] = None
+
+
+def block_id(index: int, block) -> str:
+    """
+    Deterministic id: the same bytes at the same position get the same id, which makes
+    resuming possible. All ids have the same length, as the service requires (the SDK
+    base64-encodes them).
+    """
+    return f"{index:06d}-{hashlib.sha256(block).hexdigest()[:32]}"
+
+
+def _mmap_file(file: BinaryIO) -> Optional[mmap.mmap]:
+    try:
+        fileno = file.fileno()
+        if os.fstat(fileno).st_size == 0:
+            return None
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # In-memory or spooled files have no descriptor to map
+        return None
+
+
+class UploadSource:
+    """
+    Bytes to upload, from the current position of a file or from a buffer, read block by
+    block. Buffers and memory-mapped files are sliced without copying; other file objects
+    are read under a lock so blocks can be staged from several threads.
+    """
+
+    def __init__(self, data: Uploadable, use_mmap: bool = True):
+        self._mmap: Optional[mmap.mmap] = None
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._view: Optional[memoryview] = memoryview(data)
+            return
+        self._start = data.tell()
+        self._mmap = _mmap_file(data) if use_mmap else None
+        if self._mmap is not None:
+            self._view = memoryview(self._mmap)[self._start:]
+        else:
+            self._view = None
+            self._file = data
+            self._size = data.seek(0, os.SEEK_END) - self._start
+            data.seek(self._start)
+
+    def __enter__(self) -> "UploadSource":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            # Leave the caller's file where it found it
+            self._file.seek(self._start)
+
+    @property
+    def size(self) -> int:
+        return len(self._view) if self._view is not None else self._size
+
+    def block_count(self, block_size: int) -> int:
+        return max(1, -(-self.size // block_size))
+
+    def block(self, index: int, block_size: int):
+        offset = index * block_size
+        if self._view is not None:
+            return self._view[offset:offset + block_size]
+        with self._lock:
+            self._file.seek(self._start + offset)
+            return self._file.read(block_size)
+
+    def read_all(self) -> bytes:
+        return bytes(self.block(0, self.size)) if self.size else b""
+
+    def fingerprint(self, block_size: int) -> StagedUpload:
+        """SHA-256 of the whole content and the id of every block, in a single pass."""
+        digest = hashlib.sha256()
+        ids = []
+        for index in range(self.block_count(block_size)):
+            block = self.block(index, block_size)
+            digest.update(block)
+            ids.append(block_id(index, block))
+        return StagedUpload(digest.hexdigest(), self.size, ids)
+
+
+def _call(throttle, fn, *args, **kwargs):
+    # `throttle`: anything with the `call` / `acall` of `throttling.ServiceThrottle`, or None
+    return throttle.call(fn, *args, **kwargs) if throttle is not None else fn(*args, **kwargs)
+
+
+async def _acall(throttle, fn, *args, **kwargs):
+    return await (throttle.acall(fn, *args, **kwargs) if throttle is not None else fn(*args, **kwargs))
+
+
+def _commit_options(overwrite: bool) -> dict:
+    # Without overwrite the commit fails with ResourceExistsError, like `upload_blob(overwrite=False)`
+    return {} if overwrite else {"etag": "*", "match_condition": MatchConditions.IfMissing}
+
+
+def _block_list(block_ids: List[str]):
+    from azure.storage.blob import BlobBlock
+    return [BlobBlock(block_id=bid) for bid in block_ids]
+
+
+def _uncommitted_ids(block_lists) -> Set[str]:
+    _, uncommitted = block_lists
+    return {block.id for block in uncommitted or []}
+
+
+def staged_block_ids(blob_client, throttle=None) -> Set[str]:
+    """Ids of the uncommitted blocks left on the blob (by an interrupted upload)."""
+    try:
+        return _uncommitted_ids(_call(throttle, blob_client.get_block_list, "uncommitted"))
+    except ResourceNotFoundError:
+        return set()
+
+
+def upload_blocks(blob_client, source: UploadSource, staged: StagedUpload, metadata: dict,
+                  overwrite: bool, settings: UploadSettings, throttle=None) -> StagedUpload:
+    """Stage the blocks of `source` still missing on the blob, `max_concurrency` at a time, then commit them."""
+    present = staged_block_ids(blob_client, throttle)
+    pending = [i for i, bid in enumerate(staged.block_ids) if bid not in present]
+    staged.resumed_blocks = len(staged.block_ids) - len(pending)
+    if staged.resumed_blocks:
+        logger.info(f"Resuming upload of '{blob_client.blob_name}': {staged.resumed_blocks}/"
+                    f"{len(staged.block_ids)} blocks already staged.")
+
+    def stage(index: int):
+        # One block copied per worker: the transport takes bytes, not views of the memory map
+        _call(throttle, blob_client.stage_block, staged.block_ids[index], bytes(source.block(index, settings.block_size)))
+
+    workers = max(1, min(settings.max_concurrency, len(pending)))
+    if workers == 1:
+        for index in pending:
+            stage(index)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(stage, pending))
+    _call(throttle, blob_client.commit_block_list, _block_list(staged.block_ids), metadata=metadata,
+          **_commit_options(overwrite))
+    return staged
+
+
+def is_async_stream(data) -> bool:
+    return inspect.iscoroutinefunction(getattr(data, "read", None)) or hasattr(data, "__aiter__")
+
+
+async def _aread_blocks(stream, block_size: int) -> AsyncIterator[bytes]:
+    """Re-chunk an async stream (an object with an async `read(n)`, or an async iterable of bytes) into blocks."""
+    if inspect.iscoroutinefunction(getattr(stream, "read", None)):
+        while True:
+            block = await stream.read(block_size)
+            # read(n) may return less than n before the end of the stream
+            while block and len(block) < block_size:
+                more = await stream.read(block_size - len(block))
+                if not more:
+                    break
+                block += more
+            if not block:
+                return
+            yield bytes(block)
+            if len(block) < block_size:
+                return
+    else:
+        buffer = bytearray()
+        async for chunk in stream:
+            buffer += chunk
+            while len(buffer) >= block_size:
+                yield bytes(buffer[:block_size])
+                del buffer[:block_size]
+        if buffer:
+            yield bytes(buffer)
+
+
+async def astage_stream(blob_client, stream, settings: UploadSettings, throttle=None) -> StagedUpload:
+    """
+    Stage an async stream block by block while hashing it, holding at most about
+    `max_concurrency + 1` blocks in memory. Nothing is committed: the caller decides from
+    the content hash. A stream of a single block is returned in `data` instead of staged.
+    """
+    blocks = _aread_blocks(stream, settings.block_size)
+    head = []
+    async for block in blocks:
+        head.append(block)
+        if len(head) == 2:
+            break
+    if len(head) < 2:
+        data = head[0] if head else b""
+        return StagedUpload(hashlib.sha256(data).hexdigest(), len(data), data=data)
+
+    try:
+        present = _uncommitted_ids(await _acall(throttle, blob_client.get_block_list, "uncommitted"))
+    except ResourceNotFoundError:
+        present = set()
+    digest = hashlib.sha256()
+    staged = StagedUpload("", 0)
+    slots = asyncio.Semaphore(max(1, settings.max_concurrency))
+    tasks = []
+
+    async def stage(bid: str, block: bytes):
+        try:
+            await _acall(throttle, blob_client.stage_block, bid, block)
+        finally:
+            slots.release()
+
+    async def add(block: bytes):
+        index = len(staged.block_ids)
+        bid = block_id(index, block)
+        digest.update(block)
+        staged.block_ids.append(bid)
+        staged.size += len(block)
+        if bid in present:
+            staged.resumed_blocks += 1
+            return
+        await slots.acquire()
+        tasks.append(asyncio.ensure_future(stage(bid, block)))
+
+    try:
+        for block in head:
+            await add(block)
+        async for block in blocks:
+            await add(block)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    staged.content_hash = digest.hexdigest()
+    if staged.resumed_blocks:
+        logger.info(f"Resumed upload of '{blob_client.blob_name}': {staged.resumed_blocks}/"
+                    f"{len(staged.block_ids)} blocks were already staged.")
+    return staged
+
+
+async def acommit_blocks(blob_client, staged: StagedUpload, metadata: dict, overwrite: bool, throttle=None):
+    await _acall(throttle, blob_client.commit_block_list, _block_list(staged.block_ids), metadata=metadata,
+                 **_commit_options(overwrite))
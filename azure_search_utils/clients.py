@@ -0,0 +1,212 @@
+
+# Process-wide registry of Azure SDK clients, so every user session shares the same
+# HTTP transports and connection pools instead of building its own.
+
+import asyncio
+import atexit
+import hashlib
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.search.documents import SearchClient
+from azure.search.documents.indexes import SearchIndexClient, SearchIndexerClient
+from loguru import logger
+
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobServiceClient
+
+
+# Maximum number of pooled connections kept per endpoint
+HTTP_POOL_SIZE = int(os.environ.get("RAG_HTTP_POOL_SIZE", "32"))
+# Same switch as `throttling.THROTTLING` (read here to keep this package free of the root modules). Every
+# call of the index and indexer clients goes through a `ThrottledClient`, which retries: their SDK pipelines
+# must not, or a 429 is retried inside the call it sees. Blob and document clients keep the SDK retries,
+# most of their calls (queries, document pushes, listings, deletions) are not throttled
+THROTTLING = os.environ.get("RAG_THROTTLING", "1").lower() not in ("0", "false", "off", "no")
+
+
+def _secret_id(secret: str) -> str:
+    # Registry keys must tell credentials apart without keeping the secret itself around
+    return hashlib.sha256(str(secret).encode("utf-8")).hexdigest()[:16]
+
+
+def _credential_id(credential: AzureKeyCredential) -> str:
+    return _secret_id(getattr(credential, "key", credential))
+
+
+class ClientRegistry:
+    """
+    Caches one client per (kind, endpoint, credential) and one HTTP transport per
+    (endpoint, credential), shared by all sync clients talking to that endpoint.
+
+    Async clients are bound to the event loop they were created on, so they are cached
+    per running loop and must be closed from it with `aclose()`. The cache holds the loops
+    weakly and drops the clients of closed loops, so a new loop reusing the id of an old
+    one never gets its clients.
+
+    With `throttling`, the index and indexer clients are built without SDK retries
+    (`retry_total=0`); callers must route them through `throttling.ThrottledClient`.
+    """
+
+    def __init__(self, throttling: bool = THROTTLING):
+        self._sdk_options = {"retry_total": 0} if throttling else {}
+        self._lock = threading.Lock()
+        self._transports: Dict[Tuple, RequestsTransport] = {}
+        self._clients: Dict[Tuple, object] = {}
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, object]]" = \
+            weakref.WeakKeyDictionary()
+
+    def _transport(self, endpoint_key: Tuple) -> RequestsTransport:
+        transport = self._transports.get(endpoint_key)
+        if transport is None:
+            session = requests.Session()
+            # Same no-retry policy as the SDK's own adapter: retries happen in the pipeline
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            transport = RequestsTransport(session=session, session_owner=False)
+            self._transports[endpoint_key] = transport
+        return transport
+
+    def _get(self, key: Tuple, endpoint_key: Tuple, factory):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory(self._transport(endpoint_key))
+                self._clients[key] = client
+            return client
+
+    def blob_service_client(self, connection_string: str) -> "BlobServiceClient":
+        # The storage SDK is a large import, only paid for by processes that touch blobs
+        from azure.storage.blob import BlobServiceClient
+        endpoint_key = ("blob", _secret_id(connection_string))
+        return self._get(
+            endpoint_key, endpoint_key,
+            lambda transport: BlobServiceClient.from_connection_string(str(connection_string), transport=transport),
+        )
+
+    def search_index_client(self, endpoint: str, credential: AzureKeyCredential) -> SearchIndexClient:
+        endpoint_key = ("search", endpoint, _credential_id(credential))
+        return self._get(
+            ("search_index",) + endpoint_key[1:], endpoint_key,
+            lambda transport: SearchIndexClient(endpoint=endpoint, credential=credential, transport=transport,
+                                                **self._sdk_options),
+        )
+
+    def search_indexer_client(self, endpoint: str, credential: AzureKeyCredential) -> SearchIndexerClient:
+        endpoint_key = ("search", endpoint, _credential_id(credential))
+        return self._get(
+            ("search_indexer",) + endpoint_key[1:], endpoint_key,
+            lambda transport: SearchIndexerClient(endpoint=endpoint, credential=credential, transport=transport,
+                                                  **self._sdk_options),
+        )
+
+    def search_client(self, endpoint: str, index_name: str, credential: AzureKeyCredential) -> SearchClient:
+        endpoint_key = ("search", endpoint, _credential_id(credential))
+        return self._get(
+            ("search_docs", index_name) + endpoint_key[1:], endpoint_key,
+            lambda transport: SearchClient(endpoint=endpoint, index_name=index_name,
+                                           credential=credential, transport=transport),
+        )
+
+    def _get_async(self, key: Tuple, factory):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Closed loops may still be referenced (e.g. by their own clients): their clients are unusable
+            for closed in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[closed]
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = factory()
+            return client
+
+    def async_blob_service_client(self, connection_string: str):
+        from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+        return self._get_async(
+            ("blob", _secret_id(connection_string)),
+            lambda: AsyncBlobServiceClient.from_connection_string(str(connection_string)),
+        )
+
+    def async_search_index_client(self, endpoint: str, credential: AzureKeyCredential):
+        from azure.search.documents.indexes.aio import SearchIndexClient as AsyncSearchIndexClient
+        return self._get_async(
+            ("search_index", endpoint, _credential_id(credential)),
+            lambda: AsyncSearchIndexClient(endpoint=endpoint, credential=credential, **self._sdk_options),
+        )
+
+    def async_search_indexer_client(self, endpoint: str, credential: AzureKeyCredential):
+        from azure.search.documents.indexes.aio import SearchIndexerClient as AsyncSearchIndexerClient
+        return self._get_async(
+            ("search_indexer", endpoint, _credential_id(credential)),
+            lambda: AsyncSearchIndexerClient(endpoint=endpoint, credential=credential, **self._sdk_options),
+        )
+
+    def async_search_client(self, endpoint: str, index_name: str, credential: AzureKeyCredential):
+        from azure.search.documents.aio import SearchClient as AsyncSearchClient
+        return self._get_async(
+            ("search_docs", index_name, endpoint, _credential_id(credential)),
+            lambda: AsyncSearchClient(endpoint=endpoint, index_name=index_name, credential=credential),
+        )
+
+    def close(self):
+        """Close every sync client and the shared connection pools."""
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+            transports, self._transports = list(self._transports.values()), {}
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Error while closing {type(client).__name__}: {e}")
+        for transport in transports:
+            transport.session.close()
+
+    async def aclose(self):
+        """Close the async clients created on the current event loop."""
+        with self._lock:
+            clients = list(self._async_clients.pop(asyncio.get_running_loop(), {}).values())
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Error while closing {type(client).__name__}: {e}")
+
+
+registry = ClientRegistry()
+atexit.register(registry.close)
+
+
+def get_blob_service_client(connection_string: str) -> "BlobServiceClient":
+    return registry.blob_service_client(connection_string)
+
+
+def get_search_index_client(endpoint: str, credential: AzureKeyCredential) -> SearchIndexClient:
+    return registry.search_index_client(endpoint, credential)
+
+
+def get_search_indexer_client(endpoint: str, credential: AzureKeyCredential) -> SearchIndexerClient:
+    return registry.search_indexer_client(endpoint, credential)
+
+
+def get_search_client(endpoint: str, index_name: str, credential: AzureKeyCredential) -> SearchClient:
+    return registry.search_client(endpoint, index_name, credential)
+
+
+def close_clients():
+    registry.close()
+
+
+async def aclose_clients():
+    await registry.aclose()
@@ -0,0 +1,134 @@
+
+# Aggregated view of the status of one or several indexers writing to the same index
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+
+# Tolerated difference between the local clock (which stamps `since`) and the service's run times
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+@dataclass
+class IndexerProgress:
+    """Last execution of one indexer, as reported by `get_indexer_status`."""
+    indexer_name: str
+    status: str
+    item_count: int = 0
+    failed_item_count: int = 0
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    error_message: Optional[str] = None
+    # document key -> error message, for the documents that failed in the last run
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_status(cls, indexer_name: str, indexer_status) -> "IndexerProgress":
+        last = indexer_status.last_result
+        if last is None:
+            # Created but never run yet
+            return cls(indexer_name, status="notStarted")
+        return cls(
+            indexer_name=indexer_name,
+            status=last.status,
+            item_count=last.item_count or 0,
+            failed_item_count=last.failed_item_count or 0,
+            start_time=last.start_time,
+            end_time=last.end_time,
+            error_message=last.error_message,
+            errors={(e.key or e.name or "?"): e.error_message for e in (last.errors or [])},
+        )
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("inProgress", "notStarted")
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == "success"
+
+    def finished_since(self, since: Optional[datetime]) -> bool:
+        """
+        True once a run that started after `since` has finished (any finished run when `since`
+        is None). A run already in progress at `since` does not count, even if it ends later:
+        it may have listed the blobs before the new ones landed. Start times are compared with
+        `CLOCK_SKEW` of tolerance, since `since` comes from the local clock.
+        """
+        if self.running:
+            return False
+        return since is None or (self.start_time is not None and self.start_time >= since - CLOCK_SKEW)
+
+
+@dataclass
+class AggregateIndexerProgress:
+    shards: List[IndexerProgress]
+
+    @property
+    def done(self) -> bool:
+        return not any(shard.running for shard in self.shards)
+
+    def finished_since(self, since: Optional[datetime]) -> bool:
+        return all(shard.finished_since(since) for shard in self.shards)
+
+    @property
+    def item_count(self) -> int:
+        return sum(shard.item_count for shard in self.shards)
+
+    @property
+    def failed_item_count(self) -> int:
+        return sum(shard.failed_item_count for shard in self.shards)
+
+    @property
+    def succeeded_item_count(self) -> int:
+        return self.item_count - self.failed_item_count
+
+    @property
+    def errors(self) -> Dict[str, str]:
+        """Document key -> error message of every document that failed, across all shards."""
+        return {key: message for shard in self.shards for key, message in shard.errors.items()}
+
+    @property
+    def elapsed_seconds(self) -> float:
+        starts = [s.start_time for s in self.shards if s.start_time]
+        if not starts:
+            return 0.0
+        ends = [s.end_time for s in self.shards if s.end_time]
+        end = max(ends) if self.done and ends else datetime.now(timezone.utc)
+        return max(0.0, (end - min(starts)).total_seconds())
+
+    @property
+    def documents_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.item_count / elapsed if elapsed else 0.0
+
+    def summary(self) -> str:
+        running = sum(1 for shard in self.shards if shard.running)
+        return (
+            f"{len(self.shards) - running}/{len(self.shards)} indexers finished, "
+            f"{self.item_count} documents processed ({self.failed_item_count} failed) "
+            f"in {self.elapsed_seconds:.0f}s ({self.documents_per_second:.2f} docs/s)"
+        )
+
+
+class PollBackoff:
+    """
+    Delays between status polls: short while the indexer is making progress (the item
+    count moves), growing geometrically up to `max_interval` while nothing changes.
+    """
+
+    def __init__(self, interval: float = 1.0, max_interval: float = 15.0, factor: float = 1.6):
+        self.initial = interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = interval
+        self._last_count: Optional[int] = None
+
+    def next(self, progress: AggregateIndexerProgress) -> float:
+        count = progress.item_count
+        if self._last_count is None or count != self._last_count:
+            self.interval = self.initial
+        else:
+            self.interval = min(self.max_interval, self.interval * self.factor)
+        self._last_count = count
+        return self.interval
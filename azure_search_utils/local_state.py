@@ -0,0 +1,47 @@
+
+# Small helpers to keep per-user state (manifests, fingerprints, ...) on local disk
+
+import json
+import os
+import threading
+from pathlib import Path
+
+
+STATE_DIR = Path(os.environ.get("RAG_STATE_DIR", Path.home() / ".rag_azure_search"))
+
+
+def user_state_dir(user_name: str) -> Path:
+    path = STATE_DIR / user_name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class JsonStateFile:
+    """A JSON document on disk that is written atomically and safe to share between threads."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock = threading.RLock()
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def load(self) -> dict:
+        with self.lock:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return {}
+
+    def save(self, data: dict):
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def delete(self):
+        with self.lock:
+            self.path.unlink(missing_ok=True)
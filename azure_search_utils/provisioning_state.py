@@ -0,0 +1,45 @@
+
+# Fingerprints of the search definitions last pushed for a user, so unchanged ones are not re-sent
+
+import hashlib
+import json
+
+from azure_search_utils.local_state import JsonStateFile, user_state_dir
+
+
+INDEX = "index"
+DATA_SOURCE = "data_source"
+SKILLSET = "skillset"
+INDEXER = "indexer"
+
+
+def definition_fingerprint(definition) -> str:
+    """Stable SHA-256 of an SDK definition (index, skillset, data source or indexer)."""
+    payload = json.dumps(definition.serialize(), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ProvisioningState:
+    """Locally cached fingerprint of each definition successfully deployed for a user."""
+
+    def __init__(self, user_name: str):
+        self.state_file = JsonStateFile(user_state_dir(user_name) / "provisioning.json")
+
+    def is_current(self, kind: str, definition) -> bool:
+        deployed = self.state_file.load().get(kind)
+        return deployed is not None and deployed == definition_fingerprint(definition)
+
+    def mark_deployed(self, kind: str, definition):
+        with self.state_file.lock:
+            state = self.state_file.load()
+            state[kind] = definition_fingerprint(definition)
+            self.state_file.save(state)
+
+    def forget(self, kind: str):
+        with self.state_file.lock:
+            state = self.state_file.load()
+            if state.pop(kind, None) is not None:
+                self.state_file.save(state)
+
+    def clear(self):
+        self.state_file.delete()
@@ -0,0 +1,245 @@
+# Finds and deletes per-user search resources and containers left behind by sessions that never logged out
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from loguru import logger
+
+
+INDEX = "index"
+INDEXER = "indexer"
+SKILLSET = "skillset"
+DATA_SOURCE = "data_source"
+CONTAINER = "container"
+
+# Naming scheme of `UserDocumentCollection`: "<user>_index", "<user>-ds[-NN]", "<user>-ss", "<user>-indexer[-NN]"
+RESOURCE_PATTERNS = {
+    INDEX: re.compile(r"^(?P<user>.+)_index$"),
+    INDEXER: re.compile(r"^(?P<user>.+)-indexer(?:-\d{2})?$"),
+    SKILLSET: re.compile(r"^(?P<user>.+)-ss$"),
+    DATA_SOURCE: re.compile(r"^(?P<user>.+)-ds(?:-\d{2})?$"),
+}
+
+# Deletion stages: indexers reference the other search resources, so they go first
+DELETION_STAGES = ((INDEXER, CONTAINER), (SKILLSET, DATA_SOURCE, INDEX))
+
+ORPHANED = "orphaned"
+STALE = "stale"
+
+
+class RateLimiter:
+    """Spaces calls at least `1 / rate` seconds apart, across all threads sharing it."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass
+class UserResources:
+    """Search resources and container found for one user name."""
+    user: str
+    names: Dict[str, List[str]] = field(default_factory=dict)
+    # Latest sign of life: container modification, end of the last indexer run
+    last_activity: Optional[datetime] = None
+    reason: Optional[str] = None
+
+    def add(self, kind: str, name: str):
+        self.names.setdefault(kind, []).append(name)
+
+    def has(self, kind: str) -> bool:
+        return bool(self.names.get(kind))
+
+    def touch(self, moment: Optional[datetime]):
+        if moment is not None and (self.last_activity is None or moment > self.last_activity):
+            self.last_activity = moment
+
+    def describe(self) -> str:
+        parts = [f"{kind}: {', '.join(sorted(names))}" for kind, names in sorted(self.names.items())]
+        return f"'{self.user}' ({self.reason}) - " + "; ".join(parts)
+
+
+@dataclass
+class SweepReport:
+    candidates: List[UserResources] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    dry_run: bool = True
+    elapsed_seconds: float = 0.0
+
+    def summary(self) -> str:
+        resources = sum(len(names) for c in self.candidates for names in c.names.values())
+        if self.dry_run:
+            return f"dry run: {len(self.candidates)} users, {resources} resources would be deleted"
+        return (f"{len(self.deleted)}/{resources} resources of {len(self.candidates)} users deleted, "
+                f"{len(self.failed)} failed in {self.elapsed_seconds:.1f}s")
+
+
+class ResourceSweeper:
+    """
+    Groups the indexes, indexers, skillsets, data sources and containers of a search service
+    and storage account by user (per the naming scheme of `UserDocumentCollection`) and
+    selects the groups to delete:
+
+    - orphaned: an indexer, skillset, data source or container whose index is gone
+      (a teardown that stopped half-way, or a session that died before its first setup);
+    - stale: no container change and no indexer run for `max_idle`.
+
+    Groups without any timestamp (push-only indexes) are never considered stale. Users in
+    `keep` are never touched. Containers are only considered when the same user has (or
+    had) search resources, unless `include_lone_containers` is set.
+    """
+
+    def __init__(self, index_client, indexer_client, blob_service_client,
+                 max_idle: timedelta = timedelta(days=7), keep: Iterable[str] = (),
+                 user_pattern: Optional[str] = None, include_lone_containers: bool = False,
+                 requests_per_second: float = 5.0, max_workers: int = 8,
+                 on_swept: Optional[Callable[[str], None]] = None):
+        self.index_client = index_client
+        self.indexer_client = indexer_client
+        self.blob_service_client = blob_service_client
+        self.max_idle = max_idle
+        self.keep = set(keep)
+        self.user_pattern = re.compile(user_pattern) if user_pattern else None
+        self.include_lone_containers = include_lone_containers
+        self.limiter = RateLimiter(requests_per_second)
+        self.max_workers = max_workers
+        # Called with each user whose resources are all gone (e.g. to drop the local state)
+        self.on_swept = on_swept
+
+    def _wanted(self, user: str) -> bool:
+        return user not in self.keep and (self.user_pattern is None or self.user_pattern.fullmatch(user) is not None)
+
+    def inventory(self) -> Dict[str, UserResources]:
+        """Every user-scheme resource, grouped by user (one listing call per resource type)."""
+        groups: Dict[str, UserResources] = {}
+        listings = (
+            (INDEX, self.index_client.list_index_names),
+            (INDEXER, self.indexer_client.get_indexer_names),
+            (SKILLSET, self.indexer_client.get_skillset_names),
+            (DATA_SOURCE, self.indexer_client.get_data_source_connection_names),
+        )
+        for kind, list_names in listings:
+            self.limiter.wait()
+            for name in list_names():
+                match = RESOURCE_PATTERNS[kind].match(name)
+                if match and self._wanted(match.group("user")):
+                    groups.setdefault(match.group("user"), UserResources(match.group("user"))).add(kind, name)
+
+        self.limiter.wait()
+        for container in self.blob_service_client.list_containers():
+            user = container.name
+            if (user in groups or self.include_lone_containers) and self._wanted(user):
+                group = groups.setdefault(user, UserResources(user))
+                group.add(CONTAINER, user)
+                group.touch(getattr(container, "last_modified", None))
+        return groups
+
+    def _indexer_activity(self, name: str) -> Optional[datetime]:
+        self.limiter.wait()
+        try:
+            last = self.indexer_client.get_indexer_status(name).last_result
+        except (ResourceNotFoundError, HttpResponseError):
+            return None
+        return getattr(last, "end_time", None) or getattr(last, "start_time", None) if last is not None else None
+
+    def find_candidates(self) -> List[UserResources]:
+        groups = self.inventory()
+        indexers = [(group, name) for group in groups.values() for name in group.names.get(INDEXER, [])]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for (group, _), moment in zip(indexers, executor.map(lambda item: self._indexer_activity(item[1]), indexers)):
+                group.touch(moment)
+
+        cutoff = datetime.now(timezone.utc) - self.max_idle
+        candidates = []
+        for group in groups.values():
+            if not group.has(INDEX):
+                group.reason = ORPHANED
+            elif group.last_activity is not None and group.last_activity < cutoff:
+                group.reason = STALE
+            else:
+                continue
+            candidates.append(group)
+        return sorted(candidates, key=lambda g: g.user)
+
+    def _deleter(self, kind: str) -> Callable[[str], None]:
+        return {
+            INDEX: self.index_client.delete_index,
+            INDEXER: self.indexer_client.delete_indexer,
+            SKILLSET: self.indexer_client.delete_skillset,
+            DATA_SOURCE: self.indexer_client.delete_data_source_connection,
+            CONTAINER: lambda name: self.blob_service_client.get_container_client(name).delete_container(),
+        }[kind]
+
+    def _delete(self, kind: str, name: str, report: SweepReport):
+        self.limiter.wait()
+        try:
+            self._deleter(kind)(name)
+            report.deleted.append(name)
+            logger.info(f"🗑️ Swept {kind} '{name}'.")
+        except ResourceNotFoundError:
+            report.deleted.append(name)
+        except Exception as e:
+            report.failed[name] = str(e)
+            logger.error(f"❌ Failed to sweep {kind} '{name}': {e}")
+
+    def sweep(self, dry_run: bool = True) -> SweepReport:
+        """Delete the resources of every orphaned or stale user; with `dry_run` only list them."""
+        start = time.perf_counter()
+        report = SweepReport(candidates=self.find_candidates(), dry_run=dry_run)
+        for group in report.candidates:
+            logger.info(("Would sweep " if dry_run else "Sweeping ") + group.describe())
+        if not dry_run:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for stage in DELETION_STAGES:
+                    jobs = [(kind, name) for group in report.candidates for kind in stage
+                            for name in group.names.get(kind, [])]
+                    list(executor.map(lambda job: self._delete(job[0], job[1], report), jobs))
+            if self.on_swept is not None:
+                for group in report.candidates:
+                    if not any(name in report.failed for names in group.names.values() for name in names):
+                        self.on_swept(group.user)
+        report.elapsed_seconds = time.perf_counter() - start
+        logger.info(f"Resource sweep: {report.summary()}")
+        return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Delete orphaned or idle per-user RAG resources.")
+    parser.add_argument("--max-idle-hours", type=float, default=24 * 7)
+    parser.add_argument("--keep", nargs="*", default=[], help="users whose resources are never deleted")
+    parser.add_argument("--user-pattern", help="only consider users matching this regular expression")
+    parser.add_argument("--include-lone-containers", action="store_true")
+    parser.add_argument("--requests-per-second", type=float, default=5.0)
+    parser.add_argument("--delete", action="store_true", help="actually delete (the default is a dry run)")
+    args = parser.parse_args()
+
+    from embeddings import build_resource_sweeper
+    sweeper = build_resource_sweeper(timedelta(hours=args.max_idle_hours), keep=args.keep,
+                                     user_pattern=args.user_pattern,
+                                     include_lone_containers=args.include_lone_containers,
+                                     requests_per_second=args.requests_per_second)
+    sweeper.sweep(dry_run=not args.delete)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+
+# Storage / precision trade-offs of the "text_vector" field, applied together to the index and the skillset
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from azure.search.documents.indexes.models import (
+    BinaryQuantizationCompression,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters,
+    VectorSearchCompression,
+)
+
+
+SCALAR = "scalar"
+BINARY = "binary"
+
+# Size of the vectors the embedding deployments return when no `dimensions` is requested
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+
+
+@dataclass(frozen=True)
+class VectorProfile:
+    """
+    How `text_vector` is embedded and stored.
+
+    `dimensions` below the default needs a text-embedding-3 deployment (the embedding skill and
+    the client-side embedder request the shorter vectors, the vectorizer follows the
+    field). `compression` keeps a scalar (int8) or binary quantized copy in the HNSW graph;
+    `store_original_vectors=False` drops the retrievable full-precision copy.
+    """
+    name: str
+    dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS
+    compression: Optional[str] = None
+    store_original_vectors: bool = True
+    rerank_with_original_vectors: bool = True
+    oversampling: Optional[float] = None
+
+    def __post_init__(self):
+        if self.compression not in (None, SCALAR, BINARY):
+            raise ValueError(f"Unknown vector compression '{self.compression}', expected '{SCALAR}' or '{BINARY}'")
+
+    @property
+    def requested_dimensions(self) -> Optional[int]:
+        """`dimensions` to ask the embedding model for, None for its default size."""
+        return self.dimensions if self.dimensions != DEFAULT_EMBEDDING_DIMENSIONS else None
+
+    @property
+    def compression_name(self) -> Optional[str]:
+        return f"{self.compression}Compression" if self.compression else None
+
+    def build_compressions(self) -> List[VectorSearchCompression]:
+        if self.compression == SCALAR:
+            return [ScalarQuantizationCompression(
+                compression_name=self.compression_name,
+                rerank_with_original_vectors=self.rerank_with_original_vectors,
+                default_oversampling=self.oversampling,
+                parameters=ScalarQuantizationParameters(quantized_data_type="int8"),
+            )]
+        if self.compression == BINARY:
+            return [BinaryQuantizationCompression(
+                compression_name=self.compression_name,
+                rerank_with_original_vectors=self.rerank_with_original_vectors,
+                default_oversampling=self.oversampling,
+            )]
+        return []
+
+    def bytes_per_vector(self) -> float:
+        """Approximate vector index memory per chunk (the quantized copy when compressed)."""
+        if self.compression == SCALAR:
+            return self.dimensions
+        if self.compression == BINARY:
+            return self.dimensions / 8
+        return self.dimensions * 4
+
+    def bytes_on_disk_per_vector(self) -> float:
+        stored = self.dimensions * 4 if self.store_original_vectors else 0
+        full_precision = self.dimensions * 4 if self.compression and self.rerank_with_original_vectors else 0
+        return self.bytes_per_vector() + max(stored, full_precision)
+
+
+VECTOR_PROFILES: Dict[str, VectorProfile] = {profile.name: profile for profile in (
+    VectorProfile("full"),
+    VectorProfile("scalar", compression=SCALAR, oversampling=2.0),
+    VectorProfile("scalar-lean", compression=SCALAR, oversampling=2.0, store_original_vectors=False),
+    VectorProfile("binary", compression=BINARY, oversampling=10.0),
+    VectorProfile("binary-lean", compression=BINARY, oversampling=10.0, store_original_vectors=False),
+    VectorProfile("compact-512", dimensions=512, compression=SCALAR, oversampling=2.0, store_original_vectors=False),
+)}
+
+DEFAULT_VECTOR_PROFILE = os.environ.get("RAG_VECTOR_PROFILE", "full")
+
+
+def get_vector_profile(name: Optional[str] = None) -> VectorProfile:
+    name = name or DEFAULT_VECTOR_PROFILE
+    if name not in VECTOR_PROFILES:
+        raise ValueError(f"Unknown vector profile '{name}', expected one of {sorted(VECTOR_PROFILES)}")
+    return VECTOR_PROFILES[name]
@@ -0,0 +1,571 @@
+"""
+In-process stand-ins for the Azure services the backend talks to: blob storage, the
+Search index / indexer / documents endpoints and Azure OpenAI chat + embeddings.
+
+Every fake call sleeps for a configurable latency, fails with a 429 at a configurable
+rate and returns payloads of a configurable size, so the code paths of the backend can be
+driven (and timed) without any paid resource. `install_fakes` swaps them in for the
+client accessors used by `embeddings`, `retrieval`, `chat_completion` and `text_embeddings`.
+"""
+
+import asyncio
+import base64
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import httpx
+import openai
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+
+
+@dataclass
+class FakeServiceProfile:
+    """Behaviour of one fake service."""
+    latency_ms: float = 20.0
+    # Uniform +/- jitter around `latency_ms`
+    jitter_ms: float = 5.0
+    # Probability that a call is rejected with HTTP 429
+    throttle_rate: float = 0.0
+    # Size of generated payloads: answer characters for chat, vector dimensions for embeddings
+    payload_size: int = 0
+
+    def wait(self, rng: random.Random):
+        delay = max(0.0, self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay / 1000)
+
+    def throttled(self, rng: random.Random) -> bool:
+        return self.throttle_rate > 0 and rng.random() < self.throttle_rate
+
+
+@dataclass
+class FakeAzureConfig:
+    blob: FakeServiceProfile = field(default_factory=lambda: FakeServiceProfile(latency_ms=15))
+    search: FakeServiceProfile = field(default_factory=lambda: FakeServiceProfile(latency_ms=30))
+    chat: FakeServiceProfile = field(default_factory=lambda: FakeServiceProfile(latency_ms=400, payload_size=800))
+    embeddings: FakeServiceProfile = field(default_factory=lambda: FakeServiceProfile(latency_ms=60, payload_size=1536))
+    # Simulated indexer cost per document (the indexer run itself is asynchronous in Azure)
+    indexer_ms_per_document: float = 50.0
+    seed: int = 0
+
+
+class _FakeService:
+    def __init__(self, profile: FakeServiceProfile, seed: int):
+        self.profile = profile
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def _call(self, throttle_error):
+        with self._rng_lock:
+            self.calls += 1
+            throttled = self.profile.throttled(self._rng)
+            seed = self._rng.random()
+        self.profile.wait(random.Random(seed))
+        if throttled:
+            with self._rng_lock:
+                self.throttled += 1
+            raise throttle_error()
+
+
+def _azure_throttle() -> HttpResponseError:
+    error = HttpResponseError(message="Too many requests (simulated)")
+    error.status_code = 429
+    return error
+
+
+def _openai_throttle() -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://fake.openai.azure.com/openai/deployments/fake")
+    response = httpx.Response(429, request=request, headers={"retry-after-ms": "500"})
+    return openai.RateLimitError("Rate limit reached (simulated)", response=response, body=None)
+
+
+# ---------------------------------------------------------------------------- blob storage
+
+class FakeBlobStore(_FakeService):
+    """Containers -> {blob name: (bytes, metadata)}"""
+
+    def __init__(self, profile: FakeServiceProfile, seed: int = 0):
+        super().__init__(profile, seed)
+        self.containers: Dict[str, Dict[str, tuple]] = {}
+        self.last_modified: Dict[str, datetime] = {}
+        # (container, blob) -> {block id: bytes} staged but not committed yet
+        self.staged_blocks: Dict[tuple, Dict[str, bytes]] = {}
+        self.lock = threading.Lock()
+
+    def get_container_client(self, name: str) -> "FakeContainerClient":
+        return FakeContainerClient(self, name)
+
+    def list_containers(self, **kwargs):
+        self._call(_azure_throttle)
+        with self.lock:
+            return [SimpleNamespace(name=name, last_modified=self.last_modified.get(name)) for name in self.containers]
+
+    def _touch(self, name: str):
+        self.last_modified[name] = datetime.now(timezone.utc)
+
+
+class FakeContainerClient:
+    def __init__(self, store: FakeBlobStore, name: str):
+        self.store = store
+        self.name = name
+
+    def create_container(self):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            if self.name in self.store.containers:
+                raise ResourceExistsError("ContainerAlreadyExists")
+            self.store.containers[self.name] = {}
+            self.store._touch(self.name)
+
+    def delete_container(self):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            if self.store.containers.pop(self.name, None) is None:
+                raise ResourceNotFoundError("ContainerNotFound")
+            for key in [key for key in self.store.staged_blocks if key[0] == self.name]:
+                del self.store.staged_blocks[key]
+
+    def _blobs(self) -> Dict[str, tuple]:
+        if self.name not in self.store.containers:
+            raise ResourceNotFoundError("ContainerNotFound")
+        return self.store.containers[self.name]
+
+    def upload_blob(self, name: str, data, overwrite: bool = False, metadata: Optional[dict] = None, **kwargs):
+        content = data.read() if hasattr(data, "read") else bytes(data)
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            blobs = self._blobs()
+            if name in blobs and not overwrite:
+                raise ResourceExistsError("BlobAlreadyExists")
+            blobs[name] = (content, dict(metadata or {}))
+            self.store._touch(self.name)
+
+    def delete_blobs(self, *names: str, **kwargs):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            blobs = self._blobs()
+            for name in names:
+                blobs.pop(name, None)
+            self.store._touch(self.name)
+
+    def list_blobs(self, name_starts_with: Optional[str] = None, include=None, **kwargs):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            items = list(self._blobs().items())
+        return [SimpleNamespace(name=name, size=len(content), metadata=metadata)
+                for name, (content, metadata) in items if not name_starts_with or name.startswith(name_starts_with)]
+
+    def get_blob_client(self, name: str) -> "FakeBlobClient":
+        return FakeBlobClient(self, name)
+
+
+class FakeBlobClient:
+    """Properties and block uploads of one blob; staged blocks live in the store until committed."""
+
+    def __init__(self, container: FakeContainerClient, name: str):
+        self.container = container
+        self.store = container.store
+        self.blob_name = name
+
+    @property
+    def _key(self):
+        return (self.container.name, self.blob_name)
+
+    def get_blob_properties(self):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            content, metadata = self.container._blobs()[self.blob_name]
+        return SimpleNamespace(name=self.blob_name, size=len(content), metadata=metadata)
+
+    def stage_block(self, block_id: str, data, **kwargs):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            self.container._blobs()
+            self.store.staged_blocks.setdefault(self._key, {})[block_id] = bytes(data)
+
+    def get_block_list(self, block_list_type: str = "committed", **kwargs):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            staged = self.store.staged_blocks.get(self._key)
+            if staged is None and self.blob_name not in self.container._blobs():
+                raise ResourceNotFoundError("BlobNotFound")
+            return [], [SimpleNamespace(id=block_id, size=len(data)) for block_id, data in (staged or {}).items()]
+
+    def commit_block_list(self, block_list, metadata: Optional[dict] = None, etag: Optional[str] = None,
+                          match_condition=None, **kwargs):
+        self.store._call(_azure_throttle)
+        with self.store.lock:
+            blobs = self.container._blobs()
+            if etag == "*" and self.blob_name in blobs:
+                raise ResourceExistsError("BlobAlreadyExists")
+            staged = self.store.staged_blocks.pop(self._key, {})
+            content = b"".join(staged[block.id] for block in block_list)
+            blobs[self.blob_name] = (content, dict(metadata or {}))
+            self.store._touch(self.container.name)
+
+
+class FakeAsyncBlobClient:
+    """Async facade over `FakeBlobClient` (the latency is slept in a worker thread)."""
+
+    def __init__(self, blob: FakeBlobClient):
+        self._blob = blob
+        self.blob_name = blob.blob_name
+
+    async def stage_block(self, block_id: str, data, **kwargs):
+        return await asyncio.to_thread(self._blob.stage_block, block_id, data, **kwargs)
+
+    async def get_block_list(self, block_list_type: str = "committed", **kwargs):
+        return await asyncio.to_thread(self._blob.get_block_list, block_list_type, **kwargs)
+
+    async def commit_block_list(self, block_list, **kwargs):
+        return await asyncio.to_thread(self._blob.commit_block_list, block_list, **kwargs)
+
+
+class FakeAsyncBlobStore:
+    def __init__(self, store: FakeBlobStore):
+        self.store = store
+
+    def get_container_client(self, name: str):
+        container = self.store.get_container_client(name)
+        return SimpleNamespace(get_blob_client=lambda blob: FakeAsyncBlobClient(container.get_blob_client(blob)))
+
+
+# ---------------------------------------------------------------------------- search service
+
+class FakeSearchService(_FakeService):
+    """Index definitions, indexer resources and the documents of each index."""
+
+    def __init__(self, profile: FakeServiceProfile, blob_store: FakeBlobStore, indexer_ms_per_document: float,
+                 embedding_dimensions: int = 1536, seed: int = 0):
+        super().__init__(profile, seed)
+        self.blob_store = blob_store
+        self.indexer_ms_per_document = indexer_ms_per_document
+        self.embedding_dimensions = embedding_dimensions
+        self.lock = threading.Lock()
+        self.indexes: Dict[str, object] = {}
+        self.documents: Dict[str, Dict[str, dict]] = {}
+        self.resources: Dict[str, Dict[str, object]] = {"data_source": {}, "skillset": {}, "indexer": {}}
+        self.indexer_runs: Dict[str, SimpleNamespace] = {}
+
+    # index client
+    def create_or_update_index(self, index):
+        self._call(_azure_throttle)
+        with self.lock:
+            self.indexes[index.name] = index
+            self.documents.setdefault(index.name, {})
+        return index
+
+    def get_index(self, name: str):
+        self._call(_azure_throttle)
+        with self.lock:
+            if name not in self.indexes:
+                raise ResourceNotFoundError(f"Index '{name}' not found")
+            return self.indexes[name]
+
+    def delete_index(self, name: str):
+        self._call(_azure_throttle)
+        with self.lock:
+            if self.indexes.pop(name, None) is None:
+                raise HttpResponseError(message="IndexNotFound")
+            self.documents.pop(name, None)
+
+    def list_index_names(self):
+        self._call(_azure_throttle)
+        with self.lock:
+            return list(self.indexes)
+
+    # indexer client
+    def _create(self, kind: str, definition):
+        self._call(_azure_throttle)
+        with self.lock:
+            self.resources[kind][definition.name] = definition
+        return definition
+
+    def _delete(self, kind: str, name: str, not_found: str):
+        self._call(_azure_throttle)
+        with self.lock:
+            if self.resources[kind].pop(name, None) is None:
+                raise HttpResponseError(message=not_found)
+
+    def create_or_update_data_source_connection(self, data_source):
+        return self._create("data_source", data_source)
+
+    def create_or_update_skillset(self, skillset):
+        return self._create("skillset", skillset)
+
+    def create_or_update_indexer(self, indexer):
+        created = self._create("indexer", indexer)
+        self._run(indexer)
+        return created
+
+    def delete_data_source_connection(self, name: str):
+        self._delete("data_source", name, "DataSourceConnectionNotFound")
+
+    def delete_skillset(self, name: str):
+        self._delete("skillset", name, "SkillsetNotFound")
+
+    def delete_indexer(self, name: str):
+        self._delete("indexer", name, "IndexerNotFound")
+
+    def _names(self, kind: str):
+        self._call(_azure_throttle)
+        with self.lock:
+            return list(self.resources[kind])
+
+    def get_indexer_names(self):
+        return self._names("indexer")
+
+    def get_skillset_names(self):
+        return self._names("skillset")
+
+    def get_data_source_connection_names(self):
+        return self._names("data_source")
+
+    def run_indexer(self, name: str):
+        self._call(_azure_throttle)
+        indexer = self.resources["indexer"].get(name)
+        if indexer is None:
+            raise ResourceNotFoundError(f"Indexer '{name}' not found")
+        self._run(indexer)
+
+    def _run(self, indexer):
+        """Crack, split and 'embed' every blob of the data source, charging `indexer_ms_per_document` each."""
+        data_source = self.resources["data_source"].get(indexer.data_source_name)
+        if data_source is None:
+            now = datetime.now(timezone.utc)
+            self.indexer_runs[indexer.name] = SimpleNamespace(
+                status="transientFailure", error_message=f"Data source '{indexer.data_source_name}' not found",
+                errors=[], warnings=[], item_count=0, failed_item_count=0, start_time=now, end_time=now,
+            )
+            return
+        prefix = data_source.container.query or ""
+        with self.blob_store.lock:
+            blobs = dict(self.blob_store.containers.get(data_source.container.name, {}))
+        start = time.perf_counter()
+        started_at = datetime.now(timezone.utc)
+        index = self.documents.setdefault(indexer.target_index_name, {})
+        count = 0
+        for name, (content, metadata) in blobs.items():
+            if not name.startswith(prefix):
+                continue
+            time.sleep(self.indexer_ms_per_document / 1000)
+            # metadata_storage_name: the file name, without virtual folders
+            title = name.rsplit("/", 1)[-1]
+            # Index projections key the chunks "<projection hash>_<parent key>_pages_<n>", the parent key
+            # being the base64 storage path of the blob: never the keys push ingestion computes
+            storage_path = f"https://fake.blob.core.windows.net/{data_source.container.name}/{name}"
+            parent_id = base64.urlsafe_b64encode(storage_path.encode("utf-8")).decode("ascii").rstrip("=")
+            projection = hashlib.sha1(indexer.name.encode("utf-8")).hexdigest()[:12]
+            text = content.decode("utf-8", errors="ignore")
+            for number, start_at in enumerate(range(0, max(len(text), 1), 4096)):
+                chunk_id = f"{projection}_{parent_id}_pages_{number}"
+                with self.lock:
+                    index[chunk_id] = {"chunk_id": chunk_id, "parent_id": parent_id, "title": title,
+                                       "chunk": text[start_at:start_at + 4096], "owner": metadata.get("owner")}
+            count += 1
+        self.indexer_runs[indexer.name] = SimpleNamespace(
+            status="success", error_message=None, errors=[], warnings=[], item_count=count, failed_item_count=0,
+            start_time=started_at, end_time=datetime.now(timezone.utc), elapsed_seconds=time.perf_counter() - start,
+        )
+
+    def get_indexer_status(self, name: str):
+        self._call(_azure_throttle)
+        return SimpleNamespace(status="running", last_result=self.indexer_runs.get(name), execution_history=[])
+
+    def get_search_client(self, index_name: str) -> "FakeSearchClient":
+        return FakeSearchClient(self, index_name)
+
+
+@lru_cache(maxsize=100_000)
+def _term_counts(text: str) -> Counter:
+    # Cached so the fake's own scoring cost does not show up in the measured query latency
+    return Counter(re.findall(r"\w+", text.lower()))
+
+
+_TITLE_EQ = re.compile(r"title eq '((?:[^']|'')*)'")
+_TITLE_IN = re.compile(r"search\.in\(title, '((?:[^']|'')*)', '((?:[^']|'')*)'\)")
+_OWNER_EQ = re.compile(r"owner eq '((?:[^']|'')*)'")
+
+
+class FakeSearchClient:
+    """Keyword scoring over the stored chunks; good enough to return realistic payloads."""
+
+    def __init__(self, service: FakeSearchService, index_name: str):
+        self.service = service
+        self.index_name = index_name
+
+    def search(self, search_text: Optional[str] = None, filter: Optional[str] = None, top: int = 50, **kwargs):
+        self.service._call(_azure_throttle)
+        with self.service.lock:
+            documents = list(self.service.documents.get(self.index_name, {}).values())
+        if filter:
+            titles = {t.replace("''", "'") for t in _TITLE_EQ.findall(filter)}
+            for values, delimiter in _TITLE_IN.findall(filter):
+                titles.update(values.replace("''", "'").split(delimiter.replace("''", "'")))
+            documents = [d for d in documents if d["title"] in titles] if titles else documents
+            owner = _OWNER_EQ.search(filter)
+            if owner:
+                documents = [d for d in documents if d.get("owner") == owner.group(1).replace("''", "'")]
+        terms = set(re.findall(r"\w+", (search_text or "").lower()))
+        scored = []
+        for document in documents:
+            counts = _term_counts(document["chunk"])
+            score = sum(counts.get(t, 0) for t in terms) / (sum(counts.values()) or 1)
+            scored.append(dict(document, **{"@search.score": score}))
+        scored.sort(key=lambda d: -d["@search.score"])
+        return scored[:top]
+
+    def upload_documents(self, documents: List[dict]):
+        self.service._call(_azure_throttle)
+        with self.service.lock:
+            index = self.service.documents.setdefault(self.index_name, {})
+            for document in documents:
+                index[document["chunk_id"]] = document
+        return [SimpleNamespace(key=d["chunk_id"], succeeded=True) for d in documents]
+
+    def delete_documents(self, documents: List[dict]):
+        self.service._call(_azure_throttle)
+        with self.service.lock:
+            index = self.service.documents.get(self.index_name, {})
+            for document in documents:
+                index.pop(document["chunk_id"], None)
+        return [SimpleNamespace(key=d["chunk_id"], succeeded=True) for d in documents]
+
+
+# ---------------------------------------------------------------------------- Azure OpenAI
+
+_WORDS = ("the contract states that the supplier delivers the goods within thirty days of the order "
+          "and the buyer pays the invoice after acceptance of the delivery").split()
+
+
+class FakeOpenAI(_FakeService):
+    """`client.chat.completions.create` and `client.embeddings.create` of an AzureOpenAI client."""
+
+    def __init__(self, chat: FakeServiceProfile, embeddings: FakeServiceProfile, seed: int = 0):
+        super().__init__(chat, seed)
+        self.embedding_service = _FakeService(embeddings, seed + 1)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def _answer(self) -> str:
+        words, size = [], 0
+        while size < self.profile.payload_size:
+            word = _WORDS[len(words) % len(_WORDS)]
+            words.append(word if len(words) % 25 else f"{word} [doc1].")
+            size += len(word) + 1
+        return " ".join(words)
+
+    def _chat(self, messages, stream: bool = False, extra_body=None, **kwargs):
+        self._call(_openai_throttle)
+        answer = self._answer()
+        citations = [{"title": "fake.pdf", "content": answer[:200], "filepath": None, "url": None}] if extra_body else []
+        usage = SimpleNamespace(prompt_tokens=sum(len(m["content"]) for m in messages) // 4,
+                                completion_tokens=len(answer) // 4, total_tokens=0)
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        if stream:
+            return self._stream(answer, citations)
+        message = SimpleNamespace(content=answer, context={"citations": citations})
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    @staticmethod
+    def _stream(answer: str, citations: List[dict]):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, context={"citations": citations}))])
+        for start in range(0, len(answer), 16):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=answer[start:start + 16], context=None))])
+
+    def _embed(self, model=None, input=(), dimensions: Optional[int] = None, **kwargs):
+        self.embedding_service._call(_openai_throttle)
+        size = dimensions or self.embedding_service.profile.payload_size
+        data = []
+        for i, text in enumerate(input):
+            rng = random.Random(hashlib.sha1(text.encode("utf-8")).digest())
+            data.append(SimpleNamespace(index=i, embedding=[rng.uniform(-1, 1) for _ in range(size)]))
+        return SimpleNamespace(data=data)
+
+
+class FakeAsyncOpenAI:
+    """Async facade over `FakeOpenAI` (the latency is slept in a worker thread)."""
+
+    def __init__(self, fake: FakeOpenAI):
+        import asyncio
+
+        async def chat(**kwargs):
+            return await asyncio.to_thread(fake._chat, **kwargs)
+
+        async def embed(**kwargs):
+            return await asyncio.to_thread(fake._embed, **kwargs)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=chat))
+        self.embeddings = SimpleNamespace(create=embed)
+
+
+# ---------------------------------------------------------------------------- wiring
+
+@dataclass
+class FakeAzure:
+    blob: FakeBlobStore
+    search: FakeSearchService
+    openai: FakeOpenAI
+
+    @contextmanager
+    def without_throttling(self):
+        """Scenario preparation should not fail on simulated 429s; only the measured calls do."""
+        services = (self.blob, self.search, self.openai, self.openai.embedding_service)
+        rates = [service.profile.throttle_rate for service in services]
+        for service in services:
+            service.profile.throttle_rate = 0.0
+        try:
+            yield
+        finally:
+            for service, rate in zip(services, rates):
+                service.profile.throttle_rate = rate
+
+    def call_counts(self) -> Dict[str, Dict[str, int]]:
+        services = {"blob": self.blob, "search": self.search, "chat": self.openai,
+                    "embeddings": self.openai.embedding_service}
+        return {name: {"calls": s.calls, "throttled": s.throttled} for name, s in services.items()}
+
+
+def install_fakes(config: Optional[FakeAzureConfig] = None) -> FakeAzure:
+    """
+    Point the backend at fresh fakes. Must run after the backend modules are imported
+    (with placeholder credentials in the environment) and before any collection is created.
+    """
+    import chat_completion
+    import embeddings
+    import retrieval
+    import text_embeddings
+    import throttling
+
+    config = config or FakeAzureConfig()
+    blob = FakeBlobStore(config.blob, config.seed)
+    search = FakeSearchService(config.search, blob, config.indexer_ms_per_document,
+                               config.embeddings.payload_size, config.seed + 2)
+    fake_openai = FakeOpenAI(config.chat, config.embeddings, config.seed + 3)
+
+    embeddings.get_blob_service_client = lambda *args, **kwargs: blob
+    embeddings.registry.async_blob_service_client = lambda *args, **kwargs: FakeAsyncBlobStore(blob)
+    embeddings.get_search_index_client = lambda *args, **kwargs: search
+    embeddings.get_search_indexer_client = lambda *args, **kwargs: search
+    embeddings.get_search_client = lambda endpoint, index_name, *args, **kwargs: search.get_search_client(index_name)
+    retrieval.get_search_client = embeddings.get_search_client
+    # Containers of the previous fakes are not in the new store
+    embeddings._container_futures.clear()
+    # Adaptive limits learnt against the previous fakes do not apply
+    throttling.reset_throttles()
+    chat_completion.get_client = lambda: fake_openai
+    chat_completion.get_async_client = lambda: FakeAsyncOpenAI(fake_openai)
+    text_embeddings.get_embedding_client = lambda: fake_openai
+    text_embeddings.get_async_embedding_client = lambda: FakeAsyncOpenAI(fake_openai)
+    return FakeAzure(blob, search, fake_openai)
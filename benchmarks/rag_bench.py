@@ -0,0 +1,361 @@
+"""
+End-to-end benchmark of the backend against the local fakes of `benchmarks.fakes`.
+
+Drives the pipelines of `RAGBackEnd` / `UserDocumentCollection`:
+
+    startup    `import rag` in a fresh interpreter, then RAGBackEnd construction (no service calls expected)
+    ingest     document_index_pipeline (concurrent blob uploads, then the indexer)
+    setup      setup_user_index_pipeline, cold (nothing deployed) and warm (incremental)
+    query      query_rag in the "extension" and "client" retrieval modes
+    teardown   user_logout_delete_pipeline
+
+and reports p50/p95/p99 latency, throughput and Python allocations (tracemalloc) for each.
+Results are written to `--output-dir` as JSON and compared with the previous run there,
+so regressions show up between versions:
+
+    python -m benchmarks.rag_bench
+    python -m benchmarks.rag_bench --files 200 --queries 100 --chat-latency 800 --throttle-rate 0.02
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# The backend modules read their configuration at import time: never let a local .env
+# point the benchmark at real resources
+_STATE_DIR = tempfile.mkdtemp(prefix="rag_bench_")
+os.environ.update({
+    "AZURE_COGNITIVE_SERVICES_ENDPOINT": "https://fake.openai.azure.com",
+    "AZURE_MULTI_OPENAI_ENDPOINT": "https://fake.openai.azure.com",
+    "AZURE_COGNITIVE_API": "fake-key",
+    "AZURE_AI_SEARCH_ENDPOINT": "https://fake.search.windows.net",
+    "AZURE_AI_SEARCH_API_KEY": "fake-key",
+    "AZURE_BLOB_CONNECTION_STRING": "UseDevelopmentStorage=true",
+    "CHAT_DEPLOYMENT": "fake-chat",
+    "EMBEDDING_DEPLOYMENT": "fake-embedding",
+    "RAG_STATE_DIR": _STATE_DIR,
+    "RAG_SEARCH_BACKEND": "azure",
+})
+
+import numpy as np
+from loguru import logger
+
+from benchmarks.fakes import FakeAzure, FakeAzureConfig, FakeServiceProfile, install_fakes
+
+
+DEFAULT_OUTPUT_DIR = Path(__file__).parent / "results"
+# Relative change of a latency (or drop of a throughput) reported as a regression
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+
+def _sample_text(index: int, size: int) -> str:
+    sentence = (f"Document {index} describes clause {index % 17} of the supply contract: delivery within "
+                f"{index % 60 + 1} days, payment after acceptance and a penalty of {index % 9}% per week of delay. ")
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+
+def make_corpus(folder: Path, files: int, size: int) -> List[str]:
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = folder / f"doc_{i:05d}.txt"
+        path.write_text(_sample_text(i, size), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def summarize(latencies_ms: List[float], elapsed_s: float, operations: int, errors: int,
+              peak_bytes: int, allocated_bytes: int, extra: Optional[dict] = None) -> dict:
+    values = np.asarray(latencies_ms or [0.0])
+    result = {
+        "operations": operations,
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "throughput_per_s": round(operations / elapsed_s, 2) if elapsed_s else 0.0,
+        "elapsed_s": round(elapsed_s, 3),
+        "peak_alloc_kb": round(peak_bytes / 1024, 1),
+        "net_alloc_kb": round(allocated_bytes / 1024, 1),
+    }
+    result.update(extra or {})
+    return result
+
+
+def measure(operations: List[Callable[[], None]], concurrency: int = 1, extra: Optional[dict] = None) -> dict:
+    """Run the operations (on a thread pool when `concurrency > 1`) and summarize them."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    latencies, errors = [], 0
+
+    def timed(operation):
+        start = time.perf_counter()
+        try:
+            operation()
+            return (time.perf_counter() - start) * 1000, None
+        except Exception as e:
+            return (time.perf_counter() - start) * 1000, e
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as executor:
+            outcomes = list(executor.map(timed, operations))
+    else:
+        outcomes = [timed(operation) for operation in operations]
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for latency, error in outcomes:
+        latencies.append(latency)
+        if error is not None:
+            errors += 1
+            logger.debug(f"Benchmark operation failed: {error}")
+    return summarize(latencies, elapsed, len(operations), errors, peak - baseline, current - baseline, extra)
+
+
+def bench_startup(args, corpus: List[str], fakes: FakeAzure) -> Dict[str, dict]:
+    from rag import RAGBackEnd
+
+    def fresh_import(statement: str):
+        # A new interpreter each time: the modules imported by this process would hide the cost
+        subprocess.run([sys.executable, "-c", statement], check=True, env=os.environ.copy(),
+                       cwd=Path(__file__).parent.parent)
+
+    interpreter = measure([lambda: fresh_import("pass")] * args.startup_runs)
+    imports = measure([lambda: fresh_import("import rag")] * args.startup_runs)
+    imports["import_ms"] = round(imports["p50_ms"] - interpreter["p50_ms"], 2)
+
+    calls_before = fakes.blob.calls + fakes.search.calls
+    construct = measure([lambda i=i: RAGBackEnd(f"bench-startup-{i}") for i in range(args.startup_runs)])
+    construct["service_calls"] = fakes.blob.calls + fakes.search.calls - calls_before
+    return {"import": imports, "construct": construct}
+
+
+def bench_ingest(args, corpus: List[str], fakes: FakeAzure) -> dict:
+    from rag import RAGBackEnd
+
+    with fakes.without_throttling():
+        backend = RAGBackEnd("bench-ingest")
+    report = {}
+
+    def ingest():
+        report["result"] = backend.document_index_pipeline(corpus, max_workers=args.upload_workers)
+
+    result = measure([ingest])
+    ingest_report = report.get("result")
+    if ingest_report is not None:
+        uploads = [r.seconds * 1000 for r in ingest_report.results]
+        result.update({
+            "files": len(corpus),
+            "files_per_s": round(len(corpus) / result["elapsed_s"], 2) if result["elapsed_s"] else 0.0,
+            "mb_per_s": round(ingest_report.megabytes_per_second, 2),
+            "upload_p50_ms": round(float(np.percentile(uploads, 50)), 2),
+            "upload_p95_ms": round(float(np.percentile(uploads, 95)), 2),
+            "upload_p99_ms": round(float(np.percentile(uploads, 99)), 2),
+            "failed_files": len(ingest_report.failed),
+        })
+    with fakes.without_throttling():
+        backend.logout_delete_storage_pipeline()
+    return result
+
+
+def bench_setup(args, corpus: List[str], fakes: FakeAzure) -> Dict[str, dict]:
+    from embeddings import UserDocumentCollection
+
+    with fakes.without_throttling():
+        collection = UserDocumentCollection("bench-setup")
+        for path in corpus[:args.setup_documents]:
+            with open(path, "rb") as f:
+                collection.add_file_to_blob_container(path, f)
+
+    def cold():
+        collection.provisioning_state.clear()
+        collection.setup_user_index_pipeline()
+
+    results = {
+        "cold": measure([cold] * args.setup_runs),
+        "warm": measure([collection.setup_user_index_pipeline] * args.setup_runs),
+    }
+    with fakes.without_throttling():
+        collection.user_logout_delete_pipeline()
+    return results
+
+
+def bench_query(args, corpus: List[str], fakes: FakeAzure) -> Dict[str, dict]:
+    from rag import RAGBackEnd, CLIENT_RETRIEVAL, EXTENSION_RETRIEVAL
+
+    results = {}
+    with fakes.without_throttling():
+        setup = RAGBackEnd("bench-query")
+        setup.document_index_pipeline(corpus[:args.query_documents], max_workers=args.upload_workers)
+    questions = [f"What is the delivery delay of clause {i % 17}?" for i in range(args.queries)]
+    for mode in (EXTENSION_RETRIEVAL, CLIENT_RETRIEVAL):
+        with fakes.without_throttling():
+            backend = RAGBackEnd("bench-query", retrieval_mode=mode)
+            # Warm-up: one-off costs (tokenizer load, client creation) are not query latency
+            backend.query_rag(questions[0], use_cache=False)
+        operations = [lambda q=q: backend.query_rag(q, use_cache=False) for q in questions]
+        results[mode] = measure(operations, concurrency=args.query_concurrency)
+    with fakes.without_throttling():
+        setup.logout_delete_storage_pipeline()
+    return results
+
+
+def bench_teardown(args, corpus: List[str], fakes: FakeAzure) -> dict:
+    from embeddings import UserDocumentCollection
+
+    collections = []
+    with fakes.without_throttling():
+        for i in range(args.teardown_users):
+            collection = UserDocumentCollection(f"bench-teardown-{i}")
+            with open(corpus[i % len(corpus)], "rb") as f:
+                collection.add_file_to_blob_container(corpus[i % len(corpus)], f)
+            collection.setup_user_index_pipeline()
+            collections.append(collection)
+    return measure([c.user_logout_delete_pipeline for c in collections])
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, previous: dict, threshold: float) -> List[str]:
+    """Human-readable regressions of latencies (up) and throughputs (down) beyond `threshold`."""
+    now, before = flatten(current["scenarios"]), flatten(previous["scenarios"])
+    regressions = []
+    for name, value in now.items():
+        old = before.get(name)
+        if not old:
+            continue
+        change = (value - old) / old
+        if name.endswith("_ms") and change > threshold:
+            regressions.append(f"{name}: {old} -> {value} ms (+{change:.0%})")
+        elif name.endswith("_per_s") and -change > threshold:
+            regressions.append(f"{name}: {old} -> {value}/s ({change:.0%})")
+    return regressions
+
+
+def print_report(results: dict):
+    for scenario, metrics in flatten_scenarios(results["scenarios"]).items():
+        print(f"\n{scenario}")
+        for key, value in metrics.items():
+            print(f"  {key:>18}: {value}")
+
+
+def flatten_scenarios(scenarios: dict) -> Dict[str, dict]:
+    rows = {}
+    for name, value in scenarios.items():
+        if value and all(isinstance(v, dict) for v in value.values()):
+            rows.update({f"{name}/{sub}": metrics for sub, metrics in value.items()})
+        else:
+            rows[name] = value
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="*", default=["startup", "ingest", "setup", "query", "teardown"],
+                        choices=["startup", "ingest", "setup", "query", "teardown"])
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--file-size", type=int, default=20_000, help="bytes per generated document")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--setup-documents", type=int, default=20)
+    parser.add_argument("--setup-runs", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--query-documents", type=int, default=20)
+    parser.add_argument("--query-concurrency", type=int, default=4)
+    parser.add_argument("--teardown-users", type=int, default=10)
+    parser.add_argument("--blob-latency", type=float, default=15.0, help="ms per blob call")
+    parser.add_argument("--search-latency", type=float, default=30.0, help="ms per search call")
+    parser.add_argument("--chat-latency", type=float, default=400.0, help="ms per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=60.0, help="ms per embedding request")
+    parser.add_argument("--indexer-ms-per-document", type=float, default=50.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of calls answered with HTTP 429")
+    parser.add_argument("--answer-chars", type=int, default=800, help="size of generated answers")
+    parser.add_argument("--output-dir", default=str(DEFAULT_OUTPUT_DIR))
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--regression-threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="DEBUG" if args.verbose else "WARNING")
+
+    def profile(latency: float, payload_size: int = 0) -> FakeServiceProfile:
+        return FakeServiceProfile(latency_ms=latency, jitter_ms=latency / 4, throttle_rate=args.throttle_rate,
+                                  payload_size=payload_size)
+
+    config = FakeAzureConfig(
+        blob=profile(args.blob_latency),
+        search=profile(args.search_latency),
+        chat=profile(args.chat_latency, args.answer_chars),
+        embeddings=profile(args.embedding_latency, 1536),
+        indexer_ms_per_document=args.indexer_ms_per_document,
+    )
+    fakes = install_fakes(config)
+    corpus = make_corpus(Path(_STATE_DIR) / "corpus", args.files, args.file_size)
+
+    runners = {"startup": bench_startup, "ingest": bench_ingest, "setup": bench_setup, "query": bench_query, "teardown": bench_teardown}
+    scenarios = {}
+    for name in args.scenarios:
+        print(f"Running '{name}'...", file=sys.stderr)
+        scenarios[name] = runners[name](args, corpus, fakes)
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output_dir", "no_save", "verbose")},
+        "scenarios": scenarios,
+        "service_calls": fakes.call_counts(),
+    }
+    print_report(results)
+
+    output_dir = Path(args.output_dir)
+    previous_runs = sorted(output_dir.glob("*.json")) if output_dir.is_dir() else []
+    if previous_runs:
+        previous = json.loads(previous_runs[-1].read_text(encoding="utf-8"))
+        if previous.get("config") != results["config"]:
+            print(f"\nPrevious run {previous_runs[-1].name} used a different configuration; not compared.")
+        else:
+            regressions = compare(results, previous, args.regression_threshold)
+            print(f"\nCompared with {previous_runs[-1].name} (revision {previous.get('revision')}): "
+                  + ("no regression." if not regressions else f"{len(regressions)} regression(s)"))
+            for line in regressions:
+                print(f"  ⚠️ {line}")
+    if not args.no_save:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = output_dir / f"{stamp}-{results['revision']}.json"
+        path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nResults saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Offline comparison of the vector profiles of `azure_search_utils.vector_profiles`.
+
+Each profile is simulated locally on the same corpus: vectors are truncated to the
+profile's dimensions (and re-normalised, as text-embedding-3 vectors can be), quantized
+like the service does (int8 per dimension, or one bit per dimension), searched by brute
+force over the quantized copy with the profile's oversampling, and reranked with the
+full-precision vectors when the profile keeps them. Recall@k is measured against exact
+search over the full-precision 1536-dim vectors.
+
+    python -m benchmarks.vector_profiles_bench --vectors chunks.npy --queries questions.npy
+    python -m benchmarks.vector_profiles_bench --documents 20000 --json results.json
+
+Without `--vectors`, a synthetic clustered corpus is generated; real embeddings give
+much more meaningful recall numbers.
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from azure_search_utils.vector_profiles import BINARY, SCALAR, VECTOR_PROFILES, VectorProfile
+
+
+def synthetic_corpus(documents: int, queries: int, dimensions: int = 1536, clusters: int = 64,
+                     seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    corpus = centers[rng.integers(0, clusters, documents)] + 0.6 * rng.standard_normal((documents, dimensions))
+    questions = centers[rng.integers(0, clusters, queries)] + 0.6 * rng.standard_normal((queries, dimensions))
+    return normalize(corpus.astype(np.float32)), normalize(questions.astype(np.float32))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+class SimulatedProfileIndex:
+    """Brute-force stand-in for an HNSW field configured with `profile`."""
+
+    def __init__(self, profile: VectorProfile, corpus: np.ndarray):
+        self.profile = profile
+        self.full = normalize(corpus[:, :profile.dimensions])
+        if profile.compression == SCALAR:
+            self.low = self.full.min(axis=0)
+            self.scale = np.maximum(self.full.max(axis=0) - self.low, 1e-12) / 255.0
+            self.codes = np.round((self.full - self.low) / self.scale).astype(np.uint8)
+            # Scored in float, but with the precision lost to the int8 codes
+            self.decoded = self.codes * self.scale + self.low
+        elif profile.compression == BINARY:
+            self.codes = np.packbits(self.full > 0, axis=1)
+
+    def nbytes(self) -> int:
+        count = len(self.full)
+        return int(count * self.profile.bytes_per_vector())
+
+    def _candidate_scores(self, query: np.ndarray) -> np.ndarray:
+        if self.profile.compression == SCALAR:
+            return self.decoded @ query
+        if self.profile.compression == BINARY:
+            bits = np.packbits(query > 0)
+            # Fewer differing bits = closer
+            return -np.unpackbits(np.bitwise_xor(self.codes, bits), axis=1).sum(axis=1).astype(np.float32)
+        return self.full @ query
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        query = query[:self.profile.dimensions]
+        query = query / max(np.linalg.norm(query), 1e-12)
+        scores = self._candidate_scores(query)
+        candidates = k
+        if self.profile.compression and self.profile.rerank_with_original_vectors:
+            candidates = int(k * (self.profile.oversampling or 1.0))
+        candidates = min(max(candidates, k), len(scores))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if candidates > k:
+            top = top[np.argsort(-(self.full[top] @ query))][:k]
+        else:
+            top = top[np.argsort(-scores[top])]
+        return top
+
+
+def run_profile(profile: VectorProfile, corpus: np.ndarray, queries: np.ndarray,
+                truth: np.ndarray, k: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    index = SimulatedProfileIndex(profile, corpus)
+    build_seconds = time.perf_counter() - start
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(set(found.tolist()) & set(expected.tolist())) / k)
+
+    return {
+        "profile": profile.name,
+        "dimensions": profile.dimensions,
+        "compression": profile.compression or "none",
+        "vector_index_mb": index.nbytes() / 2 ** 20,
+        "storage_mb": len(corpus) * profile.bytes_on_disk_per_vector() / 2 ** 20,
+        "build_s": build_seconds,
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        f"recall@{k}": float(np.mean(recalls)),
+    }
+
+
+def run(corpus: np.ndarray, queries: np.ndarray, k: int = 10,
+        profiles: Optional[List[str]] = None) -> List[Dict[str, float]]:
+    corpus, queries = normalize(corpus.astype(np.float32)), normalize(queries.astype(np.float32))
+    truth = exact_top_k(corpus, queries, k)
+    selected = [VECTOR_PROFILES[name] for name in (profiles or VECTOR_PROFILES)]
+    return [run_profile(profile, corpus, queries, truth, k) for profile in selected]
+
+
+def print_table(results: List[Dict[str, float]]):
+    columns = list(results[0])
+    print(" | ".join(f"{c:>15}" for c in columns))
+    for row in results:
+        print(" | ".join(f"{v:>15.3f}" if isinstance(v, float) else f"{v!s:>15}" for v in row.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help=".npy file of chunk embeddings (n x 1536)")
+    parser.add_argument("--queries", help=".npy file of question embeddings; defaults to a sample of --vectors")
+    parser.add_argument("--documents", type=int, default=10000, help="synthetic corpus size")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--profiles", nargs="*", choices=sorted(VECTOR_PROFILES))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = np.load(args.vectors, mmap_mode="r")
+        if args.queries:
+            queries = np.load(args.queries)
+        else:
+            rng = np.random.default_rng(0)
+            queries = corpus[rng.choice(len(corpus), min(args.num_queries, len(corpus)), replace=False)]
+        corpus = np.asarray(corpus)
+    else:
+        corpus, queries = synthetic_corpus(args.documents, args.num_queries)
+
+    results = run(corpus, queries, args.k, args.profiles)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
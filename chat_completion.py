@@ -1,28 +1,64 @@
 import os
-from openai import AzureOpenAI
-from dotenv import load_dotenv
+from functools import lru_cache
 
+from settings import load_environment
+from telemetry import span, telemetry
+from throttling import SDK_MAX_RETRIES, openai_throttle
+from token_utils import count_tokens
 
-load_dotenv()
+
+load_environment()
 CHAT_DEPLOYMENT=os.environ.get("CHAT_DEPLOYMENT")
+# Completion tokens assumed per request until the response reports its usage (rate limiting only)
+COMPLETION_TOKEN_ESTIMATE = 800
+
+
+# The openai package and the clients are only loaded on the first completion, which keeps
+# `import rag` (and worker cold starts) cheap
+@lru_cache(maxsize=None)
+def get_client():
+    from openai import AzureOpenAI
+    return AzureOpenAI(
+        azure_endpoint=os.environ["AZURE_COGNITIVE_SERVICES_ENDPOINT"],
+        api_key=os.environ["AZURE_COGNITIVE_API"],
+        api_version="2024-10-21",  # 2024-02-01+ supports data_sources
+        # Retries happen in the throttling layer
+        max_retries=SDK_MAX_RETRIES,
+    )
 
-client = AzureOpenAI(
-    azure_endpoint=os.environ["AZURE_COGNITIVE_SERVICES_ENDPOINT"],
-    api_key=os.environ["AZURE_COGNITIVE_API"],
-    api_version="2024-10-21",  # 2024-02-01+ supports data_sources
-)
 
+@lru_cache(maxsize=None)
+def get_async_client():
+    from openai import AsyncAzureOpenAI
+    return AsyncAzureOpenAI(
+        azure_endpoint=os.environ["AZURE_COGNITIVE_SERVICES_ENDPOINT"],
+        api_key=os.environ["AZURE_COGNITIVE_API"],
+        api_version="2024-10-21",
+        max_retries=SDK_MAX_RETRIES,
+    )
 
 
-def run_completion(prompt: str, filter: str, index_name: str, model="gpt-4.1", response_format="text"):
+def _response_format(response_format):
     if response_format == "json":
-        response_format = {"type": "json_object"}
+        return {"type": "json_object"}
     elif response_format == "text":
-        response_format = None
-    completion=  client.chat.completions.create(
+        return None
+    return response_format
+
+
+def build_chat_request(messages: list, response_format="text") -> dict:
+    """Keyword arguments of a plain chat completion (the caller supplies any grounding itself)."""
+    return dict(
         model=CHAT_DEPLOYMENT,
-        messages=[{"role": "user", "content": prompt}],
-        response_format=response_format,
+        messages=messages,
+        response_format=_response_format(response_format),
+    )
+
+
+def build_completion_request(prompt: str, filter: str, index_name: str, response_format="text") -> dict:
+    """Keyword arguments of a chat completion grounded on the given index through "data_sources"."""
+    return dict(
+        **build_chat_request([{"role": "user", "content": prompt}], response_format),
         extra_body={
             "data_sources": [{
                 "type": "azure_search",
@@ -45,4 +81,55 @@ def run_completion(prompt: str, filter: str, index_name: str, model="gpt-4.1", r
         }
     )
 
-    return completion.choices[0].message
\ No newline at end of file
+
+def _estimated_tokens(throttle, request: dict) -> int:
+    if not throttle.limits_tokens:
+        return 0
+    prompt = sum(count_tokens(m.get("content") or "") for m in request["messages"])
+    return prompt + COMPLETION_TOKEN_ESTIMATE
+
+
+def _create(request: dict, operation: str, stream: bool):
+    throttle = openai_throttle(CHAT_DEPLOYMENT)
+    tokens = _estimated_tokens(throttle, request)
+    completion = throttle.call(get_client().chat.completions.create, **request, stream=stream, tokens=tokens)
+    if stream:
+        return completion
+    usage = getattr(completion, "usage", None)
+    throttle.settle(tokens, usage)
+    telemetry.record_usage(usage, operation)
+    return completion.choices[0].message
+
+
+async def _acreate(request: dict, operation: str, stream: bool):
+    throttle = openai_throttle(CHAT_DEPLOYMENT)
+    tokens = _estimated_tokens(throttle, request)
+    completion = await throttle.acall(get_async_client().chat.completions.create, **request, stream=stream, tokens=tokens)
+    if stream:
+        return completion
+    usage = getattr(completion, "usage", None)
+    throttle.settle(tokens, usage)
+    telemetry.record_usage(usage, operation)
+    return completion.choices[0].message
+
+
+def run_completion(prompt: str, filter: str, index_name: str, model="gpt-4.1", response_format="text", stream=False):
+    """Return the completion message, or with `stream=True` the raw stream of completion chunks."""
+    with span("query.completion", extension=True, stream=stream):
+        return _create(build_completion_request(prompt, filter, index_name, response_format), "completion", stream)
+
+
+async def arun_completion(prompt: str, filter: str, index_name: str, model="gpt-4.1", response_format="text", stream=False):
+    with span("query.completion", extension=True, stream=stream):
+        return await _acreate(build_completion_request(prompt, filter, index_name, response_format), "completion", stream)
+
+
+def run_chat_completion(messages: list, response_format="text", stream=False):
+    """Chat completion without the "data_sources" extension, used with client-side retrieval."""
+    with span("query.completion", extension=False, stream=stream):
+        return _create(build_chat_request(messages, response_format), "chat_completion", stream)
+
+
+async def arun_chat_completion(messages: list, response_format="text", stream=False):
+    with span("query.completion", extension=False, stream=stream):
+        return await _acreate(build_chat_request(messages, response_format), "chat_completion", stream)
@@ -0,0 +1,211 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from chat_completion import run_chat_completion, arun_chat_completion
+from token_utils import count_tokens, truncate_to_tokens
+
+
+# Per-message overhead of the chat format (role, separators), in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+# Summaries / standalone questions kept per session
+SESSION_CACHE_SIZE = 64
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in at most {max_words} words. Keep the facts, names, "
+    "documents, numbers and open questions needed to continue it; drop greetings and repetition. "
+    "Reply with the summary only."
+)
+
+STANDALONE_QUESTION_PROMPT = (
+    "Rewrite the user's last question as a standalone question that can be understood without "
+    "the conversation, resolving pronouns and references to earlier turns. Keep its language. "
+    "Reply with the question only."
+)
+
+
+@dataclass
+class ConversationSettings:
+    """Token budget of the conversation history sent along with a question."""
+    # Budget of the history part of the prompt (summary + recent turns)
+    max_history_tokens: int = 2000
+    # Part of that budget given to the summary of the turns that no longer fit; 0 drops them instead
+    summary_max_tokens: int = 400
+    # Rewrite follow-up questions into standalone ones before retrieval
+    condense_question: bool = True
+
+
+class ConversationContext(NamedTuple):
+    """A question ready for retrieval plus the compacted history to send with it."""
+    question: str
+    messages: Tuple[dict, ...]
+
+
+def _message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def format_transcript(messages) -> str:
+    return "\n".join(f"{m.get('role', 'user')}: {m.get('content') or ''}" for m in messages)
+
+
+def _chain_hash(previous: str, message: dict) -> str:
+    return hashlib.sha1(f"{previous}\x00{message.get('role')}\x00{message.get('content')}".encode("utf-8")).hexdigest()
+
+
+def split_history(history: List[dict], max_tokens: int) -> Tuple[List[dict], List[dict]]:
+    """
+    (older, recent): the most recent turns fitting in `max_tokens`, newest first, and the
+    turns before them. The last turn is always kept, truncated if it is alone over budget.
+    """
+    used, start = 0, len(history)
+    for i in range(len(history) - 1, -1, -1):
+        cost = _message_tokens(history[i])
+        if used + cost > max_tokens:
+            break
+        used += cost
+        start = i
+    if start == len(history) and history:
+        last = dict(history[-1])
+        last["content"] = truncate_to_tokens(last.get("content") or "", max(1, max_tokens - MESSAGE_OVERHEAD_TOKENS))
+        return history[:-1], [last]
+    return history[:start], history[start:]
+
+
+class ConversationMemory:
+    """
+    Keeps a chat history within a token budget for one session.
+
+    The newest turns are sent verbatim; older ones are folded into a running summary.
+    Summaries are cached by the exact turns they cover, so each turn of a growing chat
+    only summarizes the turns that just fell out of the budget, on top of the previous
+    summary. Standalone questions are cached the same way.
+    """
+
+    def __init__(self, settings: Optional[ConversationSettings] = None):
+        self.settings = settings or ConversationSettings()
+        self._lock = threading.Lock()
+        # chain hash of the summarized turns -> summary
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._questions: "OrderedDict[str, str]" = OrderedDict()
+
+    def _cache_get(self, cache: OrderedDict, key: str) -> Optional[str]:
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _cache_set(self, cache: OrderedDict, key: str, value: str):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > SESSION_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+            self._questions.clear()
+
+    # Planning (no I/O): what to summarize and what to ask, shared by the sync and async paths
+
+    def _split(self, history: List[dict]) -> Tuple[List[dict], List[dict]]:
+        settings = self.settings
+        budget = settings.max_history_tokens
+        if sum(_message_tokens(m) for m in history) <= budget:
+            return [], list(history)
+        return split_history(history, budget - settings.summary_max_tokens)
+
+    def _summary_plan(self, older: List[dict]) -> Tuple[Optional[str], List[dict], str]:
+        """(cached summary of the longest summarized prefix, turns still to fold in, key of the full summary)."""
+        hashes, current = [], ""
+        for message in older:
+            current = _chain_hash(current, message)
+            hashes.append(current)
+        for covered in range(len(older), 0, -1):
+            summary = self._cache_get(self._summaries, hashes[covered - 1])
+            if summary is not None:
+                return summary, older[covered:], hashes[-1]
+        return None, older, hashes[-1]
+
+    def _summary_messages(self, previous: Optional[str], turns: List[dict]) -> List[dict]:
+        max_words = max(20, int(self.settings.summary_max_tokens * 0.7))
+        transcript = format_transcript(turns)
+        if previous:
+            transcript = f"Summary of the earlier conversation: {previous}\n{transcript}"
+        return [{"role": "system", "content": SUMMARY_PROMPT.format(max_words=max_words)},
+                {"role": "user", "content": transcript}]
+
+    def _question_messages(self, question: str, messages: Tuple[dict, ...]) -> List[dict]:
+        return [{"role": "system", "content": STANDALONE_QUESTION_PROMPT},
+                {"role": "user", "content": f"Conversation:\n{format_transcript(messages)}\n\nLast question: {question}"}]
+
+    def _question_key(self, question: str, messages: Tuple[dict, ...]) -> str:
+        current = ""
+        for message in messages + ({"role": "user", "content": question},):
+            current = _chain_hash(current, message)
+        return current
+
+    def _context(self, summary: Optional[str], recent: List[dict]) -> Tuple[dict, ...]:
+        messages = tuple(recent)
+        if summary:
+            summary = truncate_to_tokens(summary, self.settings.summary_max_tokens)
+            messages = ({"role": "system", "content": f"Summary of the earlier conversation: {summary}"},) + messages
+        return messages
+
+    def _log(self, history: List[dict], messages: Tuple[dict, ...]):
+        before = sum(_message_tokens(m) for m in history)
+        after = sum(_message_tokens(m) for m in messages)
+        if after < before:
+            logger.debug(f"Conversation history compacted from {before} to {after} tokens "
+                         f"({len(history)} -> {len(messages)} messages).")
+
+    # Sync / async entry points
+
+    def prepare(self, question: str, history: Optional[List[dict]]) -> ConversationContext:
+        if not history:
+            return ConversationContext(question, ())
+        older, recent = self._split(history)
+        summary = None
+        if older and self.settings.summary_max_tokens > 0:
+            summary, pending, key = self._summary_plan(older)
+            if pending:
+                summary = run_chat_completion(self._summary_messages(summary, pending)).content or ""
+                self._cache_set(self._summaries, key, summary)
+        messages = self._context(summary, recent)
+        self._log(history, messages)
+        if not self.settings.condense_question:
+            return ConversationContext(question, messages)
+        key = self._question_key(question, messages)
+        standalone = self._cache_get(self._questions, key)
+        if standalone is None:
+            standalone = (run_chat_completion(self._question_messages(question, messages)).content or "").strip() or question
+            self._cache_set(self._questions, key, standalone)
+        return ConversationContext(standalone, messages)
+
+    async def aprepare(self, question: str, history: Optional[List[dict]]) -> ConversationContext:
+        if not history:
+            return ConversationContext(question, ())
+        older, recent = self._split(history)
+        summary = None
+        if older and self.settings.summary_max_tokens > 0:
+            summary, pending, key = self._summary_plan(older)
+            if pending:
+                summary = (await arun_chat_completion(self._summary_messages(summary, pending))).content or ""
+                self._cache_set(self._summaries, key, summary)
+        messages = self._context(summary, recent)
+        self._log(history, messages)
+        if not self.settings.condense_question:
+            return ConversationContext(question, messages)
+        key = self._question_key(question, messages)
+        standalone = self._cache_get(self._questions, key)
+        if standalone is None:
+            completion = await arun_chat_completion(self._question_messages(question, messages))
+            standalone = (completion.content or "").strip() or question
+            self._cache_set(self._questions, key, standalone)
+        return ConversationContext(standalone, messages)
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from loguru import logger
+
+from azure_search_utils.local_state import STATE_DIR
+
+
+# Maximum number of vectors kept on disk (a 1536-dim vector takes 6 KB); 0 disables the cache
+EMBEDDING_CACHE_SIZE = int(os.environ.get("RAG_EMBEDDING_CACHE_SIZE", "50000"))
+EMBEDDING_CACHE_DIR = STATE_DIR / "embedding_cache"
+
+_INITIAL_CAPACITY = 1024
+
+
+def embedding_cache_key(text: str, deployment: Optional[str], dimensions: Optional[int] = None) -> str:
+    """Vectors depend on the text, the embedding model and the requested dimensions."""
+    payload = f"{deployment or ''}\x00{dimensions or ''}\x00{text}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded cache of embedding vectors.
+
+    Vectors live in a float32 array file that is memory-mapped (one row per slot) and a
+    SQLite table maps each key to its slot, with a last-used timestamp for LRU eviction.
+    The file grows by doubling up to `max_entries` rows; once full, the least recently
+    used slots are reused. The vector size is fixed by the first vector stored: other sizes
+    go to other caches (see `get_embedding_cache`).
+
+    Several processes may share the directory: slots are allocated inside an immediate
+    SQLite transaction, after re-reading the capacity another process may have grown.
+    """
+
+    def __init__(self, path: Union[str, Path] = EMBEDDING_CACHE_DIR, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        # Transactions are explicit: BEGIN IMMEDIATE serializes writers across processes
+        self._db = sqlite3.connect(str(self.path / "index.sqlite"), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.dimensions: Optional[int] = None
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._sync()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.path / "vectors.f32"
+
+    def _sync(self):
+        """Pick up the dimensions and capacity another process (or an earlier run) stored."""
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        if self.dimensions is None:
+            self.dimensions = meta.get("dimensions")
+        capacity = meta.get("capacity", 0)
+        if self.dimensions and capacity > self._capacity:
+            self._open(capacity)
+
+    def _open(self, capacity: int):
+        if self._vectors is not None:
+            self._vectors.flush()
+        mode = "r+" if self._vectors_path.exists() else "w+"
+        if mode == "r+" and self._vectors_path.stat().st_size < capacity * self.dimensions * 4:
+            # Growing: extend the file, the existing rows keep their offsets
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(capacity * self.dimensions * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dimensions))
+        self._capacity = capacity
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('capacity', ?)", (capacity,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors of the keys that are present (copies, safe to keep)."""
+        if not keys:
+            return {}
+        # In a write transaction: no other process can reuse the slots while they are read
+        with self._lock, self._transaction():
+            found = self._slots_for(keys)
+            if found and (self._vectors is None or max(found.values()) >= self._capacity):
+                # Grown by another process
+                self._sync()
+            vectors = {}
+            if found and self._vectors is not None:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                vectors = {key: np.array(self._vectors[slot]) for key, slot in found.items()}
+        self.hits += len(vectors)
+        self.misses += len(keys) - len(vectors)
+        return vectors
+
+    def _slots_for(self, keys: Sequence[str]) -> Dict[str, int]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            part = list(keys[start:start + 500])
+            found.update(self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part).fetchall())
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]):
+        if not items:
+            return
+        with self._lock, self._transaction():
+            # Under the write lock: the slots and capacity read now cannot change until the commit
+            self._sync()
+            if self.dimensions is None:
+                self.dimensions = len(next(iter(items.values())))
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('dimensions', ?)", (self.dimensions,))
+            items = {k: v for k, v in items.items() if len(v) == self.dimensions}
+            if not items:
+                return
+            known = self._slots_for(list(items))
+            slots = self._allocate([k for k in items if k not in known], known)
+            slots.update(known)
+            now = time.time()
+            for key, slot in slots.items():
+                self._vectors[slot] = np.asarray(items[key], dtype=np.float32)
+            self._vectors.flush()
+            self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                 [(key, slot, now) for key, slot in slots.items()])
+
+    @contextmanager
+    def _transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _allocate(self, keys: List[str], keep: Dict[str, int]) -> Dict[str, int]:
+        """
+        Slot for each new key: free rows first, then the least recently used entries other than
+        `keep` (rewritten by the same call). Keys beyond the slots that can be freed get none.
+        """
+        if not keys:
+            return {}
+        keys = keys[-self.max_entries:]
+        used = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        needed = min(self.max_entries, used + len(keys))
+        if needed > self._capacity:
+            capacity = max(self._capacity, _INITIAL_CAPACITY)
+            while capacity < needed:
+                capacity *= 2
+            self._open(min(capacity, self.max_entries))
+        taken = {row[0] for row in self._db.execute("SELECT slot FROM entries")}
+        free = [slot for slot in range(self._capacity) if slot not in taken][:len(keys)]
+        evict = len(keys) - len(free)
+        if evict > 0:
+            victims = self._db.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict + len(keep),)).fetchall()
+            victims = [(key, slot) for key, slot in victims if key not in keep][:evict]
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+            free.extend(slot for _, slot in victims)
+            logger.debug(f"Embedding cache evicted {len(victims)} vectors.")
+        return dict(zip(keys, free))
+
+    def clear(self):
+        with self._lock:
+            with self._transaction():
+                self._db.execute("DELETE FROM entries")
+                self._db.execute("DELETE FROM meta")
+            self._vectors = None
+            self.dimensions, self._capacity = None, 0
+            self._vectors_path.unlink(missing_ok=True)
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._db.close()
+
+
+class CachedEmbedder:
+    """
+    Drop-in `embed_fn` that only sends the texts missing from the cache to the embedding service.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], cache: EmbeddingCache,
+                 deployment: Optional[str], dimensions: Optional[int] = None):
+        self.embed_fn = embed_fn
+        self.cache = cache
+        self.deployment = deployment
+        self.dimensions = dimensions
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_cache_key(text, self.deployment, self.dimensions) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embed_fn(list(missing.values()))
+            fresh = dict(zip(missing, vectors))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+        return [np.asarray(cached[key], dtype=np.float32).tolist() for key in keys]
+
+
+# One cache per requested vector size (None: the model's default size)
+_shared_caches: Dict[Optional[int], EmbeddingCache] = {}
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(dimensions: Optional[int] = None) -> Optional[EmbeddingCache]:
+    """
+    Process-wide cache under RAG_STATE_DIR for vectors of `dimensions` (each size has its own
+    directory), or None when RAG_EMBEDDING_CACHE_SIZE is 0.
+    """
+    if EMBEDDING_CACHE_SIZE <= 0:
+        return None
+    with _shared_cache_lock:
+        cache = _shared_caches.get(dimensions)
+        if cache is None:
+            path = EMBEDDING_CACHE_DIR if dimensions is None else EMBEDDING_CACHE_DIR / f"{dimensions}d"
+            cache = _shared_caches[dimensions] = EmbeddingCache(path)
+        return cache
+
+
+def with_embedding_cache(embed_fn: Callable[[List[str]], List[List[float]]], deployment: Optional[str],
+                         dimensions: Optional[int] = None) -> Callable[[List[str]], List[List[float]]]:
+    cache = get_embedding_cache(dimensions)
+    if cache is None or isinstance(embed_fn, CachedEmbedder):
+        return embed_fn
+    return CachedEmbedder(embed_fn, cache, deployment, dimensions)
@@ -1,25 +1,53 @@
-from typing import Optional, List, Dict, BinaryIO
-from azure.storage.blob import ContainerClient
+from typing import TYPE_CHECKING, Optional, List, Dict, Tuple, Iterable
 from azure.core.exceptions import ResourceExistsError, HttpResponseError, ResourceNotFoundError
 from azure.search.documents.indexes import SearchIndexClient, SearchIndexerClient
 
 from azure.core.credentials import AzureKeyCredential
 
-from dotenv import load_dotenv
+import asyncio
 import os
-import sys
-from azure.storage.blob import BlobServiceClient
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from loguru import logger
 
 from azure_search_utils.azure_search_index import build_azure_search_index
 from azure_search_utils.azure_search_storage_connection import data_source_connection
 from azure_search_utils.azure_search_skillset import build_skillset
-from azure_search_utils.azure_search_indexer import build_indexer
+from azure_search_utils.azure_search_indexer import build_indexer, choose_batch_size
+from azure_search_utils.indexer_status import IndexerProgress, AggregateIndexerProgress, PollBackoff
+from azure_search_utils.vector_profiles import VectorProfile, get_vector_profile
+from azure_search_utils.clients import (
+    get_blob_service_client, get_search_index_client, get_search_indexer_client, get_search_client, registry
+)
+from azure_search_utils.local_state import JsonStateFile, user_state_dir
+from retrieval import RetrievalSettings, SearchRetriever
+from ingestion import IngestionPipeline, PushIngestStats, document_parent_id
+from text_embeddings import embed_texts
+from embedding_cache import with_embedding_cache
+from telemetry import instrumented
+from azure_search_utils.provisioning_state import ProvisioningState, INDEX, DATA_SOURCE, SKILLSET, INDEXER
+from settings import load_environment
+from odata_filter import and_filters, odata_escape, title_filter
+from throttling import ThrottledClient, blob_throttle, search_throttle
+from azure_search_utils.blob_upload import (
+    UploadSettings, UploadSource, StagedUpload, Uploadable, upload_blocks, astage_stream, acommit_blocks, is_async_stream
+)
+from azure_search_utils.blob_manifest import (
+    BlobManifest, CONTENT_HASH_METADATA_KEY, UNCHANGED, CHANGED, DUPLICATE
+)
 
 
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobServiceClient, ContainerClient
+    from azure_search_utils.resource_sweeper import ResourceSweeper
+
 # Load from default .env file in current directory
-load_dotenv()
+load_environment()
 
 STORAGE_CONNECTION_STRING=os.environ.get("AZURE_BLOB_CONNECTION_STRING")
 FILE_PATH=os.environ.get("FILE_PATH")
@@ -31,74 +59,342 @@ AZURE_COGNITIVE_API_KEY=os.environ.get("AZURE_COGNITIVE_API")
 AZURE_AI_SEARCH_API_KEY = os.environ.get("AZURE_AI_SEARCH_API_KEY")
 EMBEDDING_DEPLOYMENT=os.environ.get("EMBEDDING_DEPLOYMENT")
 
-credential = AzureKeyCredential(AZURE_AI_SEARCH_API_KEY)
+credential = AzureKeyCredential(AZURE_AI_SEARCH_API_KEY)  # holds the key only, no I/O
+
+# Number of blob-prefix shards (each with its own data source and indexer) per user container
+INDEXER_SHARDS = int(os.environ.get("RAG_INDEXER_SHARDS", "1"))
+# Name of the index/skillset/indexer/container shared by all users; empty for one set per user
+SHARED_INDEX = os.environ.get("RAG_SHARED_INDEX", "")
+
+# Field of the shared index holding the owner of each chunk, set from the blob metadata of the same name
+OWNER_FIELD = "owner"
+
+# Create the user's container in the background as soon as a collection is built, instead of on first upload
+WARM_UP_CONTAINERS = os.environ.get("RAG_WARM_UP_CONTAINERS", "").lower() in ("1", "true", "yes")
+
+# Containers known to exist in this process, keyed by (storage account, container name). The
+# future of a creation in flight is shared, so concurrent sessions of a user wait for one request.
+_container_futures: Dict[Tuple[str, str], Future] = {}
+_container_lock = threading.Lock()
+_warm_up_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="container-warm-up")
+
+# Indexers with a run queued behind their current one, keyed by (search endpoint, indexer name)
+_pending_reruns: set = set()
+_rerun_lock = threading.Lock()
+_rerun_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="indexer-rerun")
+# How long a queued run waits for the current run of its indexer to finish
+INDEXER_RERUN_TIMEOUT = float(os.environ.get("RAG_INDEXER_RERUN_TIMEOUT", "1800"))
 
 
 class UserDocumentCollection:
-    def __init__(self, user_name: str):
+    def __init__(self, user_name: str, shards: Optional[int] = None, vector_profile: Optional[VectorProfile] = None,
+                 shared_index: Optional[str] = None, warm_up: Optional[bool] = None):
         self.user_name = user_name
+        # With more than one shard, blobs are spread over "shard-XX/" virtual folders and each
+        # folder is indexed by its own data source + indexer, all writing to the same index
+        self.shards = max(1, shards or INDEXER_SHARDS)
+        # Shared mode: one container/index/skillset/indexer for all users, blobs under "<user>/"
+        # and every chunk tagged with its owner, which all queries filter on
+        self.shared_index = shared_index if shared_index is not None else SHARED_INDEX
+        if self.shared_index and self.shards > 1:
+            raise ValueError("Sharded indexers cannot be combined with the shared index mode")
         self.storage_connection_string = STORAGE_CONNECTION_STRING
-        self.client = BlobServiceClient.from_connection_string(
-            str(self.storage_connection_string)
-            )
-        
-        self.index_name=self.user_name + "_index"
-        self.data_source_name = self.user_name+ "-ds"
-        self.skillset_name = self.user_name + "-ss"
-        self.indexer_name = self.user_name + "-indexer"
+
+        resource_name = self.shared_index or self.user_name
+        self.container_name = resource_name
+        self.index_name=resource_name + "_index"
+        self.data_source_name = resource_name+ "-ds"
+        self.skillset_name = resource_name + "-ss"
+        self.indexer_name = resource_name + "-indexer"
 
 
         self.search_service_endpoint=AZURE_SEARCH_SERVICE_ENDPOINT
-        self.credential=AzureKeyCredential(AZURE_AI_SEARCH_API_KEY)
+        self.credential=credential
         self.openai_resource_url=AZURE_MULTI_SERVICE_RESOURCE
         self.cognitive_api_key=AZURE_COGNITIVE_API_KEY
         self.deployment_name=EMBEDDING_DEPLOYMENT
+        # Embedding size and compression of "text_vector", shared by the index, the skill and push ingestion
+        self.vector_profile = vector_profile or get_vector_profile()
 
-        self.container = self.get_container()
+        # Content fingerprints of the uploaded blobs; unchanged files are never uploaded twice
+        self.manifest = BlobManifest(self.user_name, prefix=self.user_prefix)
+        # Off by default: a copy under another name is uploaded, so it is indexed (and cited) under its own title
+        self.skip_duplicate_content = False
+        # Block size and parallelism of large uploads
+        self.upload_settings = UploadSettings()
+        # Fingerprints of the search definitions already deployed: per user, or once for the shared resources
+        self.provisioning_state = ProvisioningState(resource_name)
+        # Files pushed straight into the index by the client-side ingestion pipeline
+        self.pushed_files = JsonStateFile(user_state_dir(self.user_name) / "pushed_files.json")
+        # Why the last index deployment was refused (an existing index with another vector size)
+        self.index_conflict: Optional[str] = None
+        # When this session last (re)started indexing: runs that ended earlier are not waited for
+        self.indexing_requested_at: Optional[datetime] = None
 
-    def get_container(self) -> ContainerClient:
+        # No network I/O here: the container is created on first use (or warmed up in the background)
+        if WARM_UP_CONTAINERS if warm_up is None else warm_up:
+            _warm_up_executor.submit(self._warm_up_container)
+
+    @property
+    def user_prefix(self) -> str:
+        return f"{self.user_name}/" if self.shared_index else ""
+
+    @property
+    def cache_scope(self) -> str:
+        # Answer caches are invalidated per scope: per user, even when the index is shared
+        return f"{self.index_name}:{self.user_name}" if self.shared_index else self.index_name
+
+    def owner_filter(self) -> Optional[str]:
+        """OData clause restricting a shared index to this user's chunks (None in per-user mode)."""
+        if not self.shared_index:
+            return None
+        return f"{OWNER_FIELD} eq '{odata_escape(self.user_name)}'"
+
+    @property
+    def client(self) -> "BlobServiceClient":
+        # Shared across all collections using the same storage account
+        return get_blob_service_client(self.storage_connection_string)
+
+    @property
+    def container(self) -> "ContainerClient":
+        return self.client.get_container_client(self.container_name)
+
+    @property
+    def _container_key(self) -> Tuple[str, str]:
+        return (str(self.storage_connection_string), self.container_name)
 
+    def ensure_container(self) -> "ContainerClient":
+        """The container client, creating the container once per process on first use."""
+        key = self._container_key
+        with _container_lock:
+            future = _container_futures.get(key)
+            owner = future is None
+            if owner:
+                future = _container_futures[key] = Future()
+        if not owner:
+            future.result()
+            return self.container
         try:
-            container_client = self.client.get_container_client(self.user_name)
-            container_client.create_container()
-            logger.info(f"Created container: '{self.user_name}'")
+            future.set_result(self.get_container())
+        except BaseException as e:
+            # Let the next caller retry instead of caching the failure
+            with _container_lock:
+                _container_futures.pop(key, None)
+            future.set_exception(e)
+            raise
+        return self.container
+
+    def _forget_deleted_container(self, error: ResourceNotFoundError) -> bool:
+        """
+        True (and the container no longer cached as existing) when `error` says the container
+        is gone, e.g. deleted by another process or by the resource sweeper.
+        """
+        if getattr(error, "error_code", None) != "ContainerNotFound" and "ContainerNotFound" not in str(error):
+            return False
+        with _container_lock:
+            _container_futures.pop(self._container_key, None)
+        self.manifest.clear()
+        logger.warning(f"⚠️ Container '{self.container_name}' was deleted; creating it again.")
+        return True
+
+    def _warm_up_container(self):
+        try:
+            self.ensure_container()
+        except Exception as e:
+            logger.warning(f"⚠️ Background creation of container '{self.container_name}' failed, retrying on first upload: {e}")
+
+    @instrumented("blob.create_container")
+    def get_container(self) -> "ContainerClient":
+
+        try:
+            container_client = self.container
+            self.blob_throttle.call(container_client.create_container)
+            logger.info(f"Created container: '{self.container_name}'")
+            # A fresh container holds nothing, whatever the local manifest remembers
+            self.manifest.clear()
         except Exception as e:
             if "ContainerAlreadyExists" in str(e):
-                logger.info(f"Container '{self.user_name}' already exists.")
+                logger.info(f"Container '{self.container_name}' already exists.")
             else:
-                logger.error(f"Error creating container '{self.user_name}': {e}")
+                logger.error(f"Error creating container '{self.container_name}': {e}")
                 raise
         return container_client
     
 
+    @instrumented("blob.delete_container")
     def delete_container(self): 
 
+        with _container_lock:
+            _container_futures.pop(self._container_key, None)
         try:
             self.container.delete_container()
-            logger.info(f"Deleted the container: '{self.user_name}'")
+            self.manifest.clear()
+            logger.info(f"Deleted the container: '{self.container_name}'")
         except ResourceNotFoundError:
-            logger.warning(f"⚠️ Container '{self.user_name}' not found. Nothing to delete.")
+            logger.warning(f"⚠️ Container '{self.container_name}' not found. Nothing to delete.")
             return False
         except HttpResponseError as e:
             status = getattr(getattr(e, "response", None), "status_code", "?")
             code = getattr(e, "error_code", "?")
-            logger.error(f"❌ Failed to delete container '{self.user_name}' (status={status}, code={code}): {e}")
+            logger.error(f"❌ Failed to delete container '{self.container_name}' (status={status}, code={code}): {e}")
             return False
         except Exception as e:
-            logger.exception(f"❌ Unexpected error while deleting container '{self.user_name}': {e}")
+            logger.exception(f"❌ Unexpected error while deleting container '{self.container_name}': {e}")
             return False
 
+
+    def shard_prefix(self, shard: int) -> str:
+        return f"shard-{shard:02d}/"
+
+    def blob_name(self, file_name: str) -> str:
+        """Name of the blob holding `file_name`: stable across uploads, so re-uploads land in the same shard."""
+        if self.shards == 1:
+            return self.user_prefix + file_name
+        shard = zlib.crc32(file_name.encode("utf-8")) % self.shards
+        return self.shard_prefix(shard) + file_name
+
     
-    def add_file_to_blob_container(self, file_path : str, file: BinaryIO):
-        container = self.container
+    @instrumented("blob.upload")
+    def add_file_to_blob_container(self, file_path : str, file: Uploadable):
+        """
+        Upload a file unless the container already holds the same content.
+
+        Every blob carries the SHA-256 of its bytes in its metadata and in the local manifest.
+        A file whose name exists with a different hash is overwritten (so the indexer picks up
+        the edit); a file whose bytes are already stored under another name is only skipped
+        when `skip_duplicate_content` is set.
+        `file` is a binary file, read from its current position, or the bytes themselves.
+        Anything larger than one block is staged in parallel blocks (local files through a
+        memory map) and an interrupted upload of the same bytes resumes from the staged blocks.
+        Returns True when something was uploaded. If the container was deleted behind this
+        process's back, it is created again and the upload retried once.
+        """
+        try:
+            return self._add_file(file_path, file)
+        except ResourceNotFoundError as e:
+            if not self._forget_deleted_container(e):
+                raise
+            return self._add_file(file_path, file)
+
+    def _add_file(self, file_path: str, file: Uploadable) -> bool:
+        container = self.ensure_container()
+        file_name = Path(file_path).name
+        blob_name = self.blob_name(file_name)
+        settings = self.upload_settings
+        with self.manifest.blob_lock(blob_name), UploadSource(file, settings.use_mmap) as source:
+            staged = source.fingerprint(settings.block_size)
+            state = self.manifest.classify(container, blob_name, staged.content_hash)
+            if self._skip_upload(state, file_name, staged.content_hash):
+                return False
+
+            metadata = self._blob_metadata(staged.content_hash)
+            try:
+                self._upload_source(container, blob_name, source, staged, metadata, overwrite=(state == CHANGED))
+            except ResourceExistsError:
+                # The blob predates the manifest: compare against its stored fingerprint
+                if self._stored_hash(container, blob_name) == staged.content_hash:
+                    self.manifest.record(blob_name, staged.content_hash)
+                    logger.warning(f"File '{file_name}' already exists in container '{self.container_name}'. Skipping upload.")
+                    return False
+                self._upload_source(container, blob_name, source, staged, metadata, overwrite=True)
+
+            self._uploaded(file_name, blob_name, staged, state)
+        return True  # uploaded now
+
+    @instrumented("blob.upload")
+    async def aadd_file_to_blob_container(self, file_path: str, file) -> bool:
+        """
+        Async `add_file_to_blob_container`, which also takes an async stream (a web upload:
+        anything with an async `read(n)`, or an async iterable of bytes). A stream is staged
+        block by block as it arrives, so large files never go through a temporary file and
+        memory stays around `max_concurrency + 1` blocks.
+        """
+        if not is_async_stream(file):
+            return await asyncio.to_thread(self.add_file_to_blob_container, file_path, file)
+        container = await asyncio.to_thread(self.ensure_container)
         file_name = Path(file_path).name
+        blob_name = self.blob_name(file_name)
+        blob_client = self.async_container.get_blob_client(blob_name)
         try:
-            container.upload_blob(file_name, file, overwrite=False)
-            logger.info(f"Uploaded '{file_name}' to container '{self.user_name}'.")
-            return True  # uploaded now
-        except ResourceExistsError as e:
-            logger.warning(f"File '{file_name}' already exists in container '{self.user_name}'. Skipping upload.")
-            return False  # already there
+            staged = await astage_stream(blob_client, file, self.upload_settings, self.blob_throttle)
+        except ResourceNotFoundError as e:
+            # The part of the stream already read cannot be replayed: the next upload recreates the container
+            self._forget_deleted_container(e)
+            raise
+        if staged.data is not None:
+            # Fits in a single put
+            return await asyncio.to_thread(self.add_file_to_blob_container, file_path, staged.data)
+
+        lock = self.manifest.blob_lock(blob_name)
+        await asyncio.to_thread(lock.acquire)
+        try:
+            state = await asyncio.to_thread(self.manifest.classify, container, blob_name, staged.content_hash)
+            # Skipped uploads leave their blocks uncommitted; the service discards them after a week
+            if self._skip_upload(state, file_name, staged.content_hash):
+                return False
+            metadata = self._blob_metadata(staged.content_hash)
+            try:
+                await acommit_blocks(blob_client, staged, metadata, overwrite=(state == CHANGED), throttle=self.blob_throttle)
+            except ResourceExistsError:
+                if await asyncio.to_thread(self._stored_hash, container, blob_name) == staged.content_hash:
+                    self.manifest.record(blob_name, staged.content_hash)
+                    logger.warning(f"File '{file_name}' already exists in container '{self.container_name}'. Skipping upload.")
+                    return False
+                await acommit_blocks(blob_client, staged, metadata, overwrite=True, throttle=self.blob_throttle)
+            self._uploaded(file_name, blob_name, staged, state)
+        finally:
+            lock.release()
+        return True
+
+    @property
+    def blob_throttle(self):
+        # Retries and adaptive concurrency shared by every upload to the storage account
+        return blob_throttle(self.storage_connection_string)
+
+    @property
+    def async_container(self):
+        return registry.async_blob_service_client(self.storage_connection_string).get_container_client(self.container_name)
+
+    def _skip_upload(self, state: str, file_name: str, content_hash: str) -> bool:
+        if state == UNCHANGED:
+            logger.info(f"File '{file_name}' is unchanged in container '{self.container_name}'. Skipping upload.")
+            return True
+        if state == DUPLICATE and self.skip_duplicate_content:
+            original = self.manifest.name_for_hash(content_hash)
+            logger.warning(f"File '{file_name}' has the same content as '{original}' in container '{self.container_name}'. Skipping upload.")
+            return True
+        return False
+
+    def _blob_metadata(self, content_hash: str) -> dict:
+        metadata = {CONTENT_HASH_METADATA_KEY: content_hash}
+        if self.shared_index:
+            metadata[OWNER_FIELD] = self.user_name
+        return metadata
+
+    def _stored_hash(self, container: "ContainerClient", blob_name: str) -> Optional[str]:
+        properties = container.get_blob_client(blob_name).get_blob_properties()
+        return (properties.metadata or {}).get(CONTENT_HASH_METADATA_KEY)
+
+    def _upload_source(self, container: "ContainerClient", blob_name: str, source: UploadSource,
+                       staged: StagedUpload, metadata: dict, overwrite: bool):
+        if len(staged.block_ids) == 1:
+            self.blob_throttle.call(container.upload_blob, blob_name, source.read_all(), overwrite=overwrite, metadata=metadata)
+        else:
+            upload_blocks(container.get_blob_client(blob_name), source, staged, metadata, overwrite,
+                          self.upload_settings, self.blob_throttle)
+
+    def _uploaded(self, file_name: str, blob_name: str, staged: StagedUpload, state: str):
+        self.manifest.record(blob_name, staged.content_hash)
+        action = "Re-uploaded changed" if state == CHANGED else "Uploaded"
+        blocks = f" in {len(staged.block_ids)} blocks" if len(staged.block_ids) > 1 else ""
+        logger.info(f"{action} '{file_name}' to container '{self.container_name}'{blocks}.")
+
+
+    def list_documents(self) -> List[str]:
+        """File names (index titles) of the user's documents: uploaded blobs and pushed files."""
+        names = {blob.rsplit("/", 1)[-1] for blob in self.manifest.load(self.ensure_container())}
+        names.update(self.pushed_files.load())
+        return sorted(names)
 
 
     def get_index_config(self) -> dict:
@@ -114,29 +410,69 @@ class UserDocumentCollection:
         return required
         
 
+    @property
+    def search_throttle(self):
+        # Retries and adaptive concurrency shared by every call to the Search service
+        return search_throttle(self.search_service_endpoint)
+
     @property
     def search_index_client(self) -> SearchIndexClient:
-        return SearchIndexClient(
-            endpoint=self.search_service_endpoint,
-            credential=self.credential
-        )
+        return ThrottledClient(get_search_index_client(self.search_service_endpoint, self.credential), self.search_throttle)
     
     
-    def create_user_search_index(self):
+    def build_index_definition(self):
+        index_config = self.get_index_config()
+        return build_azure_search_index(**index_config, vector_profile=self.vector_profile,
+                                        owner_field=OWNER_FIELD if self.shared_index else None)
+
+
+    @instrumented("search.create_index")
+    def create_user_search_index(self) -> bool:
+        """
+        Create or update the index. Refused (False, with `index_conflict` set) when the index
+        exists with another vector size: the service cannot change the dimensions of a field,
+        and a skillset pushed with the new size would make every document fail.
+        """
+        self.index_conflict = None
         try:
-            index_config = self.get_index_config()
-            index = build_azure_search_index(**index_config)  
+            index = self.build_index_definition()
+            existing = self._existing_vector_dimensions()
+            if existing is not None and existing != self.vector_profile.dimensions:
+                self.index_conflict = (
+                    f"Index '{self.index_name}' holds {existing}-dimension vectors but the vector profile "
+                    f"'{self.vector_profile.name}' uses {self.vector_profile.dimensions}; delete the index "
+                    f"(logout pipeline) to rebuild it, or keep the previous profile."
+                )
+                logger.error(f"❌ {self.index_conflict}")
+                return False
             result = self.search_index_client.create_or_update_index(index)
+            self.provisioning_state.mark_deployed(INDEX, index)
             logger.info(f"✅ Index '{result.name}' created or updated successfully.")
+            return True
         except HttpResponseError as e:
             logger.error(f"❌ Failed to create index '{self.index_name}': {e.message}")
         except Exception as e:
             logger.exception(f"❌ Unexpected error while creating index '{self.index_name}': {str(e)}")
+        return False
+
+
 
 
+    def _existing_vector_dimensions(self) -> Optional[int]:
+        try:
+            index = self.search_index_client.get_index(self.index_name)
+        except ResourceNotFoundError:
+            return None
+        for search_field in index.fields or []:
+            if search_field.name == "text_vector":
+                return search_field.vector_search_dimensions
+        return None
 
 
+    @instrumented("search.delete_index")
     def delete_user_search_index(self) :
+        self.provisioning_state.forget(INDEX)
+        self.pushed_files.delete()
         try:
             self.search_index_client.delete_index(self.index_name)
             logger.info(f"🗑️ Index '{self.index_name}' deleted successfully.")
@@ -151,28 +487,35 @@ class UserDocumentCollection:
 
     @property
     def search_indexer_client(self) -> SearchIndexerClient:
-        return SearchIndexerClient(
-            endpoint=self.search_service_endpoint,
-            credential=self.credential
-        )
+        return ThrottledClient(get_search_indexer_client(self.search_service_endpoint, self.credential), self.search_throttle)
     
     
-    def create_data_source_connection(self):
+    def build_data_source_definition(self):
+        return data_source_connection(
+            data_source_name=self.data_source_name,
+            container_name=self.container_name,
+            storage_connection_string=self.storage_connection_string
+        )
+
+
+    @instrumented("search.create_data_source")
+    def create_data_source_connection(self) -> bool:
         try:
-            data_source = data_source_connection(
-                data_source_name=self.data_source_name,
-                container_name=self.user_name,
-                storage_connection_string=self.storage_connection_string
-            )
+            data_source = self.build_data_source_definition()
             result = self.search_indexer_client.create_or_update_data_source_connection(data_source)
+            self.provisioning_state.mark_deployed(DATA_SOURCE, data_source)
             logger.info(f"✅ Data source connection '{result.name}' created or updated successfully.")
+            return True
         except HttpResponseError as e:
             logger.error(f"❌ Failed to create data source connection '{self.data_source_name}': {e.message}")
         except Exception as e:
             logger.exception(f"❌ Unexpected error while creating data source connection '{self.data_source_name}': {str(e)}")
+        return False
 
 
+    @instrumented("search.delete_data_source")
     def delete_data_source_connection(self):
+        self.provisioning_state.forget(DATA_SOURCE)
         try:
             self.search_indexer_client.delete_data_source_connection(self.data_source_name)
             logger.info(f"🗑️ Data source connection '{self.data_source_name}' deleted successfully.")
@@ -191,6 +534,8 @@ class UserDocumentCollection:
             "index_name": self.index_name,
             "openai_resource_url": self.openai_resource_url,
             "cognitive_api_key": self.cognitive_api_key,
+            # The skill must embed with the deployment the index vectorizer queries with
+            "deployment_name": self.deployment_name,
         }
         for key, val in required.items():
             if not val:
@@ -199,20 +544,30 @@ class UserDocumentCollection:
     
 
 
-    def create_user_skillset(self):
+    def build_skillset_definition(self):
+        skillset_config = self.get_skillset_config()
+        return build_skillset(**skillset_config, embedding_dimensions=self.vector_profile.requested_dimensions,
+                              owner_field=OWNER_FIELD if self.shared_index else None)
+
+
+    @instrumented("search.create_skillset")
+    def create_user_skillset(self) -> bool:
         try:
-            skillset_config = self.get_skillset_config()
-           
-            skillset = build_skillset(**skillset_config)
+            skillset = self.build_skillset_definition()
             result = self.search_indexer_client.create_or_update_skillset(skillset)
+            self.provisioning_state.mark_deployed(SKILLSET, skillset)
             logger.info(f"✅ Skillset '{result.name}' created or updated successfully.")
+            return True
         except HttpResponseError as e:
             logger.error(f"❌ Failed to create skillset '{self.skillset_name}': {e.message}")
         except Exception as e:
             logger.exception(f"❌ Unexpected error while creating skillset '{self.skillset_name}': {str(e)}")
+        return False
 
 
+    @instrumented("search.delete_skillset")
     def delete_user_skillset(self):
+        self.provisioning_state.forget(SKILLSET)
         try:
             self.search_indexer_client.delete_skillset(self.skillset_name)
             logger.info(f"🗑️ Skillset '{self.skillset_name}' deleted successfully.")
@@ -225,23 +580,112 @@ class UserDocumentCollection:
             logger.exception(f"❌ Unexpected error while deleting skillset '{self.skillset_name}': {str(e)}")
 
         
-    def create_user_indexer(self):
+    def build_indexer_definition(self):
+        return build_indexer(
+            indexer_name=self.indexer_name,
+            skillset_name=self.skillset_name,
+            index_name=self.index_name,
+            data_source_name=self.data_source_name
+        )
+
+
+    @instrumented("search.create_indexer")
+    def create_user_indexer(self) -> bool:
         try:
-            indexer = build_indexer(
-                indexer_name=self.indexer_name,
-                skillset_name=self.skillset_name,
-                index_name=self.index_name,
-                data_source_name=self.data_source_name
-            )
+            indexer = self.build_indexer_definition()
             result = self.search_indexer_client.create_or_update_indexer(indexer)
+            self.provisioning_state.mark_deployed(INDEXER, indexer)
             logger.info(f"✅ Indexer '{result.name}' created or updated successfully.")
+            return True
         except HttpResponseError as e:
             logger.error(f"❌ Failed to create indexer '{self.indexer_name}': {e.message}")
         except Exception as e:
             logger.exception(f"❌ Unexpected error while creating indexer '{self.indexer_name}': {str(e)}")
+        return False
 
 
+    @instrumented("search.run_indexer")
+    def run_user_indexer(self) -> bool:
+        """Start an on-demand run of the user's indexer. Returns False if it could not be started."""
+        try:
+            return self._start_indexer()
+        except ResourceNotFoundError:
+            logger.warning(f"⚠️ Indexer '{self.indexer_name}' not found. Cannot run it.")
+            return False
+
+    def _start_indexer(self) -> bool:
+        """`run_user_indexer` that raises ResourceNotFoundError when the indexer does not exist."""
+        try:
+            self.search_indexer_client.run_indexer(self.indexer_name)
+            logger.info(f"▶️ Indexer '{self.indexer_name}' run started.")
+            return True
+        except ResourceNotFoundError:
+            raise
+        except HttpResponseError as e:
+            if e.status_code == 409:
+                self._queue_indexer_rerun(self.indexer_name)
+                return True
+            logger.error(f"❌ Failed to run indexer '{self.indexer_name}': {e.message}")
+            return False
+
+    def _queue_indexer_rerun(self, indexer_name: str):
+        """
+        The indexer is already running (409) and may have listed the container before the new
+        blobs landed: run it again once the current run finishes. At most one run is queued
+        per indexer, however many uploads meet the running indexer in the meantime.
+        """
+        key = (str(self.search_service_endpoint), indexer_name)
+        with _rerun_lock:
+            if key in _pending_reruns:
+                return
+            _pending_reruns.add(key)
+        logger.info(f"Indexer '{indexer_name}' is already running; another run is queued after it.")
+        _rerun_executor.submit(self._rerun_when_idle, indexer_name, key)
+
+    def _rerun_when_idle(self, indexer_name: str, key: Tuple[str, str], poll_interval: float = 1.0,
+                         max_poll_interval: float = 15.0):
+        client = self.search_indexer_client
+        deadline = time.monotonic() + INDEXER_RERUN_TIMEOUT
+        backoff = PollBackoff(poll_interval, max_poll_interval)
+        queued = True
+        try:
+            while True:
+                progress = AggregateIndexerProgress(
+                    [IndexerProgress.from_status(indexer_name, client.get_indexer_status(indexer_name))]
+                )
+                if progress.done:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"⚠️ Indexer '{indexer_name}' still running after {INDEXER_RERUN_TIMEOUT:.0f}s; "
+                                   f"dropping its queued run.")
+                    return
+                time.sleep(min(backoff.next(progress), remaining))
+            # Uploads from now on queue a new run behind this one
+            with _rerun_lock:
+                _pending_reruns.discard(key)
+                queued = False
+            client.run_indexer(indexer_name)
+            logger.info(f"▶️ Queued run of indexer '{indexer_name}' started.")
+        except ResourceNotFoundError:
+            logger.warning(f"⚠️ Indexer '{indexer_name}' not found. Dropping its queued run.")
+        except HttpResponseError as e:
+            if e.status_code == 409:
+                # Started by another process in the meantime, after the new blobs landed
+                logger.info(f"Indexer '{indexer_name}' was started by someone else.")
+            else:
+                logger.error(f"❌ Failed to start the queued run of indexer '{indexer_name}': {e.message}")
+        except Exception as e:
+            logger.exception(f"❌ Unexpected error in the queued run of indexer '{indexer_name}': {str(e)}")
+        finally:
+            if queued:
+                with _rerun_lock:
+                    _pending_reruns.discard(key)
+
+
+    @instrumented("search.delete_indexer")
     def delete_user_indexer(self):
+        self.provisioning_state.forget(INDEXER)
         try:
             self.search_indexer_client.delete_indexer(self.indexer_name)
             logger.info(f"🗑️ Indexer '{self.indexer_name}' deleted successfully.")
@@ -254,23 +698,412 @@ class UserDocumentCollection:
             logger.exception(f"❌ Unexpected error while deleting indexer '{self.indexer_name}': {str(e)}")
 
 
-    def setup_user_index_pipeline(self):
-        self.create_user_search_index()
-        self.create_data_source_connection()
-        self.create_user_skillset()
-        self.create_user_indexer()
+    def get_retriever(self, settings: Optional[RetrievalSettings] = None) -> SearchRetriever:
+        """Client-side retriever over the user's index (used by the "client" retrieval mode)."""
+        return SearchRetriever(self.search_service_endpoint, self.index_name, self.credential, settings)
+
+
+    @instrumented("ingest.push_files")
+    def push_files_to_index(self, files: List[str], **pipeline_options) -> PushIngestStats:
+        """
+        Index local files with the client-side `IngestionPipeline` instead of the blob
+        container + indexer + skillset: text is extracted, chunked and embedded here and
+        the chunks are pushed to the user's index with batched `upload_documents`.
+        Unchanged files (by content hash) are skipped.
+        """
+        if not self.provisioning_state.is_current(INDEX, self.build_index_definition()):
+            if not self.create_user_search_index() and self.index_conflict:
+                return PushIngestStats(files=len(files), failed_files={Path(f).name: self.index_conflict for f in files})
+        search_client = get_search_client(self.search_service_endpoint, self.index_name, self.credential)
+        # Chunks embedded before (e.g. by a previous session of this user) are served from the local cache
+        dimensions = self.vector_profile.requested_dimensions
+        embed_fn = with_embedding_cache(partial(embed_texts, dimensions=dimensions), self.deployment_name, dimensions)
+        if self.shared_index:
+            pipeline_options.setdefault("owner", self.user_name)
+        pipeline = IngestionPipeline(search_client, embed_fn, **pipeline_options)
+        with self.pushed_files.lock:
+            known_files = self.pushed_files.load()
+            self._delete_indexer_chunks(search_client, [Path(f).name for f in files if Path(f).name not in known_files])
+            stats = pipeline.run(files, known_files=known_files)
+            known_files.update(stats.pushed)
+            self.pushed_files.save(known_files)
+        return stats
+
+
+    def _delete_indexer_chunks(self, search_client, titles: List[str]) -> int:
+        """
+        Delete the chunks the indexer wrote for these titles before they are first pushed:
+        its keys (from the index projection) never match the pushed ones, so both copies
+        would otherwise stay in the index.
+        """
+        if not titles:
+            return 0
+        pushed_parents = {document_parent_id(f"{self.user_name}/{t}" if self.shared_index else t) for t in titles}
+        keys = []
+        try:
+            for start in range(0, len(titles), 100):
+                document_filter = and_filters(self.owner_filter(), title_filter(titles[start:start + 100]))
+                keys.extend({"chunk_id": r["chunk_id"]} for r in search_client.search(
+                    search_text="*", filter=document_filter, select=["chunk_id", "parent_id"])
+                    if r["parent_id"] not in pushed_parents)
+            for start in range(0, len(keys), 1000):
+                search_client.delete_documents(keys[start:start + 1000])
+        except HttpResponseError as e:
+            logger.error(f"❌ Failed to delete the indexed copies of the pushed files of '{self.user_name}': {e.message}")
+            return 0
+        if keys:
+            indexed_blobs = {blob.rsplit("/", 1)[-1] for blob in self.manifest.load(self.ensure_container())}
+            logger.info(f"🗑️ Deleted {len(keys)} indexer chunks of files now pushed by '{self.user_name}'.")
+            for title in sorted(indexed_blobs & set(titles)):
+                logger.warning(f"⚠️ '{title}' is also a blob of container '{self.container_name}': "
+                               f"the next indexer run indexes it again.")
+        return len(keys)
+
+    def shard_data_source_name(self, shard: int) -> str:
+        return f"{self.data_source_name}-{shard:02d}"
+
+    def shard_indexer_name(self, shard: int) -> str:
+        return f"{self.indexer_name}-{shard:02d}"
+
+    def shard_batch_size(self, shard: int) -> int:
+        blobs = list(self.ensure_container().list_blobs(name_starts_with=self.shard_prefix(shard)))
+        if not blobs:
+            return 1
+        return choose_batch_size(len(blobs), sum(blob.size or 0 for blob in blobs) / len(blobs))
+
+    def build_shard_data_source_definition(self, shard: int):
+        return data_source_connection(
+            data_source_name=self.shard_data_source_name(shard),
+            container_name=self.container_name,
+            storage_connection_string=self.storage_connection_string,
+            query=self.shard_prefix(shard)
+        )
+
+    def build_shard_indexer_definition(self, shard: int, batch_size: int = 1):
+        return build_indexer(
+            indexer_name=self.shard_indexer_name(shard),
+            skillset_name=self.skillset_name,
+            index_name=self.index_name,
+            data_source_name=self.shard_data_source_name(shard),
+            batch_size=batch_size
+        )
+
+    @instrumented("search.deploy_shard")
+    def _deploy_shard(self, shard: int) -> bool:
+        """Push the shard's data source and indexer if they changed, otherwise run the indexer. Returns True once started."""
+        client = self.search_indexer_client
+        data_source = self.build_shard_data_source_definition(shard)
+        indexer = self.build_shard_indexer_definition(shard, self.shard_batch_size(shard))
+        data_source_kind, indexer_kind = f"{DATA_SOURCE}-{shard:02d}", f"{INDEXER}-{shard:02d}"
+        try:
+            if not self.provisioning_state.is_current(data_source_kind, data_source):
+                client.create_or_update_data_source_connection(data_source)
+                self.provisioning_state.mark_deployed(data_source_kind, data_source)
+            if not self.provisioning_state.is_current(indexer_kind, indexer):
+                # Creating (or updating) an indexer starts a run on its own
+                client.create_or_update_indexer(indexer)
+                self.provisioning_state.mark_deployed(indexer_kind, indexer)
+                logger.info(f"✅ Indexer '{indexer.name}' created or updated (batch size {indexer.parameters.batch_size}).")
+                return True
+            client.run_indexer(indexer.name)
+            logger.info(f"▶️ Indexer '{indexer.name}' run started.")
+            return True
+        except ResourceNotFoundError:
+            # Stale provisioning state: the shard was removed outside this process
+            self.provisioning_state.forget(data_source_kind)
+            self.provisioning_state.forget(indexer_kind)
+            logger.warning(f"⚠️ Indexer '{indexer.name}' not found; it will be redeployed on the next setup.")
+        except HttpResponseError as e:
+            if e.status_code == 409:
+                self._queue_indexer_rerun(indexer.name)
+                return True
+            logger.error(f"❌ Failed to deploy or run indexer '{indexer.name}': {e.message}")
+        return False
+
+    def setup_sharded_index_pipeline(self, max_workers: Optional[int] = None) -> int:
+        """
+        Deploy the shared index and skillset, then one data source + indexer per shard,
+        all started in parallel. Returns the number of shard indexers that were started.
+        """
+        self.indexing_requested_at = datetime.now(timezone.utc)
+        if not self.provisioning_state.is_current(INDEX, self.build_index_definition()):
+            if not self.create_user_search_index() and self.index_conflict:
+                return 0
+        if not self.provisioning_state.is_current(SKILLSET, self.build_skillset_definition()):
+            self.create_user_skillset()
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.shards) as executor:
+            started = sum(executor.map(self._deploy_shard, range(self.shards)))
+        logger.info(f"Started {started}/{self.shards} indexers for '{self.user_name}'.")
+        return started
+
+    def indexer_names(self) -> List[str]:
+        if self.shards == 1:
+            return [self.indexer_name]
+        return [self.shard_indexer_name(shard) for shard in range(self.shards)]
+
+    def _poll_indexer_progress(self) -> AggregateIndexerProgress:
+        names = self.indexer_names()
+        client = self.search_indexer_client
+        if len(names) == 1:
+            statuses = [client.get_indexer_status(names[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(names)) as executor:
+                statuses = list(executor.map(client.get_indexer_status, names))
+        return AggregateIndexerProgress([IndexerProgress.from_status(n, s) for n, s in zip(names, statuses)])
+
+    async def _apoll_indexer_progress(self) -> AggregateIndexerProgress:
+        names = self.indexer_names()
+        client = ThrottledClient(registry.async_search_indexer_client(self.search_service_endpoint, self.credential),
+                                 self.search_throttle)
+        statuses = await asyncio.gather(*(client.get_indexer_status(name) for name in names))
+        return AggregateIndexerProgress([IndexerProgress.from_status(n, s) for n, s in zip(names, statuses)])
+
+    def get_indexer_progress(self) -> AggregateIndexerProgress:
+        """Status of the last run of every indexer of the user (one per shard), with aggregate throughput."""
+        progress = self._poll_indexer_progress()
+        logger.info(f"Indexing progress for '{self.user_name}': {progress.summary()}")
+        return progress
+
+    def _indexing_finished(self, progress: AggregateIndexerProgress) -> bool:
+        return progress.finished_since(self.indexing_requested_at)
 
+    def _log_indexing_result(self, progress: AggregateIndexerProgress, timed_out: bool):
+        if timed_out:
+            logger.warning(f"⚠️ Timed out waiting for the indexing of '{self.user_name}': {progress.summary()}")
+            return
+        if progress.failed_item_count or not all(shard.succeeded for shard in progress.shards):
+            errors = "; ".join(f"{key}: {message}" for key, message in progress.errors.items())
+            logger.warning(f"⚠️ Indexing of '{self.user_name}' finished with failures: {progress.summary()}"
+                           + (f" - {errors}" if errors else ""))
+        else:
+            logger.info(f"✅ Index '{self.index_name}' is ready for '{self.user_name}': {progress.summary()}")
 
+    @instrumented("search.wait_until_indexed")
+    def wait_until_indexed(self, timeout: float = 600.0, poll_interval: float = 1.0,
+                           max_poll_interval: float = 15.0) -> Optional[AggregateIndexerProgress]:
+        """
+        Block until the indexer runs started by the last setup of this session have finished,
+        or `timeout` seconds have passed. Status is polled every `poll_interval` seconds while the
+        indexer makes progress, backing off up to `max_poll_interval` while it does not.
+
+        Returns the final progress: `finished_since(self.indexing_requested_at)` is False on
+        timeout, `succeeded_item_count` / `failed_item_count` count documents and `errors` maps
+        each failed document key to its error. Returns None when the user has no indexer.
+        """
+        deadline = time.monotonic() + timeout
+        backoff = PollBackoff(poll_interval, max_poll_interval)
+        try:
+            while True:
+                progress = self._poll_indexer_progress()
+                remaining = deadline - time.monotonic()
+                if self._indexing_finished(progress) or remaining <= 0:
+                    break
+                time.sleep(min(backoff.next(progress), remaining))
+        except ResourceNotFoundError:
+            logger.warning(f"⚠️ No indexer deployed for '{self.user_name}'. Nothing to wait for.")
+            return None
+        self._log_indexing_result(progress, timed_out=not self._indexing_finished(progress))
+        return progress
+
+    @instrumented("search.wait_until_indexed")
+    async def await_until_indexed(self, timeout: float = 600.0, poll_interval: float = 1.0,
+                                  max_poll_interval: float = 15.0) -> Optional[AggregateIndexerProgress]:
+        """Async `wait_until_indexed`: polls with the async indexer client and sleeps without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        backoff = PollBackoff(poll_interval, max_poll_interval)
+        try:
+            while True:
+                progress = await self._apoll_indexer_progress()
+                remaining = deadline - loop.time()
+                if self._indexing_finished(progress) or remaining <= 0:
+                    break
+                await asyncio.sleep(min(backoff.next(progress), remaining))
+        except ResourceNotFoundError:
+            logger.warning(f"⚠️ No indexer deployed for '{self.user_name}'. Nothing to wait for.")
+            return None
+        self._log_indexing_result(progress, timed_out=not self._indexing_finished(progress))
+        return progress
+
+    def _delete_shard_resource(self, kind: str, name: str, delete):
+        self.provisioning_state.forget(kind)
+        try:
+            delete(name)
+            logger.info(f"🗑️ '{name}' deleted successfully.")
+        except ResourceNotFoundError:
+            logger.warning(f"⚠️ '{name}' not found. Nothing to delete.")
+        except HttpResponseError as e:
+            logger.error(f"❌ Failed to delete '{name}': {e.message}")
+
+    def delete_shard_indexers(self):
+        client = self.search_indexer_client
+        for shard in range(self.shards):
+            self._delete_shard_resource(f"{INDEXER}-{shard:02d}", self.shard_indexer_name(shard), client.delete_indexer)
+
+    def delete_shard_data_sources(self):
+        client = self.search_indexer_client
+        for shard in range(self.shards):
+            self._delete_shard_resource(f"{DATA_SOURCE}-{shard:02d}", self.shard_data_source_name(shard),
+                                        client.delete_data_source_connection)
+
+    def delete_shard_resources(self):
+        # Indexers first: they reference the data sources
+        self.delete_shard_indexers()
+        self.delete_shard_data_sources()
+
+    @instrumented("ingest.setup_index_pipeline")
+    def setup_user_index_pipeline(self, incremental: bool = True):
+        """
+        Deploy the index, data source, skillset and indexer for the user.
+
+        In incremental mode each definition is fingerprinted and only pushed when it differs
+        from the fingerprint cached at its last successful deployment. When the indexer itself
+        was not pushed (the common case of adding files to an existing collection) it is just
+        run on demand, so the whole setup costs a single call.
+        Sharded collections deploy one data source and indexer per shard instead.
+        """
+        # The data sources point at the container: a no-op once it is known to exist
+        self.ensure_container()
+        self.indexing_requested_at = datetime.now(timezone.utc)
+        if self.shards > 1:
+            if not incremental:
+                self.provisioning_state.clear()
+            self.setup_sharded_index_pipeline()
+            return
+
+        if not incremental:
+            if not self.create_user_search_index() and self.index_conflict:
+                return
+            self.create_data_source_connection()
+            self.create_user_skillset()
+            self.create_user_indexer()
+            return
+
+        steps = [
+            (INDEX, self.build_index_definition, self.create_user_search_index),
+            (DATA_SOURCE, self.build_data_source_definition, self.create_data_source_connection),
+            (SKILLSET, self.build_skillset_definition, self.create_user_skillset),
+            (INDEXER, self.build_indexer_definition, self.create_user_indexer),
+        ]
+        indexer_pushed = False
+        for kind, build_definition, create in steps:
+            try:
+                definition = build_definition()
+            except Exception as e:
+                # e.g. a missing setting: logged like the full setup does, and the next steps still run
+                logger.exception(f"❌ Unexpected error while building the {kind.replace('_', ' ')} for "
+                                 f"'{self.user_name}': {str(e)}")
+                continue
+            if self.provisioning_state.is_current(kind, definition):
+                logger.info(f"{kind.replace('_', ' ').capitalize()} '{definition.name}' is up to date.")
+                continue
+            pushed = create()
+            if kind == INDEX and not pushed and self.index_conflict:
+                # Nothing that embeds with the new size may be deployed
+                return
+            if kind == INDEXER:
+                indexer_pushed = pushed
+
+        if indexer_pushed:
+            return
+        try:
+            # Other failures (already logged, after the throttle's retries) leave the fingerprints alone
+            self._start_indexer()
+        except ResourceNotFoundError:
+            # The cached fingerprints are stale (resources removed outside this process)
+            logger.warning(f"Provisioning state for '{self.user_name}' is stale; redeploying the full pipeline.")
+            self.provisioning_state.clear()
+            self.setup_user_index_pipeline(incremental=False)
+
+
+    def delete_user_blobs(self) -> int:
+        """Shared mode: delete the blobs under the user's folder of the shared container."""
+        container = self.container
+        deleted = 0
+        try:
+            names = [blob.name for blob in container.list_blobs(name_starts_with=self.user_prefix)]
+            for start in range(0, len(names), 256):
+                # Batch delete: up to 256 blobs per request
+                container.delete_blobs(*names[start:start + 256])
+                deleted += len(names[start:start + 256])
+        except ResourceNotFoundError:
+            logger.warning(f"⚠️ Container '{self.container_name}' not found. Nothing to delete.")
+        except HttpResponseError as e:
+            logger.error(f"❌ Failed to delete the blobs of '{self.user_name}' in '{self.container_name}': {e.message}")
+        self.manifest.clear()
+        logger.info(f"🗑️ Deleted {deleted} blobs of '{self.user_name}' from container '{self.container_name}'.")
+        return deleted
+
+    def delete_user_documents(self) -> int:
+        """Shared mode: delete the user's chunks from the shared index, leaving other tenants untouched."""
+        search_client = get_search_client(self.search_service_endpoint, self.index_name, self.credential)
+        deleted = 0
+        try:
+            keys = [{"chunk_id": r["chunk_id"]} for r in
+                    search_client.search(search_text="*", filter=self.owner_filter(), select=["chunk_id"])]
+            for start in range(0, len(keys), 1000):
+                search_client.delete_documents(keys[start:start + 1000])
+                deleted += len(keys[start:start + 1000])
+        except HttpResponseError as e:
+            logger.error(f"❌ Failed to delete the documents of '{self.user_name}' from '{self.index_name}': {e.message}")
+        self.pushed_files.delete()
+        logger.info(f"🗑️ Deleted {deleted} chunks of '{self.user_name}' from index '{self.index_name}'.")
+        return deleted
+
+    @instrumented("teardown.user_pipeline")
     def user_logout_delete_pipeline(self):
-        self.delete_container()
-        self.delete_user_search_index()
-        self.delete_data_source_connection()
-        self.delete_user_skillset()
-        self.delete_user_indexer()
+        if self.shared_index:
+            # The shared resources stay; only this user's blobs and chunks go
+            self.delete_user_blobs()
+            self.delete_user_documents()
+            return
+        # Dependency order: the indexers go first (they reference the skillset, the data sources
+        # and the index); everything in the same stage is deleted concurrently
+        first = [self.delete_container, self.delete_user_indexer]
+        then = [self.delete_user_search_index, self.delete_data_source_connection, self.delete_user_skillset]
+        if self.shards > 1:
+            first.append(self.delete_shard_indexers)
+            then.append(self.delete_shard_data_sources)
+        with ThreadPoolExecutor(max_workers=len(first) + len(then)) as executor:
+            container = executor.submit(first[0])
+            for future in [executor.submit(delete) for delete in first[1:]]:
+                future.result()
+            for future in [executor.submit(delete) for delete in then] + [container]:
+                future.result()
+
+
+# "azure" (Azure AI Search + Blob storage) or "local" (in-process vector index)
+SEARCH_BACKEND = os.environ.get("RAG_SEARCH_BACKEND", "azure")
+
+
+def _forget_local_state(user: str):
+    ProvisioningState(user).clear()
+    BlobManifest(user).clear()
+    JsonStateFile(user_state_dir(user) / "pushed_files.json").delete()
+
+
+def build_resource_sweeper(max_idle, keep: Iterable[str] = (), **kwargs) -> "ResourceSweeper":
+    """A sweeper over this deployment's search service and storage account; the shared index is always kept."""
+    from azure_search_utils.resource_sweeper import ResourceSweeper
+    keep = set(keep) | ({SHARED_INDEX} if SHARED_INDEX else set())
+    throttle = search_throttle(AZURE_SEARCH_SERVICE_ENDPOINT)
+    return ResourceSweeper(
+        ThrottledClient(get_search_index_client(AZURE_SEARCH_SERVICE_ENDPOINT, credential), throttle),
+        ThrottledClient(get_search_indexer_client(AZURE_SEARCH_SERVICE_ENDPOINT, credential), throttle),
+        get_blob_service_client(STORAGE_CONNECTION_STRING),
+        max_idle=max_idle, keep=keep, on_swept=_forget_local_state, **kwargs,
+    )
 
 
-def load_document_collection(user: str) -> UserDocumentCollection:
+def load_document_collection(user: str, backend: Optional[str] = None):
     """Retrieves the document collection for the given group name"""
+    backend = backend or SEARCH_BACKEND
+    if backend == "local":
+        from local_index import LocalDocumentCollection
+        return LocalDocumentCollection(user)
+    if backend != "azure":
+        raise ValueError(f"Unknown search backend '{backend}'")
     return UserDocumentCollection(user)
 
 """
@@ -0,0 +1,249 @@
+import csv
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from loguru import logger
+
+from prompts import RAG_PROMPT_BRUSSEL, BRUSSEL_PILLAR_PROMPT, BRUSSEL_EXPECTED_KEYS, BRUSSEL_PILLAR_EXPECTED_KEYS
+from rag import RAGBackEnd, DEFAULT_QUERY_CONCURRENCY
+from throttling import classify_error
+
+
+# Extra attempts for a (document, prompt) pair whose answer is not valid JSON with the expected keys
+DEFAULT_EXTRACTION_RETRIES = 2
+
+
+@dataclass(frozen=True)
+class ExtractionTask:
+    """A prompt template run on one document at a time (its `{selected_file}` is the document)."""
+    name: str
+    prompt_template: str
+    expected_keys: Tuple[str, ...]
+    question: str = ""
+
+
+BRUSSEL_TASKS = (
+    ExtractionTask("brussel", RAG_PROMPT_BRUSSEL, BRUSSEL_EXPECTED_KEYS),
+    ExtractionTask("brussel_pillars", BRUSSEL_PILLAR_PROMPT, BRUSSEL_PILLAR_EXPECTED_KEYS),
+)
+
+
+class ExtractionError(ValueError):
+    pass
+
+
+def parse_json_answer(text: str, expected_keys: Sequence[str]) -> dict:
+    """
+    Parse a JSON object answer and keep the expected keys, in order. Markdown fences and
+    prose around the object are tolerated; a missing key raises `ExtractionError`.
+    """
+    text = re.sub(r"^\s*```(?:json)?|```\s*$", "", text or "").strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        try:
+            data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except json.JSONDecodeError:
+            data = None
+    if not isinstance(data, dict):
+        raise ExtractionError(f"Answer is not a JSON object: {text[:80]!r}")
+    missing = [key for key in expected_keys if key not in data]
+    if missing:
+        raise ExtractionError(f"Answer is missing the keys {missing}")
+    return {key: data[key] for key in expected_keys}
+
+
+@dataclass
+class ExtractionResult:
+    document: str
+    task: str
+    data: Optional[dict] = None
+    attempts: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+
+
+@dataclass
+class ExtractionReport:
+    results: List[ExtractionResult] = field(default_factory=list)
+    # (document, task) pairs already completed by an earlier run
+    skipped: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def completed(self) -> List[ExtractionResult]:
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self) -> List[ExtractionResult]:
+        return [r for r in self.results if not r.ok]
+
+    def summary(self) -> str:
+        retried = sum(1 for r in self.results if r.attempts > 1)
+        return (
+            f"{len(self.completed)} extracted, {len(self.failed)} failed, {self.skipped} already done, "
+            f"{retried} retried in {self.elapsed_seconds:.2f}s"
+        )
+
+
+class ExtractionCheckpoint:
+    """Append-only log of the completed (document, task) pairs, read back on resume."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def load(self) -> Set[Tuple[str, str]]:
+        done = set()
+        if self.path.is_file():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        done.add((entry["document"], entry["task"]))
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # torn last line of an interrupted run
+        return done
+
+    def mark(self, document: str, task: str):
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"document": document, "task": task}) + "\n")
+
+
+class ExtractionWriter:
+    """
+    Streams validated rows to a `.jsonl` file (one object per row) or a `.csv` file (one
+    column per expected key, arrays joined with "; "). Existing files are appended to.
+    """
+
+    def __init__(self, path: Union[str, Path], tasks: Sequence[ExtractionTask]):
+        self.path = Path(path)
+        self.format = "csv" if self.path.suffix.lower() == ".csv" else "jsonl"
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new_file = not self.path.is_file() or self.path.stat().st_size == 0
+        self.file = open(self.path, "a", encoding="utf-8", newline="")
+        self.csv_writer = None
+        if self.format == "csv":
+            keys = list(dict.fromkeys(key for task in tasks for key in task.expected_keys))
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=["document", "task"] + keys)
+            if new_file:
+                self.csv_writer.writeheader()
+
+    @staticmethod
+    def _cell(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "; ".join(str(v) for v in value)
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+    def write(self, result: ExtractionResult):
+        with self.lock:
+            if self.csv_writer is not None:
+                row = {key: self._cell(value) for key, value in result.data.items()}
+                self.csv_writer.writerow({"document": result.document, "task": result.task, **row})
+            else:
+                self.file.write(json.dumps({"document": result.document, "task": result.task, **result.data},
+                                           ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ExtractionRunner:
+    """
+    Runs extraction prompts (`ExtractionTask`) over every document of a user's collection,
+    `max_concurrency` completions at a time. Each answer must parse as a JSON object with
+    the task's expected keys; malformed answers (and throttled or transient service errors)
+    are retried with a fresh (uncached) completion up to `max_retries` times.
+    """
+
+    def __init__(self, backend: RAGBackEnd, tasks: Sequence[ExtractionTask] = BRUSSEL_TASKS,
+                 max_concurrency: int = DEFAULT_QUERY_CONCURRENCY, max_retries: int = DEFAULT_EXTRACTION_RETRIES):
+        self.backend = backend
+        self.tasks = list(tasks)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+    def extract(self, document: str, task: ExtractionTask) -> ExtractionResult:
+        result = ExtractionResult(document, task.name)
+        start = time.perf_counter()
+        while result.attempts <= self.max_retries:
+            result.attempts += 1
+            try:
+                answer = self.backend.query_rag(
+                    question=task.question,
+                    selected_files=[document],
+                    response_format="json",
+                    prompt_template=task.prompt_template,
+                    # A cached answer that failed validation must not be served again
+                    use_cache=result.attempts == 1,
+                )
+                result.data = parse_json_answer(answer, task.expected_keys)
+                result.error = None
+                break
+            except Exception as e:
+                result.error = str(e)
+                # Only malformed answers and throttled or transient service errors are worth another completion
+                if not isinstance(e, ExtractionError) and classify_error(e) is None:
+                    break
+                logger.warning(f"⚠️ Extraction '{task.name}' of '{document}' failed "
+                               f"(attempt {result.attempts}/{self.max_retries + 1}): {e}")
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def run(self, output_path: Union[str, Path], documents: Optional[Iterable[str]] = None,
+            checkpoint_path: Union[str, Path, None] = None) -> ExtractionReport:
+        """
+        Extract every (document, task) pair not completed yet and stream the rows to `output_path`
+        (`.jsonl` or `.csv`). Completed pairs are logged to `checkpoint_path` (by default
+        `<output_path>.checkpoint`), so an interrupted run can simply be started again.
+        Documents default to all the documents of the collection.
+        """
+        if documents is None:
+            documents = self.backend.document_collection.list_documents()
+        checkpoint = ExtractionCheckpoint(checkpoint_path or f"{output_path}.checkpoint")
+        done = checkpoint.load()
+        pairs = [(document, task) for document in documents for task in self.tasks]
+        pending = [(document, task) for document, task in pairs if (document, task.name) not in done]
+        report = ExtractionReport(skipped=len(pairs) - len(pending))
+        logger.info(f"[User: {self.backend.user_id}] Extracting {len(pending)} (document, prompt) pairs "
+                    f"({report.skipped} already done).")
+
+        start = time.perf_counter()
+        with ExtractionWriter(output_path, self.tasks) as writer, \
+                ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(pending) or 1))) as executor:
+            futures = [executor.submit(self.extract, document, task) for document, task in pending]
+            for count, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                report.results.append(result)
+                if result.ok:
+                    writer.write(result)
+                    checkpoint.mark(result.document, result.task)
+                else:
+                    logger.error(f"❌ Extraction '{result.task}' of '{result.document}' failed: {result.error}")
+                logger.debug(f"[User: {self.backend.user_id}] Extraction progress {count}/{len(pending)}")
+        report.elapsed_seconds = time.perf_counter() - start
+        logger.info(f"[User: {self.backend.user_id}] Extraction finished: {report.summary()}")
+        return report
@@ -0,0 +1,69 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+UPLOADED = "uploaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+INVALID = "invalid"
+
+
+@dataclass
+class FileUploadResult:
+    """Outcome of sending one local file to the user's blob container."""
+    file_path: str
+    status: str
+    size_bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def uploaded(self) -> bool:
+        return self.status == UPLOADED
+
+
+@dataclass
+class IngestReport:
+    """Per-file results plus aggregated throughput for one ingest run."""
+    results: List[FileUploadResult] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    def _with_status(self, status: str) -> List[FileUploadResult]:
+        return [r for r in self.results if r.status == status]
+
+    @property
+    def uploaded(self) -> List[FileUploadResult]:
+        return self._with_status(UPLOADED)
+
+    @property
+    def skipped(self) -> List[FileUploadResult]:
+        return self._with_status(SKIPPED)
+
+    @property
+    def failed(self) -> List[FileUploadResult]:
+        return self._with_status(FAILED) + self._with_status(INVALID)
+
+    @property
+    def uploaded_any(self) -> bool:
+        return any(r.uploaded for r in self.results)
+
+    @property
+    def uploaded_bytes(self) -> int:
+        return sum(r.size_bytes for r in self.uploaded)
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.results) / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        if not self.elapsed_seconds:
+            return 0.0
+        return self.uploaded_bytes / (1024 * 1024) / self.elapsed_seconds
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.uploaded)} uploaded, {len(self.skipped)} skipped, "
+            f"{len(self.failed)} failed in {self.elapsed_seconds:.2f}s "
+            f"({self.files_per_second:.1f} files/s, {self.megabytes_per_second:.2f} MB/s)"
+        )
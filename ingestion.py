@@ -0,0 +1,347 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from xml.etree import ElementTree
+
+from loguru import logger
+
+
+# Same extensions as "indexedFileNameExtensions" in `build_indexer`
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md", ".html", ".pptx")
+# Same page settings as the SplitSkill of `build_skillset`
+PAGE_LENGTH = 4096
+PAGE_OVERLAP = 0
+MAX_PAGES = 2000
+
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_WORKERS = 4
+# Azure AI Search accepts up to 1000 documents (and 16 MB) per indexing request
+UPLOAD_BATCH_SIZE = 500
+
+# A file to ingest: a path on disk, or a (file name, content) pair from an upload
+IngestItem = Union[str, Path, Tuple[str, bytes]]
+
+# Stage timers are updated from the embedding and upload threads
+_STATS_LOCK = threading.Lock()
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_DRAWINGML_TEXT = "{http://schemas.openxmlformats.org/drawingml/2006/main}t"
+
+
+def _pptx_text(data: bytes) -> str:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        slides = [n for n in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", n)]
+        slides.sort(key=lambda n: int(re.search(r"(\d+)\.xml$", n).group(1)))
+        texts = []
+        for name in slides:
+            root = ElementTree.fromstring(archive.read(name))
+            texts.append("\n".join(node.text for node in root.iter(_DRAWINGML_TEXT) if node.text))
+    return "\n\n".join(texts)
+
+
+def _html_text(data: bytes) -> str:
+    html = data.decode("utf-8", errors="ignore")
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        return re.sub(r"<[^>]+>", " ", re.sub(r"(?is)<(script|style).*?</\1>", " ", html))
+    return BeautifulSoup(html, "html.parser").get_text("\n")
+
+
+def extract_text(file_name: str, data: bytes) -> str:
+    """Plain text of a pdf/docx/pptx/html/txt/md document."""
+    extension = Path(file_name).suffix.lower()
+    if extension == ".pdf":
+        from pypdf import PdfReader
+        return "\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages)
+    if extension == ".docx":
+        import docx2txt
+        return docx2txt.process(io.BytesIO(data))
+    if extension == ".pptx":
+        return _pptx_text(data)
+    if extension == ".html":
+        return _html_text(data)
+    if extension in (".txt", ".md"):
+        return data.decode("utf-8", errors="ignore")
+    raise ValueError(f"Unsupported file type '{extension}' for '{file_name}'")
+
+
+def split_pages(text: str, page_length: int = PAGE_LENGTH, page_overlap: int = PAGE_OVERLAP,
+                max_pages: int = MAX_PAGES) -> List[str]:
+    """
+    Split text into pages of at most `page_length` characters, breaking at sentence or
+    paragraph boundaries when possible (the behaviour of SplitSkill's "pages" mode).
+    """
+    pieces = []
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        while len(sentence) > page_length:
+            cut = sentence.rfind(" ", 0, page_length)
+            cut = cut if cut > 0 else page_length
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence.strip():
+            pieces.append(sentence)
+
+    pages, current = [], ""
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if len(candidate) <= page_length:
+            current = candidate
+            continue
+        pages.append(current)
+        overlap = current[-page_overlap:] if page_overlap else ""
+        current = f"{overlap} {piece}".strip() if overlap and len(overlap) + len(piece) < page_length else piece
+        if len(pages) >= max_pages:
+            return pages
+    if current.strip():
+        pages.append(current)
+    return pages[:max_pages]
+
+
+def document_parent_id(title: str) -> str:
+    # Index keys may only hold letters, digits, "_", "-" and "="
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()
+
+
+def page_chunk_id(parent_id: str, page_number: int) -> str:
+    return f"{parent_id}_pages_{page_number}"
+
+
+def _extract_item(item: IngestItem) -> Tuple[str, str, str, float]:
+    """Runs in a worker process: (title, content sha256, text, seconds spent)."""
+    start = time.perf_counter()
+    if isinstance(item, tuple):
+        title, data = item
+    else:
+        title, data = Path(item).name, Path(item).read_bytes()
+    text = extract_text(title, data)
+    return Path(title).name, hashlib.sha256(data).hexdigest(), text, time.perf_counter() - start
+
+
+class _InlineExecutor(Executor):
+    """Runs work in the calling thread; used when no extraction workers are wanted."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@dataclass
+class PushIngestStats:
+    """Counters and per-stage timings of one push-ingestion run."""
+    files: int = 0
+    skipped_files: int = 0
+    failed_files: Dict[str, str] = field(default_factory=dict)
+    chunks: int = 0
+    embedded_chunks: int = 0
+    uploaded_chunks: int = 0
+    failed_chunks: int = 0
+    stage_seconds: Dict[str, float] = field(default_factory=lambda: {"extract": 0.0, "embed": 0.0, "upload": 0.0})
+    elapsed_seconds: float = 0.0
+    # title -> {"sha256": ..., "pages": ...} for every file pushed in this run
+    pushed: Dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.uploaded_chunks / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.files} files ({self.skipped_files} unchanged, {len(self.failed_files)} failed), "
+            f"{self.uploaded_chunks}/{self.chunks} chunks pushed in {self.elapsed_seconds:.2f}s "
+            f"({self.chunks_per_second:.1f} chunks/s)"
+        )
+
+
+class IngestionPipeline:
+    """
+    Client-side alternative to the indexer + skillset: crack documents in a process pool,
+    split them into pages, embed the pages in large batches and push them to the index.
+
+    Every stage has a bounded number of items in flight, so a slow stage throttles the
+    ones before it and memory stays flat whatever the corpus size. The target is anything
+    with `upload_documents(list_of_dicts)` / `delete_documents(list_of_dicts)`: an Azure
+    `SearchClient` or a `LocalVectorIndex`.
+    """
+
+    def __init__(self,
+                 target,
+                 embed_fn: Callable[[List[str]], List[List[float]]],
+                 extract_workers: Optional[int] = None,
+                 embed_batch_size: int = EMBEDDING_BATCH_SIZE,
+                 embed_workers: int = EMBEDDING_WORKERS,
+                 upload_batch_size: int = UPLOAD_BATCH_SIZE,
+                 page_length: int = PAGE_LENGTH,
+                 page_overlap: int = PAGE_OVERLAP,
+                 owner: Optional[str] = None):
+        self.target = target
+        self.embed_fn = embed_fn
+        self.extract_workers = (os.cpu_count() or 1) if extract_workers is None else extract_workers
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = max(1, embed_workers)
+        self.upload_batch_size = upload_batch_size
+        self.page_length = page_length
+        self.page_overlap = page_overlap
+        # Shared index: chunks carry their owner and their keys are unique per owner
+        self.owner = owner
+
+    def run(self, items: Iterable[IngestItem], known_files: Optional[Dict[str, dict]] = None) -> PushIngestStats:
+        """
+        Push `items` to the target. `known_files` (the `pushed` map of earlier runs) lets
+        unchanged files be skipped and the extra pages of shrunk documents be deleted.
+        """
+        known_files = known_files or {}
+        stats = PushIngestStats()
+        start = time.perf_counter()
+        extractor = ProcessPoolExecutor(self.extract_workers) if self.extract_workers > 0 else _InlineExecutor()
+        with extractor, ThreadPoolExecutor(self.embed_workers) as embedder, ThreadPoolExecutor(1) as uploader:
+            # (batch, future) pairs, oldest first
+            embedding: Deque[Tuple[List[dict], Future]] = deque()
+            uploading: Deque[Tuple[List[dict], Future]] = deque()
+            chunk_buffer: List[dict] = []
+            upload_buffer: List[dict] = []
+
+            def drain_embedding(keep: int):
+                while len(embedding) > keep:
+                    upload_buffer.extend(self._collect_embeddings(*embedding.popleft(), stats))
+                    while len(upload_buffer) >= self.upload_batch_size:
+                        submit_upload(upload_buffer[:self.upload_batch_size])
+                        del upload_buffer[:self.upload_batch_size]
+
+            def submit_upload(batch: List[dict]):
+                # One batch uploading while the next is being prepared
+                while len(uploading) >= 2:
+                    self._collect_upload(*uploading.popleft(), stats)
+                uploading.append((batch, uploader.submit(self._timed, stats, "upload", self.target.upload_documents, batch)))
+
+            for title, content_hash, text in self._extracted(extractor, items, known_files, stats):
+                pages = split_pages(text, self.page_length, self.page_overlap)
+                parent_id = document_parent_id(f"{self.owner}/{title}" if self.owner else title)
+                previous_pages = known_files.get(title, {}).get("pages", 0)
+                if previous_pages > len(pages):
+                    self.target.delete_documents(
+                        [{"chunk_id": page_chunk_id(parent_id, i)} for i in range(len(pages), previous_pages)])
+                stats.pushed[title] = {"sha256": content_hash, "pages": len(pages)}
+                stats.chunks += len(pages)
+                for number, page in enumerate(pages):
+                    chunk = {"chunk_id": page_chunk_id(parent_id, number), "parent_id": parent_id,
+                             "title": title, "chunk": page}
+                    if self.owner:
+                        chunk["owner"] = self.owner
+                    chunk_buffer.append(chunk)
+                    if len(chunk_buffer) >= self.embed_batch_size:
+                        drain_embedding(self.embed_workers - 1)
+                        embedding.append((chunk_buffer, embedder.submit(self._embed, stats, chunk_buffer)))
+                        chunk_buffer = []
+
+            if chunk_buffer:
+                embedding.append((chunk_buffer, embedder.submit(self._embed, stats, chunk_buffer)))
+            drain_embedding(0)
+            if upload_buffer:
+                submit_upload(upload_buffer)
+            while uploading:
+                self._collect_upload(*uploading.popleft(), stats)
+
+        stats.elapsed_seconds = time.perf_counter() - start
+        logger.info(f"Push ingestion finished: {stats.summary()}")
+        return stats
+
+    def _extracted(self, extractor: Executor, items: Iterable[IngestItem], known_files: Dict[str, dict],
+                   stats: PushIngestStats) -> Iterator[Tuple[str, str, str]]:
+        """Extracted documents in input order, with at most two per worker in flight."""
+        pending: Deque[Tuple[str, Future]] = deque()
+        max_in_flight = 2 * max(1, self.extract_workers)
+
+        def collect():
+            name, future = pending.popleft()
+            try:
+                title, content_hash, text, seconds = future.result()
+            except Exception as e:
+                logger.error(f"❌ Failed to extract '{name}': {e}")
+                stats.failed_files[name] = str(e)
+                return None
+            stats.stage_seconds["extract"] += seconds
+            if known_files.get(title, {}).get("sha256") == content_hash:
+                stats.skipped_files += 1
+                return None
+            return title, content_hash, text
+
+        for item in items:
+            name = item[0] if isinstance(item, tuple) else str(item)
+            if Path(name).suffix.lower() not in SUPPORTED_EXTENSIONS:
+                logger.warning(f"Skipped: '{name}' is not a supported document type.")
+                continue
+            stats.files += 1
+            pending.append((name, extractor.submit(_extract_item, item)))
+            while len(pending) >= max_in_flight:
+                extracted = collect()
+                if extracted:
+                    yield extracted
+        while pending:
+            extracted = collect()
+            if extracted:
+                yield extracted
+
+    @staticmethod
+    def _timed(stats: PushIngestStats, stage: str, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with _STATS_LOCK:
+                stats.stage_seconds[stage] += time.perf_counter() - start
+
+    def _embed(self, stats: PushIngestStats, chunks: List[dict]) -> List[dict]:
+        vectors = self._timed(stats, "embed", self.embed_fn, [chunk["chunk"] for chunk in chunks])
+        for chunk, vector in zip(chunks, vectors):
+            chunk["text_vector"] = vector
+        return chunks
+
+    @staticmethod
+    def _mark_failed(chunks: List[dict], stats: PushIngestStats, error: str):
+        # Documents with a missing chunk are not recorded as pushed, so the next run retries them
+        for title in {chunk["title"] for chunk in chunks}:
+            stats.pushed.pop(title, None)
+            stats.failed_files.setdefault(title, error)
+
+    @classmethod
+    def _collect_embeddings(cls, chunks: List[dict], future: Future, stats: PushIngestStats) -> List[dict]:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"❌ Embedding batch failed: {e}")
+            cls._mark_failed(chunks, stats, str(e))
+            return []
+        stats.embedded_chunks += len(chunks)
+        return chunks
+
+    @classmethod
+    def _collect_upload(cls, batch: List[dict], future: Future, stats: PushIngestStats):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"❌ Upload batch failed: {e}")
+            stats.failed_chunks += len(batch)
+            cls._mark_failed(batch, stats, str(e))
+            return
+        if isinstance(result, int):
+            stats.uploaded_chunks += result
+            return
+        failed_keys = {r.key for r in result if not r.succeeded}
+        stats.uploaded_chunks += len(result) - len(failed_keys)
+        stats.failed_chunks += len(failed_keys)
+        if failed_keys:
+            cls._mark_failed([c for c in batch if c["chunk_id"] in failed_keys], stats, "indexing failed")
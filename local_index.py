@@ -0,0 +1,357 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Union
+
+import numpy as np
+from loguru import logger
+
+from azure_search_utils.local_state import JsonStateFile, user_state_dir
+from azure_search_utils.vector_profiles import DEFAULT_EMBEDDING_DIMENSIONS
+from embedding_cache import with_embedding_cache
+from telemetry import instrumented
+from ingestion import IngestionPipeline
+from retrieval import RetrievalSettings, RetrievedChunk
+
+try:
+    import faiss
+except ImportError:  # approximate search falls back to exact search
+    faiss = None
+
+
+# Queries scored together in one matrix product by exact search
+QUERY_BATCH_SIZE = 256
+# HNSW candidates fetched per requested result when a filter is applied afterwards
+HNSW_OVERSAMPLING = 8
+
+_TITLE_FILTER_TOKEN = re.compile(
+    r"\s*(?:"
+    r"(?P<paren>[()])"
+    r"|(?P<or>or)\b"
+    r"|title\s+eq\s+'(?P<eq>(?:[^']|'')*)'"
+    r"|search\.in\(\s*title\s*,\s*'(?P<values>(?:[^']|'')*)'\s*(?:,\s*'(?P<delimiters>(?:[^']|'')*)'\s*)?\)"
+    r")",
+    re.IGNORECASE,
+)
+# Owner clause `and`-ed in front of (or after) the title clauses by `RAGBackEnd.get_document_filter`
+_OWNER_CONJUNCT = re.compile(
+    r"^\s*owner\s+eq\s+'(?:[^']|'')*'\s*(?:and\b|$)|\band\s+owner\s+eq\s+'(?:[^']|'')*'\s*$",
+    re.IGNORECASE,
+)
+
+
+def parse_title_filter(document_filter: Optional[str]) -> Optional[Set[str]]:
+    """
+    Titles selected by an OData filter made of `title eq '...'` / `search.in(title, ...)`
+    clauses joined with `or` (what `RAGBackEnd.get_document_filter` produces).
+    An `owner eq '...'` conjunct is ignored: a local index only holds its user's documents.
+    Returns None when there is no filter.
+    """
+    if document_filter:
+        document_filter = _OWNER_CONJUNCT.sub("", document_filter, count=1).strip()
+    if not document_filter:
+        return None
+    titles, position = set(), 0
+    while position < len(document_filter):
+        match = _TITLE_FILTER_TOKEN.match(document_filter, position)
+        if not match or match.end() == position:
+            if document_filter[position:].strip():
+                raise ValueError(f"Unsupported filter for the local index: {document_filter!r}")
+            break
+        if match.group("eq") is not None:
+            titles.add(match.group("eq").replace("''", "'"))
+        elif match.group("values") is not None:
+            values = match.group("values").replace("''", "'")
+            delimiters = (match.group("delimiters") or " ,").replace("''", "'")
+            titles.update(v for v in re.split("|".join(map(re.escape, delimiters)), values) if v)
+        position = match.end()
+    return titles
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LocalVectorIndex:
+    """
+    In-memory index with the schema of `build_azure_search_index`
+    (chunk_id key, title, chunk, parent_id and a `text_vector` embedding).
+
+    Vectors are stored L2-normalized so cosine similarity is a dot product. Exact search
+    scores batches of queries with one matrix product; approximate search uses a faiss
+    HNSW graph when faiss is installed. `save` writes the vectors as a .npy file that
+    `load` memory-maps, so opening a large index costs almost nothing.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    DOCUMENTS_FILE = "documents.jsonl"
+
+    def __init__(self, dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS, path: Union[str, Path, None] = None):
+        self.dimensions = dimensions
+        self.path = Path(path) if path else None
+        self._lock = threading.RLock()
+        self._documents: List[dict] = []
+        self._positions: Dict[str, int] = {}
+        self._vectors = np.empty((0, dimensions), dtype=np.float32)
+        self._hnsw = None
+        if self.path and (self.path / self.VECTORS_FILE).is_file():
+            self.load(self.path)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def titles(self) -> Set[str]:
+        return {doc["title"] for doc in self._documents}
+
+    def upload_documents(self, documents: Iterable[dict]) -> int:
+        """Insert or replace documents (keyed on chunk_id), like `SearchClient.upload_documents`."""
+        documents = list(documents)
+        if not documents:
+            return 0
+        vectors = _normalize(np.stack([np.asarray(d["text_vector"], dtype=np.float32) for d in documents]))
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dim vectors, got {vectors.shape[1]}")
+
+        with self._lock:
+            if not self._vectors.flags.writeable:
+                self._vectors = np.array(self._vectors)  # detach from the memory-mapped file
+            new_rows = []
+            for doc, vector in zip(documents, vectors):
+                fields = {k: doc.get(k) for k in ("chunk_id", "title", "chunk", "parent_id")}
+                position = self._positions.get(fields["chunk_id"])
+                if position is None:
+                    self._positions[fields["chunk_id"]] = len(self._documents)
+                    self._documents.append(fields)
+                    new_rows.append(vector)
+                else:
+                    self._documents[position] = fields
+                    self._vectors[position] = vector
+            if new_rows:
+                self._vectors = np.concatenate([self._vectors, np.stack(new_rows)])
+            self._hnsw = None
+        return len(documents)
+
+    def delete_documents(self, documents: Iterable[Union[str, dict]]) -> int:
+        """Delete by chunk_id, given as keys or as `{"chunk_id": ...}` documents like `SearchClient`."""
+        chunk_ids = {d["chunk_id"] if isinstance(d, dict) else d for d in documents}
+        return self._delete_where(lambda doc: doc["chunk_id"] in chunk_ids)
+
+    def delete_by_titles(self, titles: Iterable[str]) -> int:
+        titles = set(titles)
+        return self._delete_where(lambda doc: doc["title"] in titles)
+
+    def _delete_where(self, predicate: Callable[[dict], bool]) -> int:
+        with self._lock:
+            keep = np.array([not predicate(doc) for doc in self._documents], dtype=bool)
+            removed = int((~keep).sum()) if len(keep) else 0
+            if removed:
+                self._documents = [doc for doc, kept in zip(self._documents, keep) if kept]
+                self._vectors = self._vectors[keep]
+                self._positions = {doc["chunk_id"]: i for i, doc in enumerate(self._documents)}
+                self._hnsw = None
+            return removed
+
+    def _filtered_rows(self, document_filter: Optional[str]) -> Optional[np.ndarray]:
+        titles = parse_title_filter(document_filter)
+        if titles is None:
+            return None
+        return np.array([i for i, doc in enumerate(self._documents) if doc["title"] in titles], dtype=np.int64)
+
+    def search(self, query_vector, top: int = 8, document_filter: Optional[str] = None,
+               approximate: bool = False) -> List[RetrievedChunk]:
+        return self.search_batch(np.asarray([query_vector]), top, document_filter, approximate)[0]
+
+    def search_batch(self, query_vectors, top: int = 8, document_filter: Optional[str] = None,
+                     approximate: bool = False) -> List[List[RetrievedChunk]]:
+        queries = _normalize(np.atleast_2d(query_vectors))
+        with self._lock:
+            rows = self._filtered_rows(document_filter)
+            if rows is not None and len(rows) == 0 or len(self._documents) == 0 or top <= 0:
+                return [[] for _ in range(len(queries))]
+            if approximate and faiss is not None:
+                return self._search_hnsw(queries, top, rows)
+            return self._search_exact(queries, top, rows)
+
+    def _search_exact(self, queries: np.ndarray, top: int, rows: Optional[np.ndarray]) -> List[List[RetrievedChunk]]:
+        candidates = self._vectors if rows is None else self._vectors[rows]
+        k = min(top, len(candidates))
+        if k <= 0:
+            # argpartition has no k - 1 to partition on
+            return [[] for _ in range(len(queries))]
+        results = []
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            scores = queries[start:start + QUERY_BATCH_SIZE] @ candidates.T
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for query_scores, query_best in zip(scores, best):
+                ordered = query_best[np.argsort(-query_scores[query_best])]
+                positions = ordered if rows is None else rows[ordered]
+                results.append([self._to_chunk(p, s) for p, s in zip(positions, query_scores[ordered])])
+        return results
+
+    def _search_hnsw(self, queries: np.ndarray, top: int, rows: Optional[np.ndarray]) -> List[List[RetrievedChunk]]:
+        if self._hnsw is None:
+            self._hnsw = faiss.IndexHNSWFlat(self.dimensions, 32, faiss.METRIC_INNER_PRODUCT)
+            self._hnsw.add(np.ascontiguousarray(self._vectors))
+        allowed = None if rows is None else set(rows.tolist())
+        k = min(len(self._documents), top if allowed is None else top * HNSW_OVERSAMPLING)
+        scores, positions = self._hnsw.search(np.ascontiguousarray(queries), k)
+        results = []
+        for query_scores, query_positions in zip(scores, positions):
+            hits = [(p, s) for p, s in zip(query_positions, query_scores)
+                    if p >= 0 and (allowed is None or p in allowed)]
+            results.append([self._to_chunk(p, s) for p, s in hits[:top]])
+        return results
+
+    def _to_chunk(self, position: int, score: float) -> RetrievedChunk:
+        doc = self._documents[int(position)]
+        return RetrievedChunk(chunk_id=doc["chunk_id"], title=doc["title"] or "", chunk=doc["chunk"] or "",
+                              parent_id=doc["parent_id"], score=float(score),
+                              vector=self._vectors[int(position)])
+
+    def save(self, path: Union[str, Path, None] = None):
+        path = Path(path or self.path)
+        path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            tmp_vectors = path / (self.VECTORS_FILE + ".tmp")
+            with open(tmp_vectors, "wb") as f:
+                np.save(f, np.ascontiguousarray(self._vectors))
+            tmp_documents = path / (self.DOCUMENTS_FILE + ".tmp")
+            with open(tmp_documents, "w", encoding="utf-8") as f:
+                for doc in self._documents:
+                    f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            os.replace(tmp_vectors, path / self.VECTORS_FILE)
+            os.replace(tmp_documents, path / self.DOCUMENTS_FILE)
+
+    def load(self, path: Union[str, Path], mmap: bool = True):
+        path = Path(path)
+        with self._lock:
+            vectors = np.load(path / self.VECTORS_FILE, mmap_mode="r" if mmap else None)
+            with open(path / self.DOCUMENTS_FILE, "r", encoding="utf-8") as f:
+                documents = [json.loads(line) for line in f if line.strip()]
+            if vectors.shape != (len(documents), self.dimensions):
+                raise ValueError(f"Corrupt local index at '{path}': {vectors.shape} vectors for {len(documents)} documents")
+            self._vectors, self._documents = vectors, documents
+            self._positions = {doc["chunk_id"]: i for i, doc in enumerate(documents)}
+            self._hnsw = None
+
+    def clear(self):
+        with self._lock:
+            self._documents, self._positions = [], {}
+            self._vectors = np.empty((0, self.dimensions), dtype=np.float32)
+            self._hnsw = None
+
+
+class LocalRetriever:
+    """Client-side retriever over a `LocalVectorIndex` (vector search only)."""
+
+    def __init__(self, index: LocalVectorIndex, embed_fn: Callable[[List[str]], List[List[float]]],
+                 settings: Optional[RetrievalSettings] = None, approximate: bool = False):
+        self.index = index
+        self.embed_fn = embed_fn
+        self.settings = settings or RetrievalSettings()
+        self.approximate = approximate
+
+    def retrieve(self, question: str, document_filter: Optional[str] = None,
+                 top_k: Optional[int] = None) -> List[RetrievedChunk]:
+        query_vector = self.embed_fn([question])[0]
+        return self.index.search(query_vector, top_k or self.settings.top_k, document_filter, self.approximate)
+
+    async def aretrieve(self, question: str, document_filter: Optional[str] = None,
+                        top_k: Optional[int] = None) -> List[RetrievedChunk]:
+        return await asyncio.to_thread(self.retrieve, question, document_filter, top_k)
+
+
+class LocalDocumentCollection:
+    """
+    Drop-in replacement for `UserDocumentCollection` backed by a `LocalVectorIndex`
+    persisted under the user's state folder: no blob container, no search service.
+    Files are cracked, chunked and embedded by the `IngestionPipeline` when the index
+    pipeline is set up.
+    """
+
+    # The "data_sources" extension can only read Azure AI Search indexes
+    requires_client_retrieval = True
+
+    def __init__(self, user_name: str, embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS):
+        self.user_name = user_name
+        self.index_name = self.user_name + "_index"
+        self.path = user_state_dir(user_name) / "local_index"
+        self.index = LocalVectorIndex(dimensions, self.path)
+        if embed_fn is None:
+            from text_embeddings import embed_texts, EMBEDDING_DEPLOYMENT
+            embed_fn = embed_texts
+            # Document chunks go through the persistent embedding cache; questions do not
+            self.ingest_embed_fn = with_embedding_cache(embed_texts, EMBEDDING_DEPLOYMENT)
+        else:
+            self.ingest_embed_fn = embed_fn
+        self.embed_fn = embed_fn
+        self.files = JsonStateFile(self.path / "files.json")
+        self._pending: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def add_file_to_blob_container(self, file_path: str, file: Union[BinaryIO, bytes]) -> bool:
+        file_name = Path(file_path).name
+        data = bytes(file) if isinstance(file, (bytes, bytearray, memoryview)) else file.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        if self.files.load().get(file_name, {}).get("sha256") == content_hash:
+            logger.info(f"File '{file_name}' is unchanged in the local index of '{self.user_name}'. Skipping.")
+            return False
+        with self._lock:
+            self._pending[file_name] = data
+        logger.info(f"Queued '{file_name}' for the local index of '{self.user_name}'.")
+        return True
+
+    async def aadd_file_to_blob_container(self, file_path: str, file) -> bool:
+        """Also takes an async stream; the local index keeps the whole file in memory anyway."""
+        if hasattr(file, "__aiter__"):
+            file = b"".join([chunk async for chunk in file])
+        elif inspect.iscoroutinefunction(getattr(file, "read", None)):
+            file = await file.read()
+        return self.add_file_to_blob_container(file_path, file)
+
+    @instrumented("ingest.setup_index_pipeline")
+    def setup_user_index_pipeline(self, incremental: bool = True):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        # Few files per call: extraction in-process beats spinning up a process pool
+        pipeline = IngestionPipeline(self.index, self.ingest_embed_fn, extract_workers=0 if len(pending) < 4 else None)
+        with self.files.lock:
+            files = self.files.load()
+            stats = pipeline.run(pending.items(), known_files=files)
+            files.update(stats.pushed)
+            self.files.save(files)
+        self.index.save(self.path)
+        logger.info(f"✅ Local index of '{self.user_name}' updated: {stats.summary()}")
+
+    @instrumented("ingest.push_files")
+    def push_files_to_index(self, files: List[str], **pipeline_options):
+        with self.files.lock:
+            files_state = self.files.load()
+            stats = IngestionPipeline(self.index, self.ingest_embed_fn, **pipeline_options).run(files, known_files=files_state)
+            files_state.update(stats.pushed)
+            self.files.save(files_state)
+        self.index.save(self.path)
+        return stats
+
+    def list_documents(self) -> List[str]:
+        return sorted(set(self.files.load()) | self.index.titles)
+
+    def get_retriever(self, settings: Optional[RetrievalSettings] = None) -> LocalRetriever:
+        return LocalRetriever(self.index, self.embed_fn, settings)
+
+    def user_logout_delete_pipeline(self):
+        self.index.clear()
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.info(f"🗑️ Local index of '{self.user_name}' deleted.")
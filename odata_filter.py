@@ -0,0 +1,54 @@
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple, Union
+
+
+# Selections of at least this many titles compile to one search.in() instead of a chain of `eq`
+SEARCH_IN_MIN_VALUES = 4
+# Tried in order; the first one that appears in none of the values separates them in search.in()
+SEARCH_IN_DELIMITERS = ("|", ",", ";", "~", "^", "`", "#")
+
+
+def odata_escape(s: str) -> str:
+    # OData string literals escape single quotes by doubling them
+    return s.replace("'", "''")
+
+
+def choose_delimiter(values: Iterable[str]) -> Optional[str]:
+    """A search.in() delimiter absent from every value, or None if all candidates are used."""
+    used = set("".join(values))
+    return next((d for d in SEARCH_IN_DELIMITERS if d not in used), None)
+
+
+@lru_cache(maxsize=1024)
+def _compile_in_filter(field: str, values: Tuple[str, ...]) -> str:
+    delimiter = choose_delimiter(values) if len(values) >= SEARCH_IN_MIN_VALUES else None
+    if delimiter is not None:
+        # One clause whatever the selection size: stays under the filter clause limit and is
+        # evaluated as a set lookup by the service
+        return f"search.in({field}, '{odata_escape(delimiter.join(values))}', '{odata_escape(delimiter)}')"
+    clauses = [f"{field} eq '{odata_escape(value)}'" for value in values]
+    return clauses[0] if len(clauses) == 1 else f"({' or '.join(clauses)})"
+
+
+def in_filter(field: str, values: Union[str, Iterable[str], None]) -> Optional[str]:
+    """
+    OData filter matching documents whose `field` equals any of `values` (None when empty).
+    The selection is deduplicated and sorted, so the same set of values always compiles
+    to the same (cached) filter string.
+    """
+    if not values:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    selection = tuple(sorted({v for v in values if v}))
+    return _compile_in_filter(field, selection) if selection else None
+
+
+def title_filter(files: Union[str, Iterable[str], None]) -> Optional[str]:
+    return in_filter("title", files)
+
+
+def and_filters(*clauses: Optional[str]) -> Optional[str]:
+    """Join the non-empty clauses with `and`."""
+    clauses = [clause for clause in clauses if clause]
+    return " and ".join(clauses) if clauses else None
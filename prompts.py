@@ -22,6 +22,8 @@ Rules:
 - Preserve the document's original title (do not translate it); the "summary" must be in English.
 - Output VALID JSON and NOTHING ELSE (no markdown fences, no prose, no citations like [doc1])."""
 )
+# Keys the JSON answer to RAG_PROMPT_BRUSSEL must contain
+BRUSSEL_EXPECTED_KEYS = ("title", "organization", "summary", "main themes")
 
 BRUSSEL_PILLAR_PROMPT= (
   """
@@ -48,4 +50,6 @@ Rules:
 - Base your answer ONLY on the provided content; do not rely on outside knowledge.
 - Do not invent facts; if uncertain, use null.
 - Output VALID JSON and NOTHING ELSE (no markdown fences, no prose, no citations)."""
-)
\ No newline at end of file
+)
+# Keys the JSON answer to BRUSSEL_PILLAR_PROMPT must contain
+BRUSSEL_PILLAR_EXPECTED_KEYS = ("VC", "clusters", "skills", "AI/data")
@@ -1,59 +1,250 @@
 
+import asyncio
 import re
+import time
 
 from prompts import RAG_BASE_PROMPT
 from embeddings import load_document_collection
-from chat_completion import run_completion
-
+from chat_completion import run_completion, arun_completion, run_chat_completion, arun_chat_completion
+from retrieval import RetrievalSettings, RetrievedChunk, StageTimer, build_context, build_grounded_messages
+from answer_cache import AnswerCache, answer_cache_key
+from answer_stream import AnswerStream, AsyncAnswerStream
+from odata_filter import and_filters, title_filter
+from reranking import RerankReport, RerankSettings, rerank_chunks
+from conversation import ConversationContext, ConversationMemory, ConversationSettings, format_transcript
+from ingestion import PushIngestStats
+from ingest_stats import FileUploadResult, IngestReport, UPLOADED, SKIPPED, FAILED, INVALID
+from telemetry import instrumented, telemetry
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from loguru import logger
 from pathlib import Path
-from typing import Union, List
+from typing import AsyncIterator, Callable, Iterable, NamedTuple, Optional, Tuple, Union, List
+
+
+# Number of blob uploads allowed in flight at once during document ingestion
+DEFAULT_UPLOAD_WORKERS = 8
+# Number of completions allowed in flight at once in batch querying
+DEFAULT_QUERY_CONCURRENCY = 8
+
+# How documents reach the index: blob container + indexer/skillset, or the client-side push pipeline
+INDEXER_INGESTION = "indexer"
+PUSH_INGESTION = "push"
+
+# Where retrieval happens: inside the Azure OpenAI "On Your Data" extension, or in this process
+EXTENSION_RETRIEVAL = "extension"
+CLIENT_RETRIEVAL = "client"
 
 
 #load_dotenv()
 
 
-def odata_escape(s: str) -> str:
-    # OData string literals escape single quotes by doubling them
-    return s.replace("'", "''")
+def clean_answer(text: str) -> str:
+    """Strip [docN] citation markers from a completion and tidy the whitespace they leave behind."""
+    answer = re.sub(r'\[doc\d+\]', '', text)
+    # tidy up any extra spaces like "met  ." or before punctuation
+    answer = re.sub(r'\s{2,}', ' ', answer)
+    return re.sub(r'\s+([,.;:!?])', r'\1', answer).strip()
 
 
 class RAGError(Exception):
     pass
 
+
+@dataclass
+class RAGQuery:
+    """One job of a batch of queries."""
+    question: str
+    selected_files: Optional[List[str]] = None
+    prompt_template: str = RAG_BASE_PROMPT
+    response_format: str = "text"
+
+
+def as_rag_query(job: Union[RAGQuery, tuple]) -> RAGQuery:
+    return job if isinstance(job, RAGQuery) else RAGQuery(*job)
+
+
+class PreparedQuery(NamedTuple):
+    instructions: str
+    question: str
+    document_filter: Optional[str]
+    index_name: str
+    cache_scope: str
+    cache_key: Optional[str]
+    cached: Optional[str]
+    # Compacted conversation history (summary + recent turns) sent along with the question
+    history: Tuple[dict, ...] = ()
+
+    @property
+    def prompt(self) -> str:
+        if self.history:
+            return self.instructions + "\nConversation so far:\n" + format_transcript(self.history) + "\n" + self.question
+        return self.instructions + "\n" + self.question
+
+
 class RAGBackEnd:
 
-    def __init__(self, user_id: str):
+    def __init__(self,
+                 user_id: str,
+                 answer_cache: Optional[AnswerCache] = None,
+                 retrieval_mode: str = EXTENSION_RETRIEVAL,
+                 retrieval_settings: Optional[RetrievalSettings] = None,
+                 backend: Optional[str] = None,
+                 conversation_settings: Optional[ConversationSettings] = None,
+                 rerank_settings: Optional[RerankSettings] = None):
         logger.info(f"[User: {user_id}] Initialization of chatbot backend")
+        self.user_id = user_id
         # Load document collection
-        self.document_collection = load_document_collection(user_id)
+        self.document_collection = load_document_collection(user_id, backend)
         self.document_filter = None
+        # Optional cache of final answers, invalidated whenever the collection content changes
+        self.answer_cache = answer_cache
+        # Set while an indexer may still be adding uploaded documents: answers are not cached meanwhile
+        self.indexing_pending = False
+        # "extension": the completion retrieves through "data_sources";
+        # "client": we query the index ourselves and send a token-budgeted context
+        if retrieval_mode not in (EXTENSION_RETRIEVAL, CLIENT_RETRIEVAL):
+            raise RAGError(f"Unknown retrieval mode '{retrieval_mode}'")
+        if getattr(self.document_collection, "requires_client_retrieval", False):
+            retrieval_mode = CLIENT_RETRIEVAL
+        self.retrieval_mode = retrieval_mode
+        self.retrieval_settings = retrieval_settings or RetrievalSettings()
+        self._retriever = None
+        # Client retrieval: candidates are re-ranked and pruned locally before generation
+        self.rerank_settings = rerank_settings or RerankSettings()
+        self.last_timings = {}
+        self.last_rerank: Optional[RerankReport] = None
+        # Sources of the last answer (retrieved chunks, or the citations of the "data_sources" extension)
+        self.last_citations: List[dict] = []
+        # Token-budgeted chat history of this session, with its summaries cached
+        self.conversation = ConversationMemory(conversation_settings)
+
+
+    @property
+    def cache_scope(self) -> str:
+        # Per user even when several users share one index
+        collection = self.document_collection
+        return getattr(collection, "cache_scope", collection.index_name)
+
+
+    def invalidate_answer_cache(self):
+        if self.answer_cache is not None and self.document_collection is not None:
+            self.answer_cache.invalidate(self.cache_scope)
+
+
+    @instrumented("ingest.document_index_pipeline")
+    def document_index_pipeline(self,
+                                files: Union[str, List[str]],
+                                max_workers: int = DEFAULT_UPLOAD_WORKERS,
+                                progress_callback: Optional[Callable[[FileUploadResult, int, int], None]] = None,
+                                ingestion: str = INDEXER_INGESTION
+                                ) -> Union[IngestReport, PushIngestStats]:
+        """
+        Upload the given files to the user's blob container and (re)build the index pipeline
+        if at least one of them was new.
 
+        Uploads run concurrently on a bounded thread pool (`max_workers=1` gives the old
+        one-file-at-a-time behaviour). `progress_callback(result, done, total)` is invoked
+        as each file finishes. Returns an `IngestReport` with per-file outcomes and throughput.
 
-    
-    def document_index_pipeline(self, files: Union[str, List[str]]):
+        With `ingestion="push"` the files skip blob storage and the indexer entirely: they are
+        cracked, chunked, embedded and pushed to the index by the client-side pipeline,
+        and the pipeline's `PushIngestStats` is returned instead.
+        """
 
         if isinstance(files, str):
             files = [files]
 
-        uploaded_any = False
+        if ingestion == PUSH_INGESTION:
+            stats = self.document_collection.push_files_to_index([str(p) for p in sorted(Path(f) for f in files)])
+            if stats.pushed:
+                self.invalidate_answer_cache()
+            return stats
+        if ingestion != INDEXER_INGESTION:
+            raise RAGError(f"Unknown ingestion mode '{ingestion}'")
+
+        file_paths = sorted(Path(p) for p in files)
+        total = len(file_paths)
+        report = IngestReport()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total or 1))) as executor:
+            futures = [executor.submit(self._upload_file, file_path) for file_path in file_paths]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                report.results.append(result)
+                logger.info(f"[User: {self.user_id}] Upload progress {done}/{total}: "
+                            f"{Path(result.file_path).name} -> {result.status}")
+                if progress_callback is not None:
+                    progress_callback(result, done, total)
+
+        report.elapsed_seconds = time.perf_counter() - start
+        report.results.sort(key=lambda r: r.file_path)
+        logger.info(f"[User: {self.user_id}] Ingest finished: {report.summary()}")
 
-        for file_path in sorted(Path(p) for p in files):
-            if not file_path.is_file():
-                logger.warning(f"Skipped: {file_path} is not a valid file.")
-                continue
-            with open(file_path, "rb") as file_obj:
-                uploaded = self.document_collection.add_file_to_blob_container(str(file_path), file_obj)
-                if uploaded:
-                    uploaded_any = True
         # now setup the client index pipeline and embed the documents:
-        if uploaded_any:
+        if report.uploaded_any:
+            # Answers computed on the previous content are stale now, and so are those
+            # computed until the indexer has picked up the new files
+            self.indexing_pending = True
+            self.invalidate_answer_cache()
             # At least one file was newly uploaded → (re)build the pipeline
             self.document_collection.setup_user_index_pipeline()
         else:
-            logger.info("All files already existed; skipping user index pipeline setup.")
+            logger.info("No new files uploaded; skipping user index pipeline setup.")
+        return report
+
+
+    def wait_until_indexed(self, timeout: float = 600.0, **poll_options):
+        """
+        Block until the indexing started by `document_index_pipeline` is finished (see
+        `UserDocumentCollection.wait_until_indexed`), so the next query sees every document.
+        Returns the indexer progress, or None for collections indexed synchronously.
+        """
+        wait = getattr(self.document_collection, "wait_until_indexed", None)
+        if wait is None:
+            return None
+        progress = wait(timeout, **poll_options)
+        self._indexing_waited(progress)
+        return progress
+
+
+    async def await_until_indexed(self, timeout: float = 600.0, **poll_options):
+        wait = getattr(self.document_collection, "await_until_indexed", None)
+        if wait is None:
+            return None
+        progress = await wait(timeout, **poll_options)
+        self._indexing_waited(progress)
+        return progress
+
+
+    def _indexing_waited(self, progress):
+        # Answers cached while the index was still filling up (e.g. by another session) may say "not found"
+        self.invalidate_answer_cache()
+        requested_at = getattr(self.document_collection, "indexing_requested_at", None)
+        if progress is None or progress.finished_since(requested_at):
+            self.indexing_pending = False
+
+
+    def _upload_file(self, file_path: Path) -> FileUploadResult:
+        if not file_path.is_file():
+            logger.warning(f"Skipped: {file_path} is not a valid file.")
+            return FileUploadResult(str(file_path), INVALID, error="not a valid file")
+
+        start = time.perf_counter()
+        try:
+            size = file_path.stat().st_size
+            with open(file_path, "rb") as file_obj:
+                uploaded = self.document_collection.add_file_to_blob_container(str(file_path), file_obj)
+            status = UPLOADED if uploaded else SKIPPED
+            return FileUploadResult(str(file_path), status, size, time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"❌ Failed to upload '{file_path}': {e}")
+            return FileUploadResult(str(file_path), FAILED, seconds=time.perf_counter() - start, error=str(e))
        
 
+    @instrumented("teardown.logout")
     def logout_delete_storage_pipeline(self):
 
         """
@@ -75,6 +266,7 @@ class RAGBackEnd:
         """
 
         self.document_collection.user_logout_delete_pipeline()
+        self.invalidate_answer_cache()
 
 
     def get_document_filter(self, files: Union[str, List[str], None]):
@@ -87,68 +279,304 @@ class RAGBackEnd:
             get_document_filter("doc1.pdf")
             -> "title eq 'doc1.pdf'"
 
-            get_document_filter(["doc1.pdf", "doc2.pdf"])
+            get_document_filter(["doc2.pdf", "doc1.pdf"])
             -> "(title eq 'doc1.pdf' or title eq 'doc2.pdf')"
-        """
-        if not files:  # None or empty list
-            return None
 
-        if isinstance(files, str):
-            files = [files]
+            get_document_filter(["a.pdf", "b.pdf", "c.pdf", "d.pdf"])
+            -> "search.in(title, 'a.pdf|b.pdf|c.pdf|d.pdf', '|')"
 
-        files = [f for f in files if f]  # drop falsy entries
-        if not files:
-            return None
+        On a shared (multi-tenant) index the owner clause is always added:
+            get_document_filter("doc1.pdf")
+            -> "owner eq 'alice' and title eq 'doc1.pdf'"
+        """
+        owner_filter = getattr(self.document_collection, "owner_filter", lambda: None)()
+        return and_filters(owner_filter, self._files_filter(files))
 
-        clauses = [f"title eq '{odata_escape(f)}'" for f in files]
-        return clauses[0] if len(clauses) == 1 else f"({' or '.join(clauses)})"
 
+    @staticmethod
+    def _files_filter(files: Union[str, List[str], None]) -> Optional[str]:
+        # Compiled filters are cached per selection (see `odata_filter.in_filter`)
+        return title_filter(files)
 
-    def query_rag(self, 
-                  question: str = "", 
-                  history: List[dict[str, str]] = None,
-                  selected_files: List[str] = None,
-                  response_format: str="text",
-                  prompt_template: str = RAG_BASE_PROMPT
-                  ):
-        
-        self.question = "\n" + question
+
+    def _prepare_query(self, conversation: ConversationContext, selected_files, response_format, prompt_template, use_cache):
+        """
+        Build the prompt, filter and cache key of a query; `cached` is set on a cache hit.
+        `conversation` holds the (standalone) question and the compacted history.
+        """
+        question, history = conversation
 
         # Sanity check
         if self.document_collection is None:
             raise RAGError("No active document collection!")
-        
-        if "{selected_file}" in prompt_template:
-            files_str = ", ".join(selected_files or [])
-            prompt = prompt_template.format(selected_file=files_str)
-        else:
-            prompt = prompt_template
-        
-
-    # Get document filter
-        self.document_filter = self.get_document_filter(selected_files)
-        self.index_name = self.document_collection.index_name
-
-        completion = run_completion(
-            prompt=prompt + self.question,
-            filter=self.document_filter, 
-            index_name=self.index_name,
-            response_format=response_format
-        )
-
-        text = completion.content or ""
-        answer = re.sub(r'\[doc\d+\]', '', text)
-        # tidy up any extra spaces like "met  ." or before punctuation
-        answer = re.sub(r'\s{2,}', ' ', answer)
-        answer = re.sub(r'\s+([,.;:!?])', r'\1', answer).strip()
-        citations = completion.context.get('citations')
 
+        # Plain substitution, not str.format: templates may hold literal braces (e.g. a JSON schema)
+        instructions = prompt_template.replace("{selected_file}", ", ".join(selected_files or []))
+
+        # Get document filter
+        document_filter = self.get_document_filter(selected_files)
+        index_name = self.document_collection.index_name
+
+        # Answers that depend on a conversation history are never cached
+        cache_key = cached = None
+        if self.answer_cache is not None and not history:
+            cache_key = answer_cache_key(self.cache_scope, question, document_filter,
+                                         prompt_template, response_format, self._retrieval_cache_tag())
+            cached = self.answer_cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                logger.info(f"[User: {self.user_id}] Answer served from cache.")
+
+        return PreparedQuery(instructions, question, document_filter, index_name, self.cache_scope, cache_key, cached, history)
+
+
+    def _retrieval_cache_tag(self) -> dict:
+        """Everything that shapes the retrieved context, so answers built from different contexts never share a cache entry."""
+        if self.retrieval_mode != CLIENT_RETRIEVAL:
+            return {"mode": self.retrieval_mode}
+        return {"mode": self.retrieval_mode, "retrieval": asdict(self.retrieval_settings),
+                "rerank": asdict(self.rerank_settings)}
+
+
+    @property
+    def retriever(self):
+        if self._retriever is None:
+            self._retriever = self.document_collection.get_retriever(self.retrieval_settings)
+        return self._retriever
+
+
+    @property
+    def _retrieval_top_k(self) -> int:
+        top_k = self.retriever.settings.top_k
+        if self.rerank_settings.enabled:
+            return top_k * max(1, self.rerank_settings.candidate_multiplier)
+        return top_k
+
+
+    def _rerank(self, query: "PreparedQuery", chunks: List[RetrievedChunk], timer: StageTimer) -> List[RetrievedChunk]:
+        if not self.rerank_settings.enabled:
+            return chunks
+        start = time.perf_counter()
+        settings = self.retriever.settings
+        budget = self.rerank_settings.max_context_tokens or settings.max_context_tokens
+        chunks, report = rerank_chunks(query.question, chunks, settings.top_k, budget, self.rerank_settings)
+        timer.record("rerank", start)
+        self.last_rerank = report
+        telemetry.record_context_pruning(report.input_tokens, report.kept_tokens, self.user_id)
+        logger.debug(f"[User: {self.user_id}] Re-ranking {report.summary()}")
+        return chunks
+
+
+    def _grounded_messages(self, query: "PreparedQuery", chunks: List[RetrievedChunk], timer: StageTimer):
+        chunks = self._rerank(query, chunks, timer)
+        start = time.perf_counter()
+        context, used = build_context(chunks, self.retriever.settings.max_context_tokens)
+        messages = build_grounded_messages(query.instructions, query.question, context, query.history)
+        timer.record("context", start)
+        return messages, [chunk.as_citation() for chunk in used]
+
+
+    def _finish_query(self, query: "PreparedQuery", content: Optional[str], citations) -> str:
+        answer = clean_answer(content or "")
+        self.last_citations = list(citations or [])
+        telemetry.record_citations(len(citations or []), self.user_id)
+        self._store_answer(query, answer, citations)
         return answer
 
 
-    
-        # Handle conversation history
-        contextualized_question = "query : " + self.contextualize_question(question, history)
+    def _finish_stream(self, query: "PreparedQuery", answer: str, citations):
+        self.last_citations = list(citations or [])
+        telemetry.record_citations(len(citations or []), self.user_id)
+        self._store_answer(query, answer, citations)
+
+
+    def _store_answer(self, query: "PreparedQuery", answer: str, citations):
+        if query.cache_key is not None and not self.indexing_pending:
+            self.answer_cache.set(query.cache_key, query.cache_scope, answer)
+
+
+    def _complete(self, query: "PreparedQuery", completion, citations, stream: bool, stream_type, timer: StageTimer, start: float):
+        """Shared tail of the sync and async queries: wrap streams, clean answers, publish timings."""
+        timer.record("stream_open" if stream else "completion", start)
+        timer.timings["total"] = round(sum(timer.timings.values()), 2)
+        self.last_timings = timer.timings
+        logger.debug(f"[User: {self.user_id}] Query timings (ms): {timer.timings}")
 
+        if stream:
+            answer_stream = stream_type(completion, on_complete=lambda answer, cites: self._finish_stream(query, answer, cites))
+            answer_stream.citations = list(citations or [])
+            return answer_stream
+        if citations is None:
+            citations = (getattr(completion, "context", None) or {}).get('citations')
+        return self._finish_query(query, completion.content, citations)
 
 
+    @instrumented("query.rag")
+    def query_rag(self, 
+                  question: str = "", 
+                  history: List[dict[str, str]] = None,
+                  selected_files: List[str] = None,
+                  response_format: str="text",
+                  prompt_template: str = RAG_BASE_PROMPT,
+                  use_cache: bool = True,
+                  stream: bool = False
+                  ):
+        """
+        Answer a question from the user's documents, optionally restricted to `selected_files`.
+
+        When the backend has an answer cache, identical requests (same index, normalized
+        question, filter, prompt template and response format) are answered from it;
+        pass `use_cache=False` to force a fresh completion.
+
+        With `stream=True` an `AnswerStream` is returned instead of a string: iterating it
+        yields the cleaned answer as it is generated, and its `answer` and `citations`
+        are available once the stream is exhausted.
+
+        Per-stage durations of the last query are kept in `last_timings` (milliseconds).
+        """
+        self.question = "\n" + question
+        timer = StageTimer()
+        start = time.perf_counter()
+        conversation = self.conversation.prepare(question, history)
+        if history:
+            timer.record("history", start)
+        query = self._prepare_query(conversation, selected_files, response_format, prompt_template, use_cache)
+        self.document_filter = query.document_filter
+        self.index_name = query.index_name
+        if query.cached is not None:
+            return AnswerStream.from_text(query.cached) if stream else query.cached
+
+        citations = None
+        if self.retrieval_mode == CLIENT_RETRIEVAL:
+            start = time.perf_counter()
+            chunks = self.retriever.retrieve(query.question, query.document_filter, self._retrieval_top_k)
+            timer.record("retrieval", start)
+            messages, citations = self._grounded_messages(query, chunks, timer)
+            start = time.perf_counter()
+            completion = run_chat_completion(messages, response_format=response_format, stream=stream)
+        else:
+            start = time.perf_counter()
+            completion = run_completion(
+                prompt=query.prompt,
+                filter=query.document_filter,
+                index_name=query.index_name,
+                response_format=response_format,
+                stream=stream
+            )
+        return self._complete(query, completion, citations, stream, AnswerStream, timer, start)
+
+
+    @instrumented("query.rag")
+    async def aquery_rag(self,
+                         question: str = "",
+                         history: List[dict[str, str]] = None,
+                         selected_files: List[str] = None,
+                         response_format: str = "text",
+                         prompt_template: str = RAG_BASE_PROMPT,
+                         use_cache: bool = True,
+                         stream: bool = False
+                         ):
+        """Async counterpart of `query_rag`, built on the `AsyncAzureOpenAI` client (streams are `AsyncAnswerStream`)."""
+        timer = StageTimer()
+        start = time.perf_counter()
+        conversation = await self.conversation.aprepare(question, history)
+        if history:
+            timer.record("history", start)
+        query = self._prepare_query(conversation, selected_files, response_format, prompt_template, use_cache)
+        if query.cached is not None:
+            return AsyncAnswerStream.from_text(query.cached) if stream else query.cached
+
+        citations = None
+        if self.retrieval_mode == CLIENT_RETRIEVAL:
+            start = time.perf_counter()
+            chunks = await self.retriever.aretrieve(query.question, query.document_filter, self._retrieval_top_k)
+            timer.record("retrieval", start)
+            messages, citations = self._grounded_messages(query, chunks, timer)
+            start = time.perf_counter()
+            completion = await arun_chat_completion(messages, response_format=response_format, stream=stream)
+        else:
+            start = time.perf_counter()
+            completion = await arun_completion(
+                prompt=query.prompt,
+                filter=query.document_filter,
+                index_name=query.index_name,
+                response_format=response_format,
+                stream=stream
+            )
+        return self._complete(query, completion, citations, stream, AsyncAnswerStream, timer, start)
+
+
+    def query_rag_batch(self,
+                        jobs: Iterable[Union[RAGQuery, tuple]],
+                        max_concurrency: int = DEFAULT_QUERY_CONCURRENCY,
+                        return_exceptions: bool = True) -> List[Union[str, Exception]]:
+        """
+        Run many queries on a bounded thread pool and return their answers in job order.
+
+        Jobs are `RAGQuery` objects or `(question, selected_files, prompt_template[, response_format])`
+        tuples. With `return_exceptions` a failing job yields its exception instead of aborting the batch.
+        Being thread based, this also works where an event loop is already running (notebooks).
+        """
+        jobs = [as_rag_query(job) for job in jobs]
+        results: List[Union[str, Exception]] = [None] * len(jobs)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(jobs) or 1))) as executor:
+            futures = {executor.submit(self._run_job, job): i for i, job in enumerate(jobs)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    logger.error(f"[User: {self.user_id}] Query {i} failed: {e}")
+                    results[i] = e
+                logger.debug(f"[User: {self.user_id}] Batch progress {done}/{len(jobs)}")
+        return results
+
+
+    def _run_job(self, job: RAGQuery) -> str:
+        return self.query_rag(question=job.question, selected_files=job.selected_files,
+                              response_format=job.response_format, prompt_template=job.prompt_template)
+
+
+    async def _arun_job(self, job: RAGQuery) -> str:
+        return await self.aquery_rag(question=job.question, selected_files=job.selected_files,
+                                     response_format=job.response_format, prompt_template=job.prompt_template)
+
+
+    async def aquery_rag_batch(self,
+                               jobs: Iterable[Union[RAGQuery, tuple]],
+                               max_concurrency: int = DEFAULT_QUERY_CONCURRENCY,
+                               return_exceptions: bool = True) -> List[Union[str, Exception]]:
+        """Async `query_rag_batch`: at most `max_concurrency` completions in flight, answers in job order."""
+        answers = {}
+        async for i, result in self.aquery_rag_as_completed(jobs, max_concurrency, return_exceptions):
+            answers[i] = result
+        return [answers[i] for i in sorted(answers)]
+
+
+    async def aquery_rag_as_completed(self,
+                                      jobs: Iterable[Union[RAGQuery, tuple]],
+                                      max_concurrency: int = DEFAULT_QUERY_CONCURRENCY,
+                                      return_exceptions: bool = True) -> AsyncIterator[Tuple[int, Union[str, Exception]]]:
+        """Yield `(job_index, answer)` pairs as soon as each query finishes."""
+        jobs = [as_rag_query(job) for job in jobs]
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(i: int, job: RAGQuery):
+            async with semaphore:
+                try:
+                    return i, await self._arun_job(job)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    logger.error(f"[User: {self.user_id}] Query {i} failed: {e}")
+                    return i, e
+
+        tasks = [asyncio.ensure_future(run(i, job)) for i, job in enumerate(jobs)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
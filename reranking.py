@@ -0,0 +1,144 @@
+import re
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from retrieval import RetrievedChunk
+from token_utils import count_tokens
+
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+# Width of the hashed bag-of-words vectors compared when chunks carry no embedding
+HASHED_DIMENSIONS = 4096
+
+
+@dataclass
+class RerankSettings:
+    """Post-retrieval pruning of client-side retrieved chunks, before they reach the prompt."""
+    enabled: bool = True
+    # Candidates fetched from the retriever per chunk finally kept (`top_k` of the retrieval settings)
+    candidate_multiplier: int = 3
+    # Weight of the BM25 score of the question terms against the retriever's own score
+    bm25_weight: float = 0.3
+    bm25_k1: float = 1.2
+    bm25_b: float = 0.75
+    # MMR trade-off: 1.0 ranks on relevance only, lower values favour diverse chunks
+    mmr_lambda: float = 0.7
+    # Chunks of the same parent document at least this similar to a kept one are dropped
+    duplicate_threshold: float = 0.9
+    # Token budget of the kept chunks; None uses the retrieval settings' `max_context_tokens`
+    max_context_tokens: Optional[int] = None
+
+
+@dataclass
+class RerankReport:
+    input_chunks: int = 0
+    kept_chunks: int = 0
+    duplicates: int = 0
+    input_tokens: int = 0
+    kept_tokens: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.input_tokens - self.kept_tokens
+
+    def summary(self) -> str:
+        return (f"kept {self.kept_chunks}/{self.input_chunks} chunks ({self.duplicates} duplicates), "
+                f"{self.kept_tokens}/{self.input_tokens} tokens ({self.tokens_saved} saved)")
+
+
+def _terms(text: str) -> List[str]:
+    return _TERM.findall(text.lower())
+
+
+def _minmax(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min() if len(values) else 0.0
+    return (values - values.min()) / spread if spread > 0 else np.ones_like(values)
+
+
+def bm25_scores(question: str, texts: List[str], k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """BM25 of the question terms over the candidate chunks (the candidates are the corpus)."""
+    query_terms = sorted(set(_terms(question)))
+    if not query_terms or not texts:
+        return np.zeros(len(texts), dtype=np.float32)
+    column = {term: i for i, term in enumerate(query_terms)}
+    tf = np.zeros((len(texts), len(query_terms)), dtype=np.float32)
+    lengths = np.zeros(len(texts), dtype=np.float32)
+    for row, text in enumerate(texts):
+        terms = _terms(text)
+        lengths[row] = len(terms)
+        for term in terms:
+            i = column.get(term)
+            if i is not None:
+                tf[row, i] += 1
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _hashed_vectors(texts: List[str]) -> np.ndarray:
+    vectors = np.zeros((len(texts), HASHED_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for term in _terms(text):
+            vectors[row, zlib.crc32(term.encode("utf-8")) % HASHED_DIMENSIONS] += 1
+    return vectors
+
+
+def similarity_matrix(chunks: List[RetrievedChunk]) -> np.ndarray:
+    """Pairwise cosine similarity: embeddings when every chunk has one, hashed term counts otherwise."""
+    if chunks and all(chunk.vector is not None for chunk in chunks):
+        vectors = np.asarray([chunk.vector for chunk in chunks], dtype=np.float32)
+    else:
+        vectors = _hashed_vectors([chunk.chunk for chunk in chunks])
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors @ vectors.T
+
+
+def rerank_chunks(question: str, chunks: List[RetrievedChunk], top_k: int, max_tokens: int,
+                  settings: Optional[RerankSettings] = None) -> Tuple[List[RetrievedChunk], RerankReport]:
+    """
+    Re-score the candidates (retriever score blended with BM25), drop near-duplicates of a
+    kept chunk from the same parent document, then pick up to `top_k` chunks by maximal
+    marginal relevance until `max_tokens` is spent. Returns the kept chunks, best first.
+    """
+    settings = settings or RerankSettings()
+    tokens = [count_tokens(chunk.chunk) for chunk in chunks]
+    report = RerankReport(input_chunks=len(chunks), input_tokens=sum(tokens))
+    if not chunks:
+        return [], report
+
+    retriever_scores = _minmax(np.asarray([chunk.score for chunk in chunks], dtype=np.float32))
+    bm25 = _minmax(bm25_scores(question, [chunk.chunk for chunk in chunks], settings.bm25_k1, settings.bm25_b))
+    relevance = (1 - settings.bm25_weight) * retriever_scores + settings.bm25_weight * bm25
+    similarity = similarity_matrix(chunks)
+    parents = np.asarray([chunk.parent_id for chunk in chunks], dtype=object)
+
+    selected: List[int] = []
+    # Highest similarity of each candidate to the chunks kept so far
+    max_similarity = np.zeros(len(chunks), dtype=np.float32)
+    available = np.ones(len(chunks), dtype=bool)
+    budget = max_tokens
+    while available.any() and len(selected) < top_k:
+        mmr = settings.mmr_lambda * relevance - (1 - settings.mmr_lambda) * max_similarity
+        best = int(np.argmax(np.where(available, mmr, -np.inf)))
+        available[best] = False
+        if tokens[best] > budget and selected:
+            # Too long for what is left; a shorter candidate may still fit
+            continue
+        selected.append(best)
+        # The best chunk is always kept, truncated to the budget by `build_context` if need be
+        report.kept_tokens += min(tokens[best], budget)
+        budget -= min(tokens[best], budget)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+        parent = chunks[best].parent_id
+        if parent is not None:
+            duplicates = available & (similarity[best] >= settings.duplicate_threshold) & (parents == parent)
+            report.duplicates += int(duplicates.sum())
+            available &= ~duplicates
+
+    kept = [chunks[i] for i in selected]
+    report.kept_chunks = len(kept)
+    return kept, report
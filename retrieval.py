@@ -0,0 +1,148 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.models import VectorizableTextQuery
+from loguru import logger
+
+from azure_search_utils.clients import get_search_client, registry
+from token_utils import count_tokens, truncate_to_tokens
+from telemetry import span
+
+
+HYBRID = "hybrid"
+VECTOR = "vector"
+KEYWORD = "keyword"
+RETRIEVAL_MODES = (HYBRID, VECTOR, KEYWORD)
+
+# Fields of the index built by `build_azure_search_index` that the retriever reads
+SELECT_FIELDS = ["chunk_id", "parent_id", "title", "chunk"]
+
+
+@dataclass
+class RetrievedChunk:
+    chunk_id: str
+    title: str
+    chunk: str
+    parent_id: Optional[str] = None
+    score: float = 0.0
+    vector: Optional[List[float]] = None
+
+    def as_citation(self) -> dict:
+        # Same shape as the citations returned by the "data_sources" extension
+        return {"title": self.title, "content": self.chunk, "chunk_id": self.chunk_id, "filepath": None, "url": None}
+
+
+@dataclass
+class RetrievalSettings:
+    """Knobs of client-side retrieval: how many chunks, which search mix and how much context."""
+    top_k: int = 8
+    mode: str = HYBRID
+    # Neighbours requested from the vector side of a hybrid/vector query
+    k_nearest_neighbors: int = 50
+    # Relative weight of the vector query in hybrid ranking (1.0 = the service default)
+    vector_weight: float = 1.0
+    # Token budget of the documents placed in the prompt
+    max_context_tokens: int = 6000
+
+    def __post_init__(self):
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{self.mode}', expected one of {RETRIEVAL_MODES}")
+
+
+@dataclass
+class StageTimer:
+    """Wall-clock duration of each stage of a query, in milliseconds."""
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, stage: str, start: float):
+        self.timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+class SearchRetriever:
+    """Queries an Azure AI Search index directly, using its integrated vectorizer for the query embedding."""
+
+    def __init__(self, endpoint: str, index_name: str, credential: AzureKeyCredential,
+                 settings: Optional[RetrievalSettings] = None):
+        self.endpoint = endpoint
+        self.index_name = index_name
+        self.credential = credential
+        self.settings = settings or RetrievalSettings()
+
+    def _search_kwargs(self, question: str, document_filter: Optional[str], top_k: int) -> dict:
+        settings = self.settings
+        kwargs = dict(filter=document_filter, top=top_k, select=SELECT_FIELDS)
+        if settings.mode != VECTOR:
+            kwargs["search_text"] = question
+        if settings.mode != KEYWORD:
+            kwargs["vector_queries"] = [VectorizableTextQuery(
+                text=question,
+                k_nearest_neighbors=max(top_k, settings.k_nearest_neighbors),
+                fields="text_vector",
+                weight=settings.vector_weight,
+            )]
+        return kwargs
+
+    @staticmethod
+    def _to_chunk(result: dict) -> RetrievedChunk:
+        return RetrievedChunk(
+            chunk_id=result["chunk_id"],
+            title=result.get("title") or "",
+            chunk=result.get("chunk") or "",
+            parent_id=result.get("parent_id"),
+            score=result.get("@search.score") or 0.0,
+        )
+
+    def retrieve(self, question: str, document_filter: Optional[str] = None,
+                 top_k: Optional[int] = None) -> List[RetrievedChunk]:
+        with span("query.retrieval", index=self.index_name, mode=self.settings.mode) as current:
+            client = get_search_client(self.endpoint, self.index_name, self.credential)
+            results = client.search(**self._search_kwargs(question, document_filter, top_k or self.settings.top_k))
+            chunks = [self._to_chunk(r) for r in results]
+            current.set_attribute("rag.retrieved_chunks", len(chunks))
+        return chunks
+
+    async def aretrieve(self, question: str, document_filter: Optional[str] = None,
+                        top_k: Optional[int] = None) -> List[RetrievedChunk]:
+        with span("query.retrieval", index=self.index_name, mode=self.settings.mode) as current:
+            client = registry.async_search_client(self.endpoint, self.index_name, self.credential)
+            results = await client.search(**self._search_kwargs(question, document_filter, top_k or self.settings.top_k))
+            chunks = [self._to_chunk(r) async for r in results]
+            current.set_attribute("rag.retrieved_chunks", len(chunks))
+        return chunks
+
+
+def build_context(chunks: List[RetrievedChunk], max_tokens: int) -> Tuple[str, List[RetrievedChunk]]:
+    """
+    Render retrieved chunks as numbered `[docN]` sources, best first, until the token budget
+    is spent. The last source that does not fit is truncated rather than dropped.
+    """
+    parts, used, remaining = [], [], max_tokens
+    for chunk in chunks:
+        header = f"[doc{len(used) + 1}] (source: {chunk.title})\n"
+        cost = count_tokens(header) + count_tokens(chunk.chunk)
+        if cost <= remaining:
+            parts.append(header + chunk.chunk)
+        else:
+            text = truncate_to_tokens(chunk.chunk, remaining - count_tokens(header))
+            if not text:
+                break
+            parts.append(header + text)
+        used.append(chunk)
+        remaining -= cost
+        if remaining <= 0:
+            break
+    if len(used) < len(chunks):
+        logger.debug(f"Context budget of {max_tokens} tokens kept {len(used)}/{len(chunks)} chunks.")
+    return "\n\n".join(parts), used
+
+
+def build_grounded_messages(instructions: str, question: str, context: str,
+                            history: Tuple[dict, ...] = ()) -> List[dict]:
+    system = (
+        f"{instructions}\n\n"
+        "Answer using only the documents below. Cite them with their [docN] tag.\n\n"
+        f"Documents:\n{context if context else '(no matching documents)'}"
+    )
+    return [{"role": "system", "content": system}, *history, {"role": "user", "content": question}]
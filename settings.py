@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def load_environment() -> bool:
+    """
+    Load the `.env` file into `os.environ`, once per process.
+
+    `load_dotenv()` searches the directory tree for the file on every call, and each module
+    reading its settings at import time used to run it again.
+    """
+    from dotenv import load_dotenv
+    return load_dotenv()
@@ -0,0 +1,268 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+
+
+# Comma-separated exporters: "metrics" (in-process, Prometheus text format), "otel" (OpenTelemetry
+# spans, needs the opentelemetry-api package). Empty or "off" disables instrumentation.
+TELEMETRY = os.environ.get("RAG_TELEMETRY", "")
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# User the current query / ingestion runs for, when the instrumented code has no `user_name` at hand
+current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rag_current_user", default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """Counters and duration histograms kept in memory, exportable in the Prometheus text format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms: Dict[Tuple[str, Labels], list] = {}
+
+    @staticmethod
+    def _labels(labels: dict) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def counter(self, name: str, **labels) -> float:
+        return self._counters.get((name, self._labels(labels)), 0.0)
+
+    def summary(self, name: str, **labels) -> Tuple[int, float]:
+        """(count, total seconds) of a duration histogram."""
+        histogram = self._histograms.get((name, self._labels(labels)))
+        return (histogram[-1], histogram[-2]) if histogram else (0, 0.0)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        def fmt(labels: Labels, extra: str = "") -> str:
+            parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{fmt(labels)} {value:g}" for (n, labels), value in counters if n == name)
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (n, labels), values in histograms:
+                if n != name:
+                    continue
+                for bound, count in zip(self.buckets, values):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{name}_bucket{fmt(labels, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{fmt(labels, le)} {values[-1]}")
+                lines.append(f"{name}_sum{fmt(labels)} {values[-2]:.6f}")
+                lines.append(f"{name}_count{fmt(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class _NoopSpan:
+    """Returned by `span` when telemetry is off: entering and leaving it costs two method calls."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Telemetry:
+    def __init__(self, exporters: str = TELEMETRY):
+        self.metrics = MetricsRegistry()
+        self.configure(exporters)
+
+    def configure(self, exporters: str):
+        names = {name.strip().lower() for name in (exporters or "").split(",")} - {"", "off", "0", "false"}
+        self.metrics_enabled = bool(names & {"metrics", "prometheus", "1", "on", "true"})
+        self.tracer = None
+        if "otel" in names:
+            try:
+                from opentelemetry import trace
+                self.tracer = trace.get_tracer("rag_azure_search")
+            except ImportError:
+                logger.warning("⚠️ RAG_TELEMETRY requests OpenTelemetry but opentelemetry-api is not installed.")
+        self.enabled = self.metrics_enabled or self.tracer is not None
+
+    def span(self, name: str, user: Optional[str] = None, **attributes):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._span(name, user or current_user.get(), attributes)
+
+    @contextmanager
+    def _span(self, name: str, user: Optional[str], attributes: dict) -> Iterator:
+        start = time.perf_counter()
+        status = "ok"
+        otel_context = self.tracer.start_as_current_span(name) if self.tracer is not None else None
+        otel_span = otel_context.__enter__() if otel_context is not None else _NOOP_SPAN
+        if user:
+            otel_span.set_attribute("rag.user", user)
+        for key, value in attributes.items():
+            otel_span.set_attribute(f"rag.{key}", value)
+        try:
+            yield otel_span
+        except BaseException as e:
+            status = "error"
+            if otel_context is not None:
+                otel_context.__exit__(type(e), e, e.__traceback__)
+                otel_context = None
+            raise
+        finally:
+            if otel_context is not None:
+                otel_context.__exit__(None, None, None)
+            if self.metrics_enabled:
+                self.metrics.observe("rag_operation_duration_seconds", time.perf_counter() - start,
+                                     operation=name, user=user, status=status)
+
+    def record_usage(self, usage, operation: str, user: Optional[str] = None):
+        """Token counts of an OpenAI response (`response.usage`)."""
+        if not self.enabled or usage is None:
+            return
+        user = user or current_user.get()
+        for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = getattr(usage, kind, None) or 0
+            if self.metrics_enabled:
+                self.metrics.inc(f"rag_{kind}_total", value, operation=operation, user=user)
+            if self.tracer is not None:
+                from opentelemetry import trace
+                trace.get_current_span().set_attribute(f"rag.usage.{kind}", value)
+
+    def record_context_pruning(self, input_tokens: int, kept_tokens: int, user: Optional[str] = None):
+        """Context tokens retrieved vs. sent to the model after re-ranking."""
+        if not self.enabled:
+            return
+        user = user or current_user.get()
+        if self.metrics_enabled:
+            self.metrics.inc("rag_context_tokens_total", kept_tokens, user=user)
+            self.metrics.inc("rag_context_tokens_saved_total", input_tokens - kept_tokens, user=user)
+        if self.tracer is not None:
+            from opentelemetry import trace
+            trace.get_current_span().set_attribute("rag.context_tokens_saved", input_tokens - kept_tokens)
+
+    def record_citations(self, count: int, user: Optional[str] = None):
+        if not self.enabled:
+            return
+        user = user or current_user.get()
+        if self.metrics_enabled:
+            self.metrics.inc("rag_queries_total", 1, user=user)
+            self.metrics.inc("rag_citations_total", count, user=user)
+        if self.tracer is not None:
+            from opentelemetry import trace
+            trace.get_current_span().set_attribute("rag.citations", count)
+
+
+telemetry = Telemetry()
+
+
+def span(name: str, user: Optional[str] = None, **attributes):
+    return telemetry.span(name, user, **attributes)
+
+
+def instrumented(name: str):
+    """
+    Time a (sync or async) method as a span, attributed to the instance's `user_name` (or
+    `user_id`), which also becomes the `current_user` of everything called inside it.
+    When telemetry is off the wrapper adds a single attribute check to the call.
+    """
+    def decorator(method):
+        def user_of(instance) -> Optional[str]:
+            return getattr(instance, "user_name", None) or getattr(instance, "user_id", None)
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                if not telemetry.enabled:
+                    return await method(self, *args, **kwargs)
+                user = user_of(self)
+                with user_context(user), telemetry.span(name, user):
+                    return await method(self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not telemetry.enabled:
+                return method(self, *args, **kwargs)
+            user = user_of(self)
+            with user_context(user), telemetry.span(name, user):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def user_context(user: Optional[str]):
+    """Attribute everything recorded inside the block (including by helper functions) to `user`."""
+    token = current_user.set(user)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+def render_prometheus() -> str:
+    return telemetry.metrics.render_prometheus()
+
+
+def serve_prometheus(port: int = 9464, host: str = "0.0.0.0"):
+    """Expose `render_prometheus()` on http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200 if self.path.startswith("/metrics") else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="prometheus-metrics", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,46 @@
+# Shared setup of the test suite: placeholder credentials and the in-memory fakes of `benchmarks.fakes`
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The backend modules read their configuration at import time: never let a local .env
+# point the tests at real resources
+os.environ.update({
+    "AZURE_COGNITIVE_SERVICES_ENDPOINT": "https://fake.openai.azure.com",
+    "AZURE_MULTI_OPENAI_ENDPOINT": "https://fake.openai.azure.com",
+    "AZURE_COGNITIVE_API": "fake-key",
+    "AZURE_AI_SEARCH_ENDPOINT": "https://fake.search.windows.net",
+    "AZURE_AI_SEARCH_API_KEY": "fake-key",
+    "AZURE_BLOB_CONNECTION_STRING": "UseDevelopmentStorage=true",
+    "CHAT_DEPLOYMENT": "fake-chat",
+    "EMBEDDING_DEPLOYMENT": "fake-embedding",
+    "RAG_STATE_DIR": tempfile.mkdtemp(prefix="rag_tests_"),
+    "RAG_SEARCH_BACKEND": "azure",
+})
+
+
+def instant_profile(**kwargs):
+    from benchmarks.fakes import FakeServiceProfile
+    return FakeServiceProfile(latency_ms=0.0, jitter_ms=0.0, **kwargs)
+
+
+@pytest.fixture
+def fake_azure():
+    """Fresh fakes without latency, installed in place of every Azure client."""
+    from benchmarks.fakes import FakeAzureConfig, install_fakes
+
+    config = FakeAzureConfig(
+        blob=instant_profile(),
+        search=instant_profile(),
+        chat=instant_profile(payload_size=200),
+        embeddings=instant_profile(payload_size=64),
+        indexer_ms_per_document=0.0,
+    )
+    return install_fakes(config)
@@ -0,0 +1,55 @@
+import uuid
+
+import pytest
+
+from answer_cache import AnswerCache, InMemoryAnswerCache
+
+
+def test_answer_cache_is_abstract():
+    with pytest.raises(TypeError):
+        AnswerCache()
+
+
+def new_backend():
+    from rag import RAGBackEnd
+    return RAGBackEnd(f"user{uuid.uuid4().hex[:8]}", answer_cache=InMemoryAnswerCache())
+
+
+def test_answers_are_not_cached_until_indexing_finished(fake_azure, tmp_path):
+    backend = new_backend()
+    document = tmp_path / "contract.txt"
+    document.write_text("The supplier delivers within thirty days.")
+    backend.document_index_pipeline([str(document)])
+    assert backend.indexing_pending
+
+    backend.query_rag("When are the goods delivered?")
+    calls = fake_azure.openai.calls
+    backend.query_rag("When are the goods delivered?")
+    assert fake_azure.openai.calls == calls + 1
+
+    backend.wait_until_indexed(timeout=5)
+    assert not backend.indexing_pending
+    backend.query_rag("When are the goods delivered?")
+    calls = fake_azure.openai.calls
+    backend.query_rag("When are the goods delivered?")
+    assert fake_azure.openai.calls == calls
+
+
+def test_cache_key_depends_on_how_the_context_is_retrieved(fake_azure):
+    from rag import CLIENT_RETRIEVAL, RAGBackEnd
+    from retrieval import RetrievalSettings
+
+    def key(**kwargs):
+        backend = RAGBackEnd("user-cache-key", answer_cache=InMemoryAnswerCache(), **kwargs)
+        return backend._prepare_query(("Question?", ()), None, "text", "{selected_file}", True).cache_key
+
+    extension = key()
+    hybrid = key(retrieval_mode=CLIENT_RETRIEVAL)
+    assert len({
+        extension,
+        hybrid,
+        key(retrieval_mode=CLIENT_RETRIEVAL, retrieval_settings=RetrievalSettings(mode="vector")),
+        key(retrieval_mode=CLIENT_RETRIEVAL, retrieval_settings=RetrievalSettings(top_k=3)),
+        key(retrieval_mode=CLIENT_RETRIEVAL, retrieval_settings=RetrievalSettings(max_context_tokens=2000)),
+    }) == 5
+    assert key(retrieval_mode=CLIENT_RETRIEVAL) == hybrid
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from answer_stream import CitationStripper
+from rag import clean_answer
+
+
+ANSWERS = [
+    "Delivery is due within thirty days [doc1].",
+    "  The buyer pays [doc2] after acceptance [doc10] , not before [doc3]  .",
+    "Clause 4 [doc1][doc2] applies ; clause 5 [doc3]: does not!",
+    "No citation here, just   spaces\n and lines.",
+    "[doc1] Leading marker and a trailing partial [doc",
+    "Brackets that are not citations [1] or [docs] stay.",
+]
+
+
+def stream(text: str, sizes) -> str:
+    stripper = CitationStripper()
+    parts, start = [], 0
+    for size in sizes:
+        parts.append(stripper.feed(text[start:start + size]))
+        start += size
+    parts.append(stripper.feed(text[start:]))
+    parts.append(stripper.flush())
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("text", ANSWERS)
+def test_streamed_answer_matches_clean_answer_at_every_split(text):
+    for cut in range(len(text) + 1):
+        assert stream(text, [cut]) == clean_answer(text)
+
+
+@pytest.mark.parametrize("text", ANSWERS)
+def test_streamed_answer_matches_clean_answer_for_random_chunks(text):
+    rng = random.Random(0)
+    for _ in range(50):
+        sizes = [rng.randint(1, 6) for _ in range(len(text))]
+        assert stream(text, sizes) == clean_answer(text)
+
+
+def test_partial_marker_is_held_back():
+    stripper = CitationStripper()
+    assert stripper.feed("Paid on delivery [do") == "Paid on delivery"
+    assert stripper.feed("c4].") == "."
+    assert stripper.flush() == ""
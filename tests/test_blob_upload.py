@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def new_collection(**kwargs):
+    from embeddings import UserDocumentCollection
+    return UserDocumentCollection(f"user{uuid.uuid4().hex[:8]}", warm_up=False, **kwargs)
+
+
+def stored_blobs(fake_azure, collection):
+    return fake_azure.blob.containers[collection.container_name]
+
+
+def test_same_content_under_another_name_is_uploaded(fake_azure):
+    collection = new_collection()
+    assert collection.add_file_to_blob_container("a.txt", b"same bytes")
+    assert collection.add_file_to_blob_container("b.txt", b"same bytes")
+    assert set(stored_blobs(fake_azure, collection)) == {"a.txt", "b.txt"}
+
+
+def test_same_content_is_skipped_when_asked(fake_azure):
+    collection = new_collection()
+    collection.skip_duplicate_content = True
+    assert collection.add_file_to_blob_container("a.txt", b"same bytes")
+    assert not collection.add_file_to_blob_container("b.txt", b"same bytes")
+    assert set(stored_blobs(fake_azure, collection)) == {"a.txt"}
+
+
+def test_unchanged_file_is_not_uploaded_again(fake_azure):
+    collection = new_collection()
+    assert collection.add_file_to_blob_container("a.txt", b"v1")
+    assert not collection.add_file_to_blob_container("a.txt", b"v1")
+    assert collection.add_file_to_blob_container("a.txt", b"v2")
+    assert stored_blobs(fake_azure, collection)["a.txt"][0] == b"v2"
+
+
+def test_concurrent_uploads_of_one_name_keep_the_manifest_in_sync(fake_azure):
+    collection = new_collection()
+    assert collection.add_file_to_blob_container("a.txt", b"v0")
+    record = collection.manifest.record
+
+    def slow_record(blob_name, content_hash):
+        # The first upload is still recording when the second one classifies the name
+        if content_hash == hashlib.sha256(b"v1").hexdigest():
+            time.sleep(0.2)
+        record(blob_name, content_hash)
+
+    collection.manifest.record = slow_record
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(collection.add_file_to_blob_container, "a.txt", b"v1")
+        time.sleep(0.05)
+        second = executor.submit(collection.add_file_to_blob_container, "a.txt", b"v2")
+        assert first.result() and second.result()
+    content, metadata = stored_blobs(fake_azure, collection)["a.txt"]
+    assert content == b"v2"
+    assert collection.manifest.load(collection.ensure_container())["a.txt"] == metadata["content_sha256"]
+
+
+def test_upload_recreates_a_container_deleted_elsewhere(fake_azure):
+    collection = new_collection()
+    assert collection.add_file_to_blob_container("a.txt", b"first")
+    # e.g. removed by the resource sweeper of another process
+    fake_azure.blob.get_container_client(collection.container_name).delete_container()
+    assert collection.add_file_to_blob_container("b.txt", b"second")
+    assert set(stored_blobs(fake_azure, collection)) == {"b.txt"}
+    # The manifest was reset with the container: "a.txt" is uploaded again
+    assert collection.add_file_to_blob_container("a.txt", b"first")
+
+
+class TrickleReader:
+    """Async `read(n)` that hands out at most `step` bytes per call, like a network stream."""
+
+    def __init__(self, data: bytes, step: int):
+        self.data, self.step, self.offset = data, step, 0
+
+    async def read(self, n: int) -> bytes:
+        chunk = self.data[self.offset:self.offset + min(n, self.step)]
+        self.offset += len(chunk)
+        return chunk
+
+
+async def trickle(data: bytes, step: int):
+    for start in range(0, len(data), step):
+        yield data[start:start + step]
+
+
+async def collect(blocks):
+    return [block async for block in blocks]
+
+
+def test_async_streams_are_rechunked_into_full_blocks():
+    from azure_search_utils.blob_upload import _aread_blocks
+
+    data = bytes(range(256)) * 10
+    for stream in (TrickleReader(data, 7), trickle(data, 7)):
+        blocks = asyncio.run(collect(_aread_blocks(stream, 1000)))
+        assert [len(block) for block in blocks] == [1000, 1000, 560]
+        assert b"".join(blocks) == data
+    assert asyncio.run(collect(_aread_blocks(TrickleReader(data[:2000], 7), 1000))) == [data[:1000], data[1000:2000]]
+    assert asyncio.run(collect(_aread_blocks(trickle(b"", 7), 1000))) == []
+
+
+def test_interrupted_upload_resumes_from_the_staged_blocks(fake_azure):
+    from azure_search_utils.blob_upload import UploadSettings, UploadSource, block_id, upload_blocks
+
+    fake_azure.blob.get_container_client("resume").create_container()
+    blob = fake_azure.blob.get_container_client("resume").get_blob_client("big.bin")
+    data = bytes(range(256)) * 40
+    settings = UploadSettings(block_size=1024, max_concurrency=2)
+    with UploadSource(data) as source:
+        staged = source.fingerprint(settings.block_size)
+        assert staged.block_ids[3] == block_id(3, data[3072:4096])
+        # An earlier attempt staged the first two blocks before failing
+        for index in (0, 1):
+            blob.stage_block(staged.block_ids[index], source.block(index, settings.block_size))
+        calls = fake_azure.blob.calls
+        upload_blocks(blob, source, staged, {"owner": "x"}, overwrite=True, settings=settings)
+
+    assert staged.resumed_blocks == 2
+    # Block list, the eight missing blocks and the commit
+    assert fake_azure.blob.calls - calls == 1 + 8 + 1
+    assert fake_azure.blob.containers["resume"]["big.bin"][0] == data
+
+
+def test_stream_of_a_single_block_is_not_staged(fake_azure):
+    from azure_search_utils.blob_upload import UploadSettings, astage_stream
+    from benchmarks.fakes import FakeAsyncBlobClient
+
+    fake_azure.blob.get_container_client("single").create_container()
+    blob = FakeAsyncBlobClient(fake_azure.blob.get_container_client("single").get_blob_client("small.txt"))
+    settings = UploadSettings(block_size=1024)
+
+    staged = asyncio.run(astage_stream(blob, trickle(b"x" * 1000, 300), settings))
+    assert staged.data == b"x" * 1000 and staged.block_ids == []
+    assert staged.content_hash == hashlib.sha256(b"x" * 1000).hexdigest()
+    assert fake_azure.blob.staged_blocks == {}
+
+    staged = asyncio.run(astage_stream(blob, TrickleReader(b"y" * 3000, 300), settings))
+    assert staged.data is None and len(staged.block_ids) == 3 and staged.size == 3000
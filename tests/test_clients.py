@@ -0,0 +1,128 @@
+import asyncio
+import io
+import json
+from typing import Dict
+
+import requests
+from azure.core.credentials import AzureKeyCredential
+from requests.adapters import BaseAdapter
+from urllib3.response import HTTPResponse
+
+from azure_search_utils.clients import ClientRegistry, _credential_id
+
+
+def test_async_clients_are_cached_per_event_loop():
+    registry = ClientRegistry()
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    async def get():
+        return registry._get_async(("kind",), factory), registry._get_async(("kind",), factory)
+
+    first, again = asyncio.run(get())
+    assert first is again
+    # A new loop (which may reuse the id of the closed one) gets its own client
+    second, _ = asyncio.run(get())
+    assert second is not first
+    assert len(created) == 2
+
+
+def test_clients_of_closed_loops_are_dropped():
+    registry = ClientRegistry()
+
+    async def get():
+        return registry._get_async(("kind",), object)
+
+    loops = [asyncio.new_event_loop() for _ in range(3)]
+    for loop in loops:
+        loop.run_until_complete(get())
+        loop.close()
+    async def cached_loops():
+        await get()
+        return len(registry._async_clients)
+
+    assert asyncio.run(cached_loops()) == 1
+
+
+CONNECTION_STRING = "DefaultEndpointsProtocol=https;AccountName=fake;AccountKey=ZmFrZQ==;EndpointSuffix=core.windows.net"
+ENDPOINT = "https://fake.search.windows.net"
+CREDENTIAL = AzureKeyCredential("fake-key")
+
+
+def retry_totals(registry: ClientRegistry) -> Dict[str, int]:
+    sync_clients = {
+        "index": registry.search_index_client(ENDPOINT, CREDENTIAL)._client,
+        "indexer": registry.search_indexer_client(ENDPOINT, CREDENTIAL)._client,
+        "blob": registry.blob_service_client(CONNECTION_STRING),
+        "search": registry.search_client(ENDPOINT, "index", CREDENTIAL)._client,
+    }
+
+    async def async_clients():
+        clients = {
+            "async_index": registry.async_search_index_client(ENDPOINT, CREDENTIAL)._client,
+            "async_indexer": registry.async_search_indexer_client(ENDPOINT, CREDENTIAL)._client,
+            "async_blob": registry.async_blob_service_client(CONNECTION_STRING),
+            "async_search": registry.async_search_client(ENDPOINT, "index", CREDENTIAL)._client,
+        }
+        totals = {name: client._config.retry_policy.total_retries for name, client in clients.items()}
+        await registry.aclose()
+        return totals
+
+    totals = {name: client._config.retry_policy.total_retries for name, client in sync_clients.items()}
+    registry.close()
+    return {**totals, **asyncio.run(async_clients())}
+
+
+def test_sdk_retries_are_off_only_for_the_throttled_clients():
+    totals = retry_totals(ClientRegistry(throttling=True))
+    throttled = {"index", "indexer", "async_index", "async_indexer"}
+    assert {name for name, total in totals.items() if total == 0} == throttled
+    assert all(total > 0 for name, total in totals.items() if name not in throttled)
+
+
+def test_sdk_retries_are_kept_without_the_throttling_layer():
+    assert all(total > 0 for total in retry_totals(ClientRegistry(throttling=False)).values())
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Answers each request with the next (status, headers, body) of the script."""
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        status, headers, body = self.script[min(self.requests, len(self.script) - 1)]
+        self.requests += 1
+        headers = {"Content-Type": "application/json; charset=utf-8", **headers}
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = HTTPResponse(body=io.BytesIO(json.dumps(body).encode("utf-8")), headers=headers,
+                                    status=status, preload_content=False)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_throttled_search_is_retried_by_the_sdk():
+    registry = ClientRegistry(throttling=True)
+    adapter = ScriptedAdapter([
+        (429, {"Retry-After": "0"}, {"error": {"code": "Throttled", "message": "Too many requests"}}),
+        (200, {}, {"value": [{"@search.score": 1.0, "chunk_id": "c1"}]}),
+    ])
+    transport = registry._transport(("search", ENDPOINT, _credential_id(CREDENTIAL)))
+    transport.session.mount("https://", adapter)
+
+    results = list(registry.search_client(ENDPOINT, "index", CREDENTIAL).search(search_text="question"))
+
+    assert [r["chunk_id"] for r in results] == ["c1"]
+    assert adapter.requests == 2
+    registry.close()
@@ -0,0 +1,81 @@
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+import embedding_cache
+from embedding_cache import CachedEmbedder, EmbeddingCache, get_embedding_cache, with_embedding_cache
+
+
+def vector(key: str, dimensions: int):
+    return np.random.default_rng(int(hashlib.sha1(key.encode()).hexdigest()[:8], 16)).random(dimensions).astype(np.float32)
+
+
+def counting_embedder(dimensions: int):
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [vector(text, dimensions) for text in texts]
+
+    return embed, calls
+
+
+def test_each_vector_size_is_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(embedding_cache, "_shared_caches", {})
+    for dimensions in (None, 512, 256):
+        embed, calls = counting_embedder(dimensions or 1536)
+        cached = with_embedding_cache(embed, "model", dimensions)
+        assert isinstance(cached, CachedEmbedder)
+        first = cached(["a", "b"])
+        assert cached(["b", "a"]) == [first[1], first[0]]
+        assert calls == [["a", "b"]]
+        assert get_embedding_cache(dimensions).dimensions == (dimensions or 1536)
+
+
+def _put_keys(path: str, worker: int, count: int):
+    cache = EmbeddingCache(path, max_entries=4096)
+    for start in range(0, count, 50):
+        keys = [f"w{worker}-{i}" for i in range(start, start + 50)]
+        cache.put_many({key: vector(key, 8) for key in keys})
+    cache.close()
+
+
+def test_processes_sharing_a_cache_never_share_slots(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_put_keys, args=(str(tmp_path), worker, 600)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = EmbeddingCache(tmp_path, max_entries=4096)
+    keys = [f"w{worker}-{i}" for worker in range(4) for i in range(600)]
+    found = cache.get_many(keys)
+    assert len(found) == len(keys)
+    for key in keys:
+        np.testing.assert_array_equal(found[key], vector(key, 8))
+
+
+def test_full_cache_evicts_other_entries_than_the_rewritten_ones(tmp_path):
+    cache = EmbeddingCache(tmp_path, max_entries=2)
+    cache.put_many({"a": vector("a", 4)})
+    cache.put_many({"b": vector("b", 4)})
+    # "a" is rewritten by the same call: the least recently used entry left is "b"
+    cache.put_many({"a": vector("a2", 4), "n": vector("n", 4)})
+
+    found = cache.get_many(["a", "b", "n"])
+    assert sorted(found) == ["a", "n"]
+    assert np.allclose(found["a"], vector("a2", 4)) and np.allclose(found["n"], vector("n", 4))
+
+
+def test_keys_beyond_the_capacity_of_a_full_cache_are_not_stored(tmp_path):
+    cache = EmbeddingCache(tmp_path, max_entries=2)
+    cache.put_many({"a": vector("a", 4), "b": vector("b", 4)})
+    cache.put_many({"a": vector("a2", 4), "b": vector("b2", 4), "n": vector("n", 4)})
+
+    found = cache.get_many(["a", "b", "n"])
+    assert sorted(found) == ["a", "b"]
+    assert np.allclose(found["b"], vector("b2", 4))
@@ -0,0 +1,94 @@
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from extraction import (
+    BRUSSEL_TASKS, ExtractionError, ExtractionRunner, ExtractionTask, parse_json_answer
+)
+from prompts import BRUSSEL_EXPECTED_KEYS, BRUSSEL_PILLAR_EXPECTED_KEYS
+
+
+def test_parse_json_answer_keeps_the_expected_keys_in_order():
+    answer = '```json\n{"b": 2, "a": 1, "extra": 3}\n```'
+    assert list(parse_json_answer(answer, ("a", "b")).items()) == [("a", 1), ("b", 2)]
+
+
+def test_parse_json_answer_tolerates_prose_around_the_object():
+    assert parse_json_answer('Here it is: {"a": null} Hope this helps.', ("a",)) == {"a": None}
+
+
+@pytest.mark.parametrize("answer", ["not json", "[1, 2]", '{"a": 1', ""])
+def test_parse_json_answer_rejects_non_objects(answer):
+    with pytest.raises(ExtractionError):
+        parse_json_answer(answer, ("a",))
+
+
+def test_parse_json_answer_rejects_missing_keys():
+    with pytest.raises(ExtractionError, match="missing"):
+        parse_json_answer('{"a": 1}', ("a", "b"))
+
+
+def json_chat(messages, stream=False, extra_body=None, **kwargs):
+    """Answers each Brussels prompt with a JSON object holding its keys."""
+    prompt = "\n".join(m["content"] for m in messages)
+    assert "{selected_file}" not in prompt
+    keys = BRUSSEL_PILLAR_EXPECTED_KEYS if '"AI/data"' in prompt else BRUSSEL_EXPECTED_KEYS
+    message = SimpleNamespace(content=json.dumps({key: "value" for key in keys}), context={"citations": []})
+    usage = SimpleNamespace(prompt_tokens=1, completion_tokens=1, total_tokens=2)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def test_default_tasks_run_against_the_backend(fake_azure, tmp_path):
+    from rag import RAGBackEnd
+
+    fake_azure.openai.chat = SimpleNamespace(completions=SimpleNamespace(create=json_chat))
+    backend = RAGBackEnd(f"user{uuid.uuid4().hex[:8]}")
+    document = tmp_path / "act.txt"
+    document.write_text("The Biotechnology Act proposes regional clusters.")
+    backend.document_index_pipeline([str(document)])
+
+    output = tmp_path / "rows.jsonl"
+    report = ExtractionRunner(backend).run(output)
+    assert len(report.completed) == len(BRUSSEL_TASKS) and not report.failed
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert {row["task"] for row in rows} == {task.name for task in BRUSSEL_TASKS}
+    # Resumed: everything is already done
+    assert ExtractionRunner(backend).run(output).skipped == len(BRUSSEL_TASKS)
+
+
+class ScriptedBackend:
+    """Returns (or raises) the scripted answers in order."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def query_rag(self, **kwargs):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+
+def throttled() -> Exception:
+    error = Exception("Too many requests")
+    error.status_code = 429
+    return error
+
+
+TASK = ExtractionTask("task", "{selected_file}", ("a",))
+
+
+def test_malformed_answers_and_throttling_are_retried():
+    backend = ScriptedBackend("not json", throttled(), '{"a": 1}')
+    result = ExtractionRunner(backend, [TASK], max_retries=2).extract("doc.pdf", TASK)
+    assert result.ok and result.attempts == 3
+
+
+def test_other_errors_are_not_retried():
+    backend = ScriptedBackend(KeyError("selected_file"), '{"a": 1}')
+    result = ExtractionRunner(backend, [TASK], max_retries=2).extract("doc.pdf", TASK)
+    assert not result.ok and result.attempts == 1 and backend.calls == 1
@@ -0,0 +1,190 @@
+import time
+import uuid
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+
+def new_collection(**kwargs):
+    from embeddings import UserDocumentCollection
+    return UserDocumentCollection(f"user{uuid.uuid4().hex[:8]}", warm_up=False, **kwargs)
+
+
+def conflict() -> HttpResponseError:
+    error = HttpResponseError(message="Another indexer invocation is currently in progress")
+    error.status_code = 409
+    return error
+
+
+def test_run_during_a_running_indexer_is_queued_after_it(fake_azure):
+    collection = new_collection()
+    collection.setup_user_index_pipeline()
+    service = fake_azure.search
+    service.indexer_runs[collection.indexer_name].status = "inProgress"
+    runs = []
+    run_indexer = service.run_indexer
+
+    def run_unless_running(name):
+        if service.indexer_runs[name].status == "inProgress":
+            raise conflict()
+        runs.append(name)
+        run_indexer(name)
+
+    service.run_indexer = run_unless_running
+    assert collection.run_user_indexer()
+    # More uploads while the indexer runs queue no further run
+    assert collection.run_user_indexer()
+    time.sleep(0.2)
+    assert runs == []
+
+    service.indexer_runs[collection.indexer_name].status = "success"
+    deadline = time.monotonic() + 5
+    while not runs and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    assert runs == [collection.indexer_name]
+
+
+def test_incremental_setup_logs_definition_errors(fake_azure, monkeypatch):
+    collection = new_collection()
+
+    def missing_setting():
+        raise ValueError("Missing configuration values: cognitive_api_key")
+
+    monkeypatch.setattr(collection, "build_skillset_definition", missing_setting)
+    # Logged, not raised; the other resources are still deployed
+    collection.setup_user_index_pipeline()
+    assert collection.index_name in fake_azure.search.indexes
+    assert collection.indexer_name in fake_azure.search.resources["indexer"]
+
+
+def indexed_chunk_ids(fake_azure, collection, title):
+    documents = fake_azure.search.documents[collection.index_name].values()
+    return sorted(d["chunk_id"] for d in documents if d["title"] == title)
+
+
+def test_pushing_an_indexed_file_replaces_the_indexer_chunks(fake_azure, tmp_path):
+    from ingestion import document_parent_id, page_chunk_id
+
+    collection = new_collection()
+    document = tmp_path / "contract.txt"
+    document.write_text("The supplier delivers within thirty days.")
+    other = tmp_path / "other.txt"
+    other.write_text("Unrelated document.")
+    collection.add_file_to_blob_container(str(document), document.read_bytes())
+    collection.add_file_to_blob_container(str(other), other.read_bytes())
+    collection.setup_user_index_pipeline()
+    assert len(indexed_chunk_ids(fake_azure, collection, "contract.txt")) == 1
+
+    collection.push_files_to_index([str(document)], extract_workers=0)
+    assert indexed_chunk_ids(fake_azure, collection, "contract.txt") == [
+        page_chunk_id(document_parent_id("contract.txt"), 0)
+    ]
+    assert len(indexed_chunk_ids(fake_azure, collection, "other.txt")) == 1
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+def test_vector_size_change_is_refused_before_the_skillset(fake_azure, incremental):
+    from azure_search_utils.vector_profiles import get_vector_profile
+    from embeddings import UserDocumentCollection
+
+    collection = new_collection()
+    collection.setup_user_index_pipeline()
+    skillset = fake_azure.search.resources["skillset"][collection.skillset_name]
+
+    compact = UserDocumentCollection(collection.user_name, warm_up=False,
+                                     vector_profile=get_vector_profile("compact-512"))
+    compact.setup_user_index_pipeline(incremental=incremental)
+    assert "1536-dimension" in compact.index_conflict
+    assert fake_azure.search.resources["skillset"][collection.skillset_name] is skillset
+    assert not compact.provisioning_state.is_current("index", compact.build_index_definition())
+
+    stats = compact.push_files_to_index([__file__], extract_workers=0)
+    assert stats.failed_files and not stats.pushed
+
+
+def test_shared_resources_are_deployed_once_for_all_users(fake_azure):
+    shared = f"shared{uuid.uuid4().hex[:8]}"
+    service = fake_azure.search
+    deployed = []
+    create_or_update_index = service.create_or_update_index
+
+    def record(index):
+        deployed.append(index.name)
+        return create_or_update_index(index)
+
+    service.create_or_update_index = record
+    # Two users of the same shared index
+    for _ in range(2):
+        new_collection(shared_index=shared).setup_user_index_pipeline()
+    assert deployed == [f"{shared}_index"]
+
+
+def server_error() -> HttpResponseError:
+    error = HttpResponseError(message="Internal server error")
+    error.status_code = 500
+    return error
+
+
+def deployments(fake_azure, monkeypatch):
+    service, pushed = fake_azure.search, []
+    for method in ("create_or_update_index", "create_or_update_data_source_connection",
+                   "create_or_update_skillset", "create_or_update_indexer"):
+        def record(definition, create=getattr(service, method)):
+            pushed.append(definition.name)
+            return create(definition)
+        monkeypatch.setattr(service, method, record)
+    return pushed
+
+
+def test_failed_run_of_a_deployed_indexer_redeploys_nothing(fake_azure, monkeypatch):
+    from azure_search_utils.provisioning_state import INDEXER
+    from throttling import RetryPolicy
+
+    collection = new_collection()
+    collection.setup_user_index_pipeline()
+    pushed = deployments(fake_azure, monkeypatch)
+    monkeypatch.setattr(collection.search_throttle, "retry", RetryPolicy(max_retries=0))
+
+    def unavailable(name):
+        raise server_error()
+
+    monkeypatch.setattr(fake_azure.search, "run_indexer", unavailable)
+    collection.setup_user_index_pipeline()
+    assert pushed == []
+    assert collection.provisioning_state.is_current(INDEXER, collection.build_indexer_definition())
+
+
+def test_indexer_deleted_elsewhere_is_redeployed(fake_azure, monkeypatch):
+    collection = new_collection()
+    collection.setup_user_index_pipeline()
+    del fake_azure.search.resources["indexer"][collection.indexer_name]
+    pushed = deployments(fake_azure, monkeypatch)
+
+    collection.setup_user_index_pipeline()
+    assert collection.indexer_name in pushed
+    assert collection.indexer_name in fake_azure.search.resources["indexer"]
+
+
+@pytest.mark.parametrize("profile, requested", [("full", None), ("compact-512", 512)])
+def test_skillset_and_push_ingestion_request_the_same_vector_size(fake_azure, monkeypatch, tmp_path,
+                                                                   profile, requested):
+    import embeddings
+    from azure_search_utils.vector_profiles import get_vector_profile
+
+    collection = new_collection(vector_profile=get_vector_profile(profile))
+    skill = collection.build_skillset_definition().skills[1]
+    assert skill.dimensions == requested
+
+    sizes = []
+    embed_texts = embeddings.embed_texts
+
+    def record(texts, dimensions=None, **kwargs):
+        sizes.append(dimensions)
+        return embed_texts(texts, dimensions=dimensions, **kwargs)
+
+    monkeypatch.setattr(embeddings, "embed_texts", record)
+    document = tmp_path / f"{uuid.uuid4().hex}.txt"
+    document.write_text(f"Vector size check {uuid.uuid4().hex}")
+    collection.push_files_to_index([str(document)], extract_workers=0)
+    assert sizes and set(sizes) == {requested}
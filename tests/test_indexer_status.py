@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from azure_search_utils.indexer_status import AggregateIndexerProgress, IndexerProgress, PollBackoff
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def progress(status: str, started: timedelta, ended=None, items: int = 0) -> IndexerProgress:
+    return IndexerProgress("indexer", status, item_count=items, start_time=NOW + started,
+                           end_time=NOW + ended if ended is not None else None)
+
+
+def test_only_runs_started_after_the_request_count():
+    # Started before the request (it may have missed the new blobs), even though it ended after
+    assert not progress("success", timedelta(seconds=-60), timedelta(seconds=30)).finished_since(NOW)
+    assert progress("success", timedelta(seconds=1), timedelta(seconds=30)).finished_since(NOW)
+    assert not progress("inProgress", timedelta(seconds=1)).finished_since(NOW)
+    assert progress("success", timedelta(seconds=-60), timedelta(seconds=-30)).finished_since(None)
+
+
+def test_service_clock_behind_the_local_clock_is_tolerated():
+    assert progress("success", timedelta(seconds=-2), timedelta(seconds=10)).finished_since(NOW)
+
+
+def test_from_status_of_a_never_run_indexer():
+    never_run = IndexerProgress.from_status("indexer", SimpleNamespace(last_result=None))
+    assert never_run.running and not never_run.finished_since(None)
+
+
+def test_aggregate_waits_for_every_shard():
+    shards = AggregateIndexerProgress([
+        progress("success", timedelta(seconds=1), timedelta(seconds=20), items=3),
+        progress("inProgress", timedelta(seconds=1), items=2),
+    ])
+    assert not shards.done and not shards.finished_since(NOW)
+    assert shards.item_count == 5
+
+
+def test_poll_backoff_grows_while_nothing_moves():
+    backoff = PollBackoff(interval=1.0, max_interval=4.0, factor=2.0)
+    idle = AggregateIndexerProgress([progress("inProgress", timedelta(0), items=1)])
+    assert [backoff.next(idle) for _ in range(4)] == [1.0, 2.0, 4.0, 4.0]
+    moving = AggregateIndexerProgress([progress("inProgress", timedelta(0), items=2)])
+    assert backoff.next(moving) == 1.0
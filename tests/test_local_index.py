@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from local_index import LocalVectorIndex, parse_title_filter
+from odata_filter import and_filters, title_filter
+
+
+def build_index() -> LocalVectorIndex:
+    index = LocalVectorIndex(dimensions=4)
+    index.upload_documents([
+        {"chunk_id": f"c{i}", "title": title, "chunk": f"chunk {i}", "parent_id": title,
+         "text_vector": np.eye(4)[i % 4] + 0.1}
+        for i, title in enumerate(["a.pdf", "a.pdf", "b.pdf", "c.pdf"])
+    ])
+    return index
+
+
+def test_parse_title_filter():
+    assert parse_title_filter(None) is None
+    assert parse_title_filter("title eq 'a.pdf' or title eq 'it''s.pdf'") == {"a.pdf", "it's.pdf"}
+    assert parse_title_filter("search.in(title, 'a.pdf|b.pdf', '|')") == {"a.pdf", "b.pdf"}
+    with pytest.raises(ValueError):
+        parse_title_filter("chunk eq 'x'")
+
+
+def test_owner_conjunct_is_ignored():
+    owner = "owner eq 'o''brien'"
+    assert parse_title_filter(owner) is None
+    assert parse_title_filter(and_filters(owner, "title eq 'a.pdf'")) == {"a.pdf"}
+    assert parse_title_filter(and_filters("title eq 'a.pdf'", owner)) == {"a.pdf"}
+    assert parse_title_filter(and_filters(owner, title_filter(["a.pdf", "b.pdf"]))) == {"a.pdf", "b.pdf"}
+
+
+def test_search_with_a_filter():
+    index = build_index()
+    hits = index.search(np.eye(4)[2], top=3, document_filter="owner eq 'me' and title eq 'b.pdf'")
+    assert [hit.chunk_id for hit in hits] == ["c2"]
+
+
+def test_search_with_zero_top():
+    index = build_index()
+    assert index.search(np.eye(4)[0], top=0) == []
+    assert index._search_exact(np.eye(4)[:2].astype(np.float32), 0, None) == [[], []]
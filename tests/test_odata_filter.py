@@ -0,0 +1,55 @@
+from local_index import parse_title_filter
+from odata_filter import SEARCH_IN_DELIMITERS, SEARCH_IN_MIN_VALUES, and_filters, choose_delimiter, title_filter
+
+
+def test_small_selections_compile_to_eq_clauses():
+    assert title_filter(None) is None
+    assert title_filter([]) is None
+    assert title_filter("a.pdf") == "title eq 'a.pdf'"
+    assert title_filter(["b.pdf", "it's.pdf"]) == "(title eq 'b.pdf' or title eq 'it''s.pdf')"
+
+
+def test_large_selections_compile_to_one_search_in():
+    files = [f"report {i}.pdf" for i in range(SEARCH_IN_MIN_VALUES)]
+    assert title_filter(files) == f"search.in(title, '{'|'.join(sorted(files))}', '|')"
+
+
+def test_selection_order_and_duplicates_do_not_change_the_filter():
+    files = ["c.pdf", "a.pdf", "b.pdf", "d.pdf"]
+    assert title_filter(files) == title_filter(list(reversed(files)) + ["a.pdf", ""])
+
+
+def test_delimiter_skips_characters_used_in_the_titles():
+    files = ["a|1.pdf", "b,2.pdf", "c.pdf", "d.pdf"]
+    assert choose_delimiter(files) == ";"
+    compiled = title_filter(files)
+    assert compiled.endswith(", ';')")
+    assert parse_title_filter(compiled) == set(files)
+
+
+def test_falls_back_to_eq_clauses_when_every_delimiter_is_used():
+    files = [f"{delimiter}.pdf" for delimiter in SEARCH_IN_DELIMITERS] + ["plain.pdf"]
+    assert choose_delimiter(files) is None
+    compiled = title_filter(files)
+    assert "search.in" not in compiled
+    assert compiled.count(" or ") == len(files) - 1
+    assert parse_title_filter(compiled) == set(files)
+
+
+def test_quotes_are_escaped_inside_search_in():
+    files = ["o'brien.pdf", "a.pdf", "b.pdf", "c.pdf"]
+    compiled = title_filter(files)
+    assert "o''brien.pdf" in compiled
+    assert parse_title_filter(compiled) == set(files)
+
+
+def test_and_filters_skips_empty_clauses():
+    assert and_filters(None, "") is None
+    assert and_filters("owner eq 'me'", None, "title eq 'a.pdf'") == "owner eq 'me' and title eq 'a.pdf'"
+
+
+def test_title_is_filterable():
+    from azure_search_utils.azure_search_index import build_azure_search_index
+
+    index = build_azure_search_index("user_index", "https://fake.openai.azure.com", "fake-key", "fake-embedding")
+    assert next(field for field in index.fields if field.name == "title").filterable
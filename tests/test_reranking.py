@@ -0,0 +1,70 @@
+import numpy as np
+
+from reranking import RerankSettings, bm25_scores, rerank_chunks
+from retrieval import RetrievedChunk
+from token_utils import count_tokens
+
+
+def chunk(chunk_id: str, text: str, parent: str, score: float = 1.0, vector=None) -> RetrievedChunk:
+    return RetrievedChunk(chunk_id=chunk_id, title=f"{parent}.pdf", chunk=text, parent_id=parent,
+                          score=score, vector=vector)
+
+
+def test_bm25_prefers_chunks_with_the_question_terms():
+    scores = bm25_scores("delivery deadline", [
+        "the delivery deadline is thirty days",
+        "payment happens after acceptance",
+        "delivery happens by truck",
+    ])
+    assert scores[0] > scores[2] > scores[1] == 0
+
+
+def test_bm25_without_terms_or_texts():
+    assert bm25_scores("", ["text"]).tolist() == [0.0]
+    assert len(bm25_scores("question", [])) == 0
+
+
+def test_rerank_keeps_at_most_top_k_best_first():
+    chunks = [chunk(f"c{i}", f"clause {i} about payment terms", f"doc{i}", score=float(i)) for i in range(6)]
+    kept, report = rerank_chunks("payment", chunks, top_k=3, max_tokens=10_000,
+                                 settings=RerankSettings(bm25_weight=0.0, mmr_lambda=1.0))
+    assert [c.chunk_id for c in kept] == ["c5", "c4", "c3"]
+    assert report.input_chunks == 6 and report.kept_chunks == 3
+
+
+def test_rerank_drops_near_duplicates_of_the_same_parent_only():
+    vector = np.ones(4)
+    chunks = [
+        chunk("a0", "delivery within thirty days", "a", 3.0, vector),
+        chunk("a1", "delivery within thirty days again", "a", 2.0, vector),
+        chunk("b0", "delivery within thirty days elsewhere", "b", 1.0, vector),
+    ]
+    kept, report = rerank_chunks("delivery", chunks, top_k=3, max_tokens=10_000)
+    assert [c.chunk_id for c in kept] == ["a0", "b0"]
+    assert report.duplicates == 1
+
+
+def test_rerank_respects_the_token_budget():
+    long_text = "payment " * 200
+    chunks = [
+        chunk("long", long_text, "a", 3.0),
+        chunk("long2", long_text + "again", "b", 2.0),
+        chunk("short", "payment terms", "c", 1.0),
+    ]
+    budget = count_tokens(long_text) + count_tokens("payment terms")
+    kept, report = rerank_chunks("payment", chunks, top_k=3, max_tokens=budget,
+                                 settings=RerankSettings(bm25_weight=0.0, mmr_lambda=1.0))
+    # The second long chunk does not fit in what is left; the short one does
+    assert [c.chunk_id for c in kept] == ["long", "short"]
+    assert report.kept_tokens <= budget
+
+
+def test_rerank_always_keeps_the_best_chunk():
+    kept, report = rerank_chunks("payment", [chunk("huge", "payment " * 500, "a")], top_k=3, max_tokens=10)
+    assert [c.chunk_id for c in kept] == ["huge"]
+    assert report.kept_tokens == 10
+
+
+def test_rerank_of_nothing():
+    kept, report = rerank_chunks("payment", [], top_k=3, max_tokens=100)
+    assert kept == [] and report.kept_chunks == 0
@@ -0,0 +1,68 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from azure_search_utils.resource_sweeper import ORPHANED, STALE, ResourceSweeper
+
+
+def add_user(fake_azure, user: str, index: bool = True, last_run: datetime = None):
+    search = fake_azure.search
+    if index:
+        search.indexes[f"{user}_index"] = SimpleNamespace(name=f"{user}_index")
+    for kind, name in (("data_source", f"{user}-ds"), ("skillset", f"{user}-ss"), ("indexer", f"{user}-indexer")):
+        search.resources[kind][name] = SimpleNamespace(name=name)
+    if last_run is not None:
+        search.indexer_runs[f"{user}-indexer"] = SimpleNamespace(start_time=last_run, end_time=last_run)
+    fake_azure.blob.containers[user] = {}
+
+
+def sweeper(fake_azure, **kwargs) -> ResourceSweeper:
+    return ResourceSweeper(fake_azure.search, fake_azure.search, fake_azure.blob,
+                           requests_per_second=0, **kwargs)
+
+
+def remaining(fake_azure, user: str):
+    search = fake_azure.search
+    names = [n for n in search.indexes if n.startswith(user)]
+    names += [n for resources in search.resources.values() for n in resources if n.startswith(user)]
+    return names + [n for n in fake_azure.blob.containers if n == user]
+
+
+def test_orphaned_and_stale_users_are_swept(fake_azure):
+    now = datetime.now(timezone.utc)
+    add_user(fake_azure, "orphan", index=False)
+    add_user(fake_azure, "idle", last_run=now - timedelta(days=30))
+    add_user(fake_azure, "active", last_run=now - timedelta(hours=1))
+    add_user(fake_azure, "pushonly")
+    swept = []
+
+    report = sweeper(fake_azure, on_swept=swept.append).sweep(dry_run=False)
+
+    assert {(c.user, c.reason) for c in report.candidates} == {("orphan", ORPHANED), ("idle", STALE)}
+    assert remaining(fake_azure, "orphan") == [] and remaining(fake_azure, "idle") == []
+    assert len(remaining(fake_azure, "active")) == 5 and len(remaining(fake_azure, "pushonly")) == 5
+    assert sorted(swept) == ["idle", "orphan"]
+    assert not report.failed
+
+
+def test_dry_run_and_kept_users_delete_nothing(fake_azure):
+    add_user(fake_azure, "orphan", index=False)
+    add_user(fake_azure, "kept", index=False)
+
+    report = sweeper(fake_azure, keep=["kept"]).sweep(dry_run=True)
+
+    assert [c.user for c in report.candidates] == ["orphan"]
+    assert report.deleted == []
+    assert len(remaining(fake_azure, "orphan")) == 4 and len(remaining(fake_azure, "kept")) == 4
+
+
+def test_command_line_reports_through_the_log_only(fake_azure, monkeypatch, capsys):
+    from azure_search_utils import resource_sweeper
+
+    add_user(fake_azure, "orphan", index=False)
+    monkeypatch.setattr(sys, "argv", ["resource_sweeper", "--delete", "--requests-per-second", "0"])
+
+    resource_sweeper.main()
+
+    assert remaining(fake_azure, "orphan") == []
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,74 @@
+import os
+from functools import lru_cache
+from typing import List, Optional
+
+from settings import load_environment
+from telemetry import span, telemetry
+from throttling import SDK_MAX_RETRIES, openai_throttle
+from token_utils import count_tokens
+
+
+load_environment()
+EMBEDDING_DEPLOYMENT = os.environ.get("EMBEDDING_DEPLOYMENT")
+
+
+@lru_cache(maxsize=None)
+def get_embedding_client():
+    # Same Azure OpenAI resource the skillset and the index vectorizer embed with
+    from openai import AzureOpenAI
+    return AzureOpenAI(
+        azure_endpoint=os.environ["AZURE_MULTI_OPENAI_ENDPOINT"],
+        api_key=os.environ["AZURE_COGNITIVE_API"],
+        api_version="2024-10-21",
+        # Retries happen in the throttling layer
+        max_retries=SDK_MAX_RETRIES,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_embedding_client():
+    from openai import AsyncAzureOpenAI
+    return AsyncAzureOpenAI(
+        azure_endpoint=os.environ["AZURE_MULTI_OPENAI_ENDPOINT"],
+        api_key=os.environ["AZURE_COGNITIVE_API"],
+        api_version="2024-10-21",
+        max_retries=SDK_MAX_RETRIES,
+    )
+
+
+def _embedding_request(texts: List[str], dimensions: Optional[int]) -> dict:
+    request = dict(model=EMBEDDING_DEPLOYMENT, input=texts)
+    if dimensions:
+        request["dimensions"] = dimensions
+    return request
+
+
+def _estimated_tokens(throttle, texts: List[str]) -> int:
+    return sum(count_tokens(text) for text in texts) if throttle.limits_tokens else 0
+
+
+def embed_texts(texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+    """Embed a batch of texts in one request; vectors come back in input order."""
+    if not texts:
+        return []
+    throttle = openai_throttle(EMBEDDING_DEPLOYMENT)
+    tokens = _estimated_tokens(throttle, texts)
+    with span("ingest.embed", texts=len(texts)):
+        response = throttle.call(get_embedding_client().embeddings.create, **_embedding_request(texts, dimensions),
+                                 tokens=tokens)
+    throttle.settle(tokens, getattr(response, "usage", None))
+    telemetry.record_usage(getattr(response, "usage", None), "embeddings")
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+async def aembed_texts(texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+    if not texts:
+        return []
+    throttle = openai_throttle(EMBEDDING_DEPLOYMENT)
+    tokens = _estimated_tokens(throttle, texts)
+    with span("ingest.embed", texts=len(texts)):
+        response = await throttle.acall(get_async_embedding_client().embeddings.create,
+                                        **_embedding_request(texts, dimensions), tokens=tokens)
+    throttle.settle(tokens, getattr(response, "usage", None))
+    telemetry.record_usage(getattr(response, "usage", None), "embeddings")
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
@@ -0,0 +1,339 @@
+import asyncio
+import email.utils
+import functools
+import inspect
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from loguru import logger
+
+from telemetry import telemetry
+
+
+# "0" turns the layer off: calls go straight to the SDKs, which then do their own retries
+THROTTLING = os.environ.get("RAG_THROTTLING", "1").lower() not in ("0", "false", "off", "no")
+# Quota of each Azure OpenAI deployment (tokens and requests per minute); 0 leaves it unlimited
+OPENAI_TOKENS_PER_MINUTE = int(os.environ.get("RAG_OPENAI_TPM", "0"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.environ.get("RAG_OPENAI_RPM", "0"))
+# Requests per minute sent to the Search service; 0 leaves it to the adaptive concurrency alone
+SEARCH_REQUESTS_PER_MINUTE = int(os.environ.get("RAG_SEARCH_RPM", "0"))
+# Upper bound of the adaptive concurrency limit of each deployment / service
+MAX_CONCURRENCY = int(os.environ.get("RAG_MAX_CONCURRENCY", "32"))
+
+# Retries of the OpenAI SDK itself; they would hide the 429s from the adaptive limits
+SDK_MAX_RETRIES = 0 if THROTTLING else 2
+
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+THROTTLE_STATUSES = {429, 503}
+TRANSIENT_STATUSES = {408, 500, 502, 504}
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 6
+    # Exponential backoff with full jitter: uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # What the service asked for, plus a little jitter so waiting callers do not return in lockstep
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1 + 0.05))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def _status(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """THROTTLED (429/503), TRANSIENT (timeouts, 5xx, dropped connections) or None (not worth a retry)."""
+    status = _status(error)
+    if status in THROTTLE_STATUSES:
+        return THROTTLED
+    if status in TRANSIENT_STATUSES:
+        return TRANSIENT
+    if status is None:
+        # openai.APIConnectionError (and its APITimeoutError), matched by name to keep openai a lazy import
+        if isinstance(error, (ServiceRequestError, ServiceResponseError)) or \
+                any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__):
+            return TRANSIENT
+    return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds to wait from the Retry-After family of headers of a failed response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    for key, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(key)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            moment = email.utils.parsedate_to_datetime(value) if key == "retry-after" else None
+            if moment is not None:
+                return max(0.0, moment.timestamp() - time.time())
+    return None
+
+
+class TokenBucket:
+    """
+    `per_minute` units per minute, with bursts of up to `burst_seconds` worth (Azure OpenAI
+    enforces its per-minute quotas over short windows). Callers reserve their units up
+    front and sleep off the debt, so waiting callers are served in order.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units; returns the seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._level -= min(amount, self.capacity)
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+    def adjust(self, amount: float):
+        """Charge (or, when negative, refund) units after the fact, e.g. actual vs. estimated tokens."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the calls in flight: +1 after every `limit` successful calls, halved on
+    throttling (at most once per `cooldown`, as one overload answers many calls with 429s).
+    The limit starts at `maximum` and only comes down once the service pushes back.
+    Usable from threads and event loops at the same time.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease: float = 0.5, cooldown: float = 1.0):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, outcome: Optional[str] = None):
+        with self._condition:
+            self.in_flight -= 1
+            if outcome is None:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif outcome == THROTTLED and time.monotonic() - self._last_decrease > self.cooldown:
+                # From what was actually in flight when the service pushed back, not from a limit never reached
+                self.limit = max(self.minimum, min(self.limit, self.in_flight + 1) * self.decrease)
+                self._last_decrease = time.monotonic()
+            # Every waiter re-checks the limit; cancelled ones are skipped
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+            except RuntimeError:
+                # Its event loop is closed
+                pass
+
+
+class ServiceThrottle:
+    """Rate limits, adaptive concurrency and retries shared by every call to one deployment or service."""
+
+    def __init__(self, name: str, tokens_per_minute: int = 0, requests_per_minute: int = 0,
+                 max_concurrency: int = MAX_CONCURRENCY, retry: Optional[RetryPolicy] = None,
+                 enabled: bool = THROTTLING):
+        self.name = name
+        self.enabled = enabled
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.retry = retry or RetryPolicy()
+        # A Retry-After applies to the whole deployment: nobody calls it before this moment
+        self._paused_until = 0.0
+        self.calls = 0
+        self.retries = 0
+
+    @property
+    def limits_tokens(self) -> bool:
+        return self.enabled and self.tokens is not None
+
+    def _admission_delay(self, tokens: int) -> float:
+        delay = max(0.0, self._paused_until - time.monotonic())
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def _retry_delay(self, error: Exception, attempt: int, tokens: int) -> Optional[float]:
+        """Seconds before the next attempt, or None when the error must propagate."""
+        kind = classify_error(error)
+        if kind is None or attempt >= self.retry.max_retries:
+            return None
+        hint = retry_after(error)
+        delay = self.retry.delay(attempt, hint)
+        if kind == THROTTLED:
+            if hint is not None:
+                self._paused_until = max(self._paused_until, time.monotonic() + hint)
+            if self.tokens is not None and tokens:
+                # Rejected calls are not charged against the quota
+                self.tokens.adjust(-tokens)
+        self.retries += 1
+        if telemetry.metrics_enabled:
+            telemetry.metrics.inc("rag_retries_total", service=self.name, reason=kind)
+        logger.warning(f"⚠️ {self.name}: {kind} (HTTP {_status(error)}), retry {attempt + 1}/"
+                       f"{self.retry.max_retries} in {delay:.2f}s (concurrency limit {int(self.concurrency.limit)}).")
+        return delay
+
+    def call(self, fn, *args, tokens: int = 0, **kwargs):
+        """Call `fn` within the limits, retrying throttled and transient failures. `tokens`: estimated cost."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        for attempt in itertools.count():
+            delay = self._admission_delay(tokens)
+            if delay > 0:
+                time.sleep(delay)
+            self.concurrency.acquire()
+            self.calls += 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.concurrency.release(classify_error(e))
+                delay = self._retry_delay(e, attempt, tokens)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.concurrency.release()
+            return result
+
+    async def acall(self, fn, *args, tokens: int = 0, **kwargs):
+        """Async `call`: `fn` returns an awaitable; waits never block the event loop."""
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        for attempt in itertools.count():
+            delay = self._admission_delay(tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.concurrency.aacquire()
+            self.calls += 1
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                self.concurrency.release(classify_error(e))
+                delay = self._retry_delay(e, attempt, tokens)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.concurrency.release()
+            return result
+
+    def settle(self, estimated_tokens: int, usage):
+        """Correct the token bucket with the actual `usage` of a response once it is known."""
+        actual = getattr(usage, "total_tokens", None)
+        if self.limits_tokens and actual is not None:
+            self.tokens.adjust(actual - estimated_tokens)
+
+
+class ThrottledClient:
+    """Routes every method call of an SDK client, sync or async, through a `ServiceThrottle`."""
+
+    def __init__(self, client, throttle: ServiceThrottle):
+        self._client = client
+        self._throttle = throttle
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+        if inspect.iscoroutinefunction(attribute):
+            @functools.wraps(attribute)
+            async def async_method(*args, **kwargs):
+                return await self._throttle.acall(attribute, *args, **kwargs)
+            return async_method
+
+        @functools.wraps(attribute)
+        def method(*args, **kwargs):
+            return self._throttle.call(attribute, *args, **kwargs)
+        return method
+
+
+_throttles: Dict[str, ServiceThrottle] = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(name: str, **limits) -> ServiceThrottle:
+    """The process-wide throttle called `name`; `limits` only apply when it is first created."""
+    with _throttles_lock:
+        throttle = _throttles.get(name)
+        if throttle is None:
+            throttle = _throttles[name] = ServiceThrottle(name, **limits)
+        return throttle
+
+
+def openai_throttle(deployment: Optional[str]) -> ServiceThrottle:
+    return get_throttle(f"openai:{deployment}", tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+                        requests_per_minute=OPENAI_REQUESTS_PER_MINUTE)
+
+
+def search_throttle(endpoint: Optional[str]) -> ServiceThrottle:
+    return get_throttle(f"search:{endpoint}", requests_per_minute=SEARCH_REQUESTS_PER_MINUTE)
+
+
+def blob_throttle(connection_string: Optional[str]) -> ServiceThrottle:
+    # Named after the account only: the connection string holds the key
+    match = re.search(r"AccountName=([^;]+)", connection_string or "")
+    return get_throttle(f"blob:{match.group(1) if match else 'storage'}")
+
+
+def reset_throttles():
+    with _throttles_lock:
+        _throttles.clear()
@@ -0,0 +1,35 @@
+from functools import lru_cache
+
+
+# gpt-4.1 / gpt-4o family tokenizer
+DEFAULT_ENCODING = "o200k_base"
+# Rough characters-per-token ratio used when tiktoken (or its vocabulary files) is unavailable
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])